@@ -0,0 +1,105 @@
+"""
+Append-only checkpoint of the fitting results
+
+The results for the stars fit since the previous checkpoint are written
+to a new chunk file, and a line giving the chunk file and the range of
+stars it contains is then appended to a journal.  A chunk is only listed
+in the journal once it is completely written, so a run that dies at any
+point can be resumed from the stars listed in the journal.
+
+The amount written at each checkpoint is proportional to the number of
+stars fit since the previous one, instead of rewriting all the outputs.
+"""
+import os
+import shutil
+
+import numpy as np
+
+__all__ = ["FitCheckpoint"]
+
+
+class FitCheckpoint(object):
+    """ Directory with the chunk files and the journal of a fitting run """
+
+    def __init__(self, dirname):
+        """
+        Parameters
+        ----------
+        dirname : str
+            directory for the checkpoint files
+        """
+        self.dirname = dirname
+        self.journal_name = os.path.join(dirname, "journal.txt")
+
+    def exists(self):
+        """ True if there is a journal to resume from """
+        return os.path.isfile(self.journal_name)
+
+    def _read_journal(self):
+        """ list of (chunk filename, start, end) in the journal """
+        entries = []
+        with open(self.journal_name, "r") as journal:
+            for line in journal:
+                words = line.split()
+                # an incomplete last line is ignored
+                if len(words) == 3 and line.endswith("\n"):
+                    entries.append((words[0], int(words[1]), int(words[2])))
+        return entries
+
+    def start(self):
+        """ Start a new checkpoint, removing any previous one """
+        self.remove()
+        os.makedirs(self.dirname)
+        open(self.journal_name, "w").close()
+
+    def append(self, start, end, arrays):
+        """
+        Checkpoint the results for a range of stars
+
+        Parameters
+        ----------
+        start, end : int
+            range of stars (end excluded)
+        arrays : dict
+            arrays with one row per star for the stars in the range
+        """
+        chunk_name = "chunk_{0:d}_{1:d}.npz".format(start, end)
+        tmp_name = os.path.join(self.dirname, "tmp_" + chunk_name)
+        with open(tmp_name, "wb") as chunk_file:
+            np.savez(chunk_file, **arrays)
+            chunk_file.flush()
+            os.fsync(chunk_file.fileno())
+        os.replace(tmp_name, os.path.join(self.dirname, chunk_name))
+
+        with open(self.journal_name, "a") as journal:
+            journal.write("{0:s} {1:d} {2:d}\n".format(chunk_name, start, end))
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def restore(self, arrays):
+        """
+        Fill arrays with the checkpointed results
+
+        Parameters
+        ----------
+        arrays : dict
+            arrays with one row per star, filled in place for the stars in
+            the checkpoint
+
+        Returns
+        -------
+        end : int
+            index of the first star not in the checkpoint
+        """
+        end = 0
+        for chunk_name, cstart, cend in self._read_journal():
+            with np.load(os.path.join(self.dirname, chunk_name)) as chunk:
+                for name, arr in arrays.items():
+                    arr[cstart:cend] = chunk[name]
+            end = max(end, cend)
+        return end
+
+    def remove(self):
+        """ Remove the checkpoint files """
+        if os.path.isdir(self.dirname):
+            shutil.rmtree(self.dirname)
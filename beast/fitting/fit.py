@@ -1,11 +1,13 @@
 """
 BEAST Fitting functions
 """
+import os
 import numpy as np
 import math
 import tables
 import string
 from itertools import islice
+import multiprocessing
 
 import numexpr
 
@@ -17,15 +19,25 @@ from astropy.table import Table
 from tqdm import tqdm
 
 from beast.physicsmodel import grid
+from beast.observationmodel.noisemodel.compact import CompactNoiseModel
+from beast.tools.helpers import chunks
 
-from beast.fitting.fit_metrics.likelihood import (
-    N_covar_logLikelihood,
-    N_logLikelihood_NM,
-)
-from beast.fitting.fit_metrics import expectation, percentile
+from beast.fitting.fit_metrics.likelihood import PreparedLikelihood
+from beast.fitting.fit_metrics import percentile_block
 
 from beast.fitting.pdf1d import pdf1d
 from beast.fitting.pdf2d import pdf2d
+from beast.fitting.marginals import MarginalProjection, concatenate_projections
+from beast.fitting.modelchunks import ModelChunks
+from beast.fitting.modelindex import ModelFluxIndex
+from beast.fitting.sharedarrays import share, attach, release
+from beast.fitting.checkpoint import FitCheckpoint
+from beast.fitting.lnp_file import (
+    is_ragged_lnp,
+    create_lnp_file,
+    append_lnp,
+    lnp_columns,
+)
 
 __all__ = [
     "summary_table_memory",
@@ -171,16 +183,25 @@ def save_pdf2d(pdf2d_outname, save_pdf2d_vals, qname_pairs):
         fits.append(pdf2d_outname, save_pdf2d_vals[k], header=pheader)
 
 
-def save_lnp(lnp_outname, save_lnp_vals):
+def save_lnp(lnp_outname, save_lnp_vals, grid_offsets=None):
     """
     Save the nD lnps to a file
 
+    The stars are appended to the file, using the columnar layout of
+    beast.fitting.lnp_file for new files or the legacy per star groups
+    for files created by older versions.
+
     Parameters
     ----------
     lnp_outname : str
         output filename
     save_lnp_vals : list
         list of 5 parameter lists giving the lnp/chisqr info for each star
+    grid_offsets : array-like, optional
+        offsets of the subgrids in the model indices (e.g.,
+        ModelChunks.offsets), set to save the index of the model in its
+        subgrid and the subgrid number as for merged subgrid lnp files
+        (see beast.tools.subgridding_tools.merge_lnp)
 
     Returns
     -------
@@ -204,6 +225,32 @@ def save_lnp(lnp_outname, save_lnp_vals):
             string.replace(lnp_outname, "lnp", "lnp_partial"), "a"
         )
 
+    # columnar layout: the stars are appended in bulk
+    if is_ragged_lnp(outfile):
+        filename = outfile.filename
+        outfile.close()
+        if len(save_lnp_vals) > 0:
+            sizes = [len(lnp_val[1]) for lnp_val in save_lnp_vals]
+            idx = np.concatenate([lnp_val[1] for lnp_val in save_lnp_vals])
+            lnp_data = {
+                "star_indx": [lnp_val[0] for lnp_val in save_lnp_vals],
+                "offsets": np.concatenate([[0], np.cumsum(sizes)]),
+                "lnp": np.concatenate([lnp_val[2] for lnp_val in save_lnp_vals]),
+                "chi2": np.concatenate([lnp_val[3] for lnp_val in save_lnp_vals]),
+                "input": np.array(
+                    [np.ravel(lnp_val[4]) for lnp_val in save_lnp_vals]
+                ),
+            }
+            if grid_offsets is not None:
+                # model indices in the subgrids
+                subgrid = np.searchsorted(grid_offsets, idx, side="right") - 1
+                idx = idx - np.asarray(grid_offsets)[subgrid]
+                lnp_data["subgrid"] = subgrid
+            lnp_data["idx"] = idx
+            append_lnp(filename, lnp_data)
+        return
+
+    # legacy layout (resumed runs started with older versions)
     for lnp_val in save_lnp_vals:
         e = lnp_val[0]
         try:
@@ -219,6 +266,39 @@ def save_lnp(lnp_outname, save_lnp_vals):
     outfile.close()
 
 
+def grid_num_unique(g0, qname, qname_vals, max_count):
+    """
+    Number of unique values of a grid property, from the statistics stored
+    with the grid file if possible
+
+    Parameters
+    ----------
+    g0 : FileSEDGrid object
+        the SED grid
+    qname : str
+        name of the property
+    qname_vals : ndarray
+        values of the property for all the models
+    max_count : int
+        counts above this value are not needed exactly
+
+    Returns
+    -------
+    n_uniq : int
+        number of unique values (at least max_count if there are more)
+    """
+    qstats = getattr(g0, "grid_stats", {}).get(qname, None)
+    if (
+        (qstats is not None)
+        and ("_bias" not in qname)
+        and (qstats["nrows"] == len(qname_vals))
+        and ((not qstats["capped"]) or (qstats["num_unique"] >= max_count))
+    ):
+        return qstats["num_unique"]
+    else:
+        return len(np.unique(qname_vals))
+
+
 def setup_param_bins(qname, max_nbins, g0, full_model_flux, filters, grid_info_dict):
     """
     Set up the bin properties for the given parameter
@@ -263,7 +343,7 @@ def setup_param_bins(qname, max_nbins, g0, full_model_flux, filters, grid_info_d
         # compatible
         n_uniq = grid_info_dict[qname]["num_unique"]
     else:
-        n_uniq = len(np.unique(qname_vals))
+        n_uniq = grid_num_unique(g0, qname, qname_vals, max_nbins)
 
     if n_uniq > max_nbins:
         # limit the number of bins in the 1D likelihood for speed
@@ -294,6 +374,505 @@ def setup_param_bins(qname, max_nbins, g0, full_model_flux, filters, grid_info_d
     return qname_vals, nbins, logspacing, minval, maxval
 
 
+def nstars_per_block(block_memory, n_models, n_arrays=4):
+    """
+    Number of stars to fit at once given a memory budget
+
+    Parameters
+    ----------
+    block_memory : float or None
+        memory budget in bytes for the (nstars, n_models) arrays of a block
+        None gives the star by star fitting (1 star per block)
+    n_models : int
+        number of models in the grid
+    n_arrays : int
+        number of float64 (nstars, n_models) arrays alive at the same time
+        (lnp, chi2 and the temporaries of the matrix products)
+
+    Returns
+    -------
+    nstars : int
+        number of stars per block (at least 1)
+    """
+    if block_memory is None:
+        return 1
+
+    return max(1, int(block_memory // (n_arrays * 8 * max(n_models, 1))))
+
+
+def setup_models(
+    g0,
+    seds,
+    obsmodel,
+    qnames,
+    filters,
+    max_nbins,
+    grid_info_dict,
+    pdf2d_qname_pairs,
+    full_cov_mat,
+    lnweight_sum=None,
+):
+    """
+    Set up the star independent part of the fitting for a set of models
+
+    Parameters
+    ----------
+    g0 : grid.SEDgrid instance or structured ndarray
+        properties of the models
+    seds : ndarray
+        model fluxes (nmodels, nfilters)
+    obsmodel : dict
+        noise model of the models (error, bias and, with full_cov_mat,
+        q_norm, icov_diag, icov_offdiag)
+    qnames : list of str
+        names of the quantities, including the full model fluxes
+    filters : list of str
+        names of the filters in the SED grid
+    max_nbins : int
+        max number of bins to use for the PDF calculations
+    grid_info_dict : dict
+        the override for bin min/max/n_bin
+    pdf2d_qname_pairs : list of str
+        pairs of quantities for the 2D PDFs ('qname_1+qname_2')
+    full_cov_mat : bool
+        use the full covariance matrices of the noise model
+    lnweight_sum : float, optional
+        log of the sum of the prior weights used to normalize them
+        (default is to not normalize them)
+
+    Returns
+    -------
+    models : dict
+        likelihood : PreparedLikelihood for the models with positive weights
+        g0_indxs : indexes of the models with positive weights
+        qname_gridvals : values of the quantities for all the models
+        pdf1d_objs, pdf2d_objs : pdf1d and pdf2d objects
+        marginals : MarginalProjection for all the models
+    """
+    # remove weights that are less than zero
+    (g0_indxs,) = np.where(g0["weight"] > 0.0)
+
+    g0_weights = np.log(g0["weight"][g0_indxs])
+    if lnweight_sum is not None:
+        g0_weights = numexpr.evaluate("g0_weights - lnweight_sum")
+
+    # create the full model fluxes for later use
+    #   save as symmetric log, since the fluxes can be negative
+    model_seds_with_bias = np.asfortranarray(seds + obsmodel["bias"])
+
+    # star independent part of the likelihood, only for the models with
+    #   non-zero weights and including the prior weights
+    if len(g0_indxs) == len(model_seds_with_bias):
+        model_indxs = None
+    else:
+        model_indxs = g0_indxs
+    if full_cov_mat:
+        likelihood = PreparedLikelihood(
+            model_seds_with_bias,
+            q_norm=obsmodel["q_norm"],
+            icov_diag=obsmodel["icov_diag"],
+            icov_offdiag=obsmodel["icov_offdiag"],
+            lnprior=g0_weights,
+            model_indxs=model_indxs,
+        )
+    else:
+        likelihood = PreparedLikelihood(
+            model_seds_with_bias,
+            ivar=1.0 / np.asfortranarray(obsmodel["error"]) ** 2,
+            lnprior=g0_weights,
+            model_indxs=model_indxs,
+        )
+    # full_model_flux = np.sign(logtempseds) * np.log10(1 + np.abs(logtempseds * math.log(10)))
+    full_model_flux = (
+        np.sign(model_seds_with_bias)
+        * np.log1p(np.abs(model_seds_with_bias * math.log(10)))
+        / math.log(10)
+    )
+
+    # make 1D PDF objects
+    pdf1d_objs = []
+    qname_gridvals = []
+    for qname in qnames:
+
+        # get bin properties
+        qname_vals, nbins, logspacing, minval, maxval = setup_param_bins(
+            qname, max_nbins, g0, full_model_flux, filters, grid_info_dict
+        )
+
+        # generate the fast 1d pdf mapping
+        pdf1d_objs.append(
+            pdf1d(
+                qname_vals, nbins, logspacing=logspacing, minval=minval, maxval=maxval
+            )
+        )
+        qname_gridvals.append(qname_vals)
+
+    # make 2D PDF objects
+    pdf2d_objs = []
+    for qname_pair in pdf2d_qname_pairs:
+        qname_1, qname_2 = qname_pair.split("+")
+
+        # get bin properties
+        (
+            qname_vals_p1,
+            nbins_p1,
+            logspacing_p1,
+            minval_p1,
+            maxval_p1,
+        ) = setup_param_bins(
+            qname_1, max_nbins, g0, full_model_flux, filters, grid_info_dict
+        )
+        (
+            qname_vals_p2,
+            nbins_p2,
+            logspacing_p2,
+            minval_p2,
+            maxval_p2,
+        ) = setup_param_bins(
+            qname_2, max_nbins, g0, full_model_flux, filters, grid_info_dict
+        )
+
+        # make 2D PDF
+        pdf2d_objs.append(
+            pdf2d(
+                qname_vals_p1,
+                qname_vals_p2,
+                nbins_p1,
+                nbins_p2,
+                logspacing_p1=logspacing_p1,
+                logspacing_p2=logspacing_p2,
+                minval_p1=minval_p1,
+                maxval_p1=maxval_p1,
+                minval_p2=minval_p2,
+                maxval_p2=maxval_p2,
+            )
+        )
+
+    # sparse projection giving all the 1D/2D PDFs and expectation values
+    #   from the sparse posterior of each star
+    marginals = MarginalProjection(
+        len(model_seds_with_bias),
+        pdf1d_objs,
+        pdf2d_objs=pdf2d_objs,
+        exp_gridvals=qname_gridvals,
+    )
+
+    return {
+        "likelihood": likelihood,
+        "g0_indxs": g0_indxs,
+        "qname_gridvals": qname_gridvals,
+        "pdf1d_objs": pdf1d_objs,
+        "pdf2d_objs": pdf2d_objs,
+        "marginals": marginals,
+    }
+
+
+def fit_block(block, fit_setup):
+    """
+    Fit a block of stars and calculate their fit statistics
+
+    Parameters
+    ----------
+    block : list of tuples
+        (index, sed) for each star in the block
+    fit_setup : dict
+        star independent setup of the fitting as created by Q_all_memory
+        (likelihood, marginals, g0_indxs, g0_specgrid_indx,
+        pdf1d_bin_vals, p, threshold, lnp_npts, save_lnp, block_fitting,
+        model_index, progressive_chi2)
+
+    Returns
+    -------
+    res : dict
+        fit statistics of the block of stars, including "e" giving the
+        indexes of the stars in the catalog
+    """
+    likelihood = fit_setup["likelihood"]
+    g0_indxs = fit_setup["g0_indxs"]
+    threshold = fit_setup["threshold"]
+    model_index = fit_setup["model_index"]
+
+    if fit_setup["block_fitting"]:
+        # calculate the full nD posteriors for the block of stars
+        (block_lnp, block_chi2) = likelihood.block(np.array([obj for e, obj in block]))
+
+    sparse_posts = []
+    for b, (e, obj) in enumerate(block):
+        (sed) = obj
+
+        # calculate the full nD posterior
+        #   (prior weights included, only for the non-zero weight models)
+        #   with a model index or the progressive chi2, only for the
+        #   candidate models of the star
+        if fit_setup["block_fitting"]:
+            lnp = block_lnp[b]
+            chi2 = block_chi2[b]
+            cg0_indxs = g0_indxs
+        elif (model_index is not None) or fit_setup["progressive_chi2"]:
+            cand_indxs = None
+            if model_index is not None:
+                cand_indxs = model_index.candidates(sed, threshold)
+            if fit_setup["progressive_chi2"]:
+                (cand_indxs, lnp, chi2) = likelihood.progressive(
+                    sed, threshold, indxs=cand_indxs
+                )
+            else:
+                (lnp, chi2) = likelihood(sed, indxs=cand_indxs)
+            cg0_indxs = g0_indxs[cand_indxs]
+        else:
+            (lnp, chi2) = likelihood(sed)
+            cg0_indxs = g0_indxs
+
+        (indx,) = np.where((lnp - max(lnp[np.isfinite(lnp)])) > threshold)
+
+        # now generate the sparse likelihood (remove later if this works
+        #       by updating code below)
+        #   checked if changing to the full likelihood speeds things up
+        #       - the answer is no
+        #   and is likely related to the switch here to the sparse
+        #       likelihood for the weight calculation
+        #   the models are given by their index in the full model grid,
+        #       which is also their row in the marginal projection
+        sparse_posts.append((cg0_indxs[indx], cg0_indxs[indx], lnp[indx], chi2[indx]))
+
+    return block_stats(
+        block, sparse_posts, fit_setup["marginals"], fit_setup["g0_specgrid_indx"], fit_setup
+    )
+
+
+def block_stats(block, sparse_posts, marginals, specgrid_indx, fit_setup):
+    """
+    Calculate the fit statistics of a block of stars from their sparse
+    posteriors
+
+    Parameters
+    ----------
+    block : list of tuples
+        (index, sed) for each star in the block
+    sparse_posts : list of tuples
+        (rows, gindxs, lnps, chi2s) for each star, giving for the models
+        above the threshold their rows in marginals and specgrid_indx,
+        their indexes in the full model grid and their lnp and chi2 values
+    marginals : MarginalProjection
+        projection giving the 1D/2D PDFs and expectation values
+    specgrid_indx : ndarray
+        index in the spectral grid for each row of marginals
+    fit_setup : dict
+        setup of the fitting (pdf1d_bin_vals, p, lnp_npts, save_lnp)
+
+    Returns
+    -------
+    res : dict
+        fit statistics of the block of stars, including "e" giving the
+        indexes of the stars in the catalog
+    """
+    lnp_npts = fit_setup["lnp_npts"]
+    _p = fit_setup["p"]
+
+    n_stars = len(block)
+    n_qnames = marginals.n_exp
+    res = {
+        "e": [e for e, obj in block],
+        "per_vals": np.zeros((n_stars, n_qnames, len(_p))),
+        "chi2_vals": np.zeros(n_stars),
+        "chi2_indx": np.zeros(n_stars),
+        "lnp_vals": np.zeros(n_stars),
+        "lnp_indx": np.zeros(n_stars),
+        "best_specgrid_indx": np.zeros(n_stars),
+        "total_log_norm": np.zeros(n_stars),
+        "save_lnp_vals": [],
+    }
+
+    block_rows = []
+    block_weights = []
+    best_rows = np.zeros(n_stars, dtype=np.int64)
+    for b, ((e, sed), (rows, gindxs, lnps, chi2s)) in enumerate(
+        zip(block, sparse_posts)
+    ):
+        # log_norm = np.log(getNorm_lnP(lnps))
+        # if not np.isfinite(log_norm):
+        #    log_norm = lnps.max()
+        log_norm = lnps.max()
+        weights = np.exp(lnps - log_norm)
+
+        # normalize the weights make sure they sum to one
+        #   needed for np.random.choice
+        weight_sum = np.sum(weights)
+        weights /= weight_sum
+
+        # save the current set of lnps
+        if fit_setup["save_lnp"]:
+            n_indx = len(lnps)
+            if lnp_npts is not None:
+                if lnp_npts < n_indx:
+                    rindx = np.random.choice(n_indx, size=lnp_npts, replace=False)
+                if lnp_npts >= n_indx:
+                    rindx = np.arange(n_indx)
+            else:
+                rindx = np.arange(n_indx)
+            res["save_lnp_vals"].append(
+                [
+                    e,
+                    np.array(gindxs[rindx], dtype=np.int64),
+                    np.array(lnps[rindx], dtype=np.float32),
+                    np.array(chi2s[rindx], dtype=np.float32),
+                    np.array([sed]).T,
+                ]
+            )
+
+        # To merge the stats for different subgrids, we need the total
+        # weight of a grid, which is sum(exp(lnps)). Since sum(exp(lnps
+        # - log_norm - log(weight_sum))) = 1, the relative weight of
+        # each subgrid will be exp(log_norm + log(weight_sum)).
+        # Therefore, we also store the following quantity:
+        res["total_log_norm"][b] = log_norm + np.log(weight_sum)
+
+        # best fit model
+        best = weights.argmax()
+        best_rows[b] = rows[best]
+
+        # goodness of fit quantities
+        res["chi2_vals"][b] = chi2s.min()
+        res["chi2_indx"][b] = gindxs[chi2s.argmin()]
+        res["lnp_vals"][b] = lnps.max()
+        res["lnp_indx"][b] = gindxs[best]
+
+        # sparse posterior for the marginalization
+        block_rows.append(rows)
+        block_weights.append(weights)
+
+    # index to the spectral grid and best values for individual parameters
+    res["best_specgrid_indx"][:] = specgrid_indx[best_rows]
+    res["best_vals"] = marginals.gridvals(best_rows)
+
+    # calculate quantities for individual parameters for the block:
+    #   expectation value, 1D PDF, percentiles, 2D PDFs
+    (res["exp_vals"], res["pdf1d_vals"], res["pdf2d_vals"]) = marginals.gen_block(
+        block_rows, block_weights
+    )
+
+    for k in range(n_qnames):
+        # percentile values
+        #   the 1D PDFs are not normalized to allow for post processing
+        #   with different distance runs (needed for the SMIDGE-SMC)
+        (good_b,) = np.where(res["pdf1d_vals"][k].max(axis=1) > 0)
+        if len(good_b) > 0:
+            res["per_vals"][good_b, k, :] = percentile_block(
+                fit_setup["pdf1d_bin_vals"][k], _p, res["pdf1d_vals"][k][good_b, :]
+            )
+
+    return res
+
+
+def fit_block_chunks(block, fit_setup):
+    """
+    Fit a block of stars to a model grid read in chunks of models
+
+    The posteriors of the stars are computed for one chunk of models at
+    a time and only the models that can still pass the threshold are kept.
+    As the max lnp of each star can only grow from chunk to chunk, the
+    kept models are pruned with the running max and the final selection
+    with the overall max gives the same sparse posteriors as fitting all
+    the models at once.  Only one chunk of models and the sparse
+    posteriors of the block are in memory at any time.
+
+    Parameters
+    ----------
+    block : list of tuples
+        (index, sed) for each star in the block
+    fit_setup : dict
+        star independent setup of the fitting as created by Q_all_memory
+        (model_chunks, model_args, pdf1d_bin_vals, p, threshold, lnp_npts,
+        save_lnp)
+
+    Returns
+    -------
+    res : dict
+        fit statistics of the block of stars, including "e" giving the
+        indexes of the stars in the catalog
+    """
+    threshold = fit_setup["threshold"]
+    block_seds = np.array([obj for e, obj in block])
+    n_stars = len(block)
+
+    # running max lnp and models kept for each star of the block
+    lnp_max = np.full(n_stars, -np.inf)
+    kept_star = np.zeros(0, dtype=np.int64)
+    kept_gindxs = np.zeros(0, dtype=np.int64)
+    kept_lnp = np.zeros(0)
+    kept_chi2 = np.zeros(0)
+    kept_specgrid_indx = np.zeros(0, dtype=np.int64)
+    kept_marginals = None
+
+    for chunk in fit_setup["model_chunks"].chunks():
+        models = setup_models(
+            chunk["grid"], chunk["seds"], chunk, **fit_setup["model_args"]
+        )
+        (lnp, chi2) = models["likelihood"].block(block_seds)
+
+        with np.errstate(invalid="ignore"):
+            lnp_max = np.maximum(
+                lnp_max, np.max(np.where(np.isfinite(lnp), lnp, -np.inf), axis=1)
+            )
+            (cstar, cpos) = np.nonzero((lnp - lnp_max[:, None]) > threshold)
+            (keep,) = np.nonzero((kept_lnp - lnp_max[kept_star]) > threshold)
+
+        cindxs = models["g0_indxs"][cpos]
+        kept_star = np.concatenate([kept_star[keep], cstar])
+        kept_gindxs = np.concatenate([kept_gindxs[keep], chunk["start"] + cindxs])
+        kept_lnp = np.concatenate([kept_lnp[keep], lnp[cstar, cpos]])
+        kept_chi2 = np.concatenate([kept_chi2[keep], chi2[cstar, cpos]])
+        kept_specgrid_indx = np.concatenate(
+            [kept_specgrid_indx[keep], chunk["grid"]["specgrid_indx"][cindxs]]
+        )
+        chunk_marginals = models["marginals"].take(cindxs)
+        if kept_marginals is None:
+            kept_marginals = chunk_marginals
+        else:
+            kept_marginals = concatenate_projections(
+                [kept_marginals.take(keep), chunk_marginals]
+            )
+
+    # sparse posterior of each star, with the models in grid order
+    order = np.argsort(kept_star, kind="stable")
+    marginals = kept_marginals.take(order)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(kept_star, minlength=n_stars))])
+    sparse_posts = []
+    for b in range(n_stars):
+        rows = np.arange(offsets[b], offsets[b + 1])
+        sparse_posts.append(
+            (
+                rows,
+                kept_gindxs[order[rows]],
+                kept_lnp[order[rows]],
+                kept_chi2[order[rows]],
+            )
+        )
+
+    return block_stats(
+        block, sparse_posts, marginals, kept_specgrid_indx[order], fit_setup
+    )
+
+
+# fit setup and shared memory blocks of a worker process
+_worker_fit_setup = {}
+_worker_shms = []
+
+
+def _init_fit_worker(fit_setup_desc):
+    """ attach a worker process to the shared fit setup """
+    # different random samples of the lnps in each worker
+    np.random.seed()
+    _worker_fit_setup.update(attach(fit_setup_desc, _worker_shms))
+
+
+def _fit_block_worker(block):
+    """ fit a block of stars in a worker process """
+    if "model_chunks" in _worker_fit_setup:
+        return fit_block_chunks(block, _worker_fit_setup)
+    return fit_block(block, _worker_fit_setup)
+
+
 def Q_all_memory(
     prev_result,
     obs,
@@ -315,6 +894,11 @@ def Q_all_memory(
     resume=False,
     use_full_cov_matrix=True,
     do_not_normalize=False,
+    block_memory=None,
+    nprocs=1,
+    prune_models=False,
+    progressive_chi2=False,
+    checkpoint_dir=None,
 ):
     """
     Fit each star, calculate various fit statistics, and output them to files.
@@ -327,10 +911,15 @@ def Q_all_memory(
         usually basic data on each source
     obs : Observation object instance
         observation catalog
-    sedgrid : str or grid.SEDgrid instance
+    sedgrid : str, grid.SEDgrid or ModelChunks instance
         model grid
+        with a ModelChunks instance, the model grid and noise model are
+        read from disk one chunk of models at a time for each block of
+        stars, so the grid does not have to fit in memory
+        (prune_models and progressive_chi2 are then not used)
     obsmodel : beast noisemodel instance
-        noise model data
+        noise model data (not used with a ModelChunks instance)
+        a CompactNoiseModel is evaluated on the model fluxes
     qnames : list
         names of quantities
     p : array-like
@@ -341,10 +930,13 @@ def Q_all_memory(
     max_nbins : int
         maxiumum number of bins to use for the 1D likelihood calculations
     save_every_npts : int
-        set to save the files below (if set) every n stars
+        set to checkpoint the results every n stars
         a requirement for recovering from partially complete runs
+        (only the results of the last n stars are written at each
+        checkpoint, the output files are written at the end of the run)
     resume : bool
         set to designate this run is resuming a partially complete run
+        (from the checkpoint if it exists, otherwise from the output files)
     use_full_cov_matrix : bool
         set to use the full covariance matrix if it is present in the
         noise model file
@@ -371,79 +963,157 @@ def Q_all_memory(
         should have no effect on the final outcome when using only a
         single grid, but is essential when using the subgridding
         approach.
+    block_memory : float
+        set to fit blocks of stars at once, with the number of stars per
+        block set by this memory budget (in bytes) for the block likelihoods
+        (of one chunk of models with model chunks).
+        Each block only does one pass over the model grid.
+        Default is to fit one star at a time.
+    nprocs : int
+        number of processes to use to fit the stars of the catalog.
+        The workers fit blocks of stars using a single copy of the model
+        fluxes, noise model, prior weights and PDF bin maps in shared memory.
+    prune_models : bool
+        set to only compute the likelihood of the models of each star that
+        can pass the threshold, as given by a flux-space index of the
+        models (see beast.fitting.modelindex.ModelFluxIndex).
+        The stars are then fit one at a time (block_memory only sets the
+        number of stars per task).
+    progressive_chi2 : bool
+        set to compute the chi2 one filter at a time dropping the models
+        that cannot pass the threshold after each filter
+        (see PreparedLikelihood.progressive, noise model without
+        covariances only).  The stars are then fit one at a time.
+    checkpoint_dir : str
+        directory for the checkpoint files of the incremental saves
+        (default is based on the name of the first output file,
+        e.g., stats_outname without extension + '_checkpoint')
 
     Returns
     -------
     N/A
     """
 
-    if type(sedgrid) == str:
-        g0 = grid.FileSEDGrid(sedgrid, backend=gridbackend)
-    else:
-        g0 = sedgrid
+    # number of observed SEDs to fit
+    nobs = len(obs)
 
-    # remove weights that are less than zero
-    (g0_indxs,) = np.where(g0["weight"] > 0.0)
+    # with model chunks, the grid and noise model are read from disk one
+    #   chunk of models at a time for each block of stars
+    stream_models = isinstance(sedgrid, ModelChunks)
 
-    g0_weights = np.log(g0["weight"][g0_indxs])
-    if not do_not_normalize:
-        # this variable used on the next line, so is used regardless of what flake8 says
-        g0_weights_sum = np.log(g0["weight"][g0_indxs].sum())  # noqa: E302
-        g0_weights = numexpr.evaluate("g0_weights - g0_weights_sum")
-
-    if len(g0["weight"]) != len(g0_indxs):
-        print("some zero weight models exist")
-        print("orig/g0_indxs", len(g0["weight"]), len(g0_indxs))
-
-    # get the model SEDs
-    if hasattr(g0.seds, "read"):
-        _seds = g0.seds.read()
+    if stream_models:
+        model_chunks = sedgrid
+        filters = model_chunks.filters
+        grid_lamb = model_chunks.lamb
+        noise_keys = model_chunks.noise_keys
+        print(
+            "fitting {0:d} models read in chunks from {1:d} grid file(s)".format(
+                len(model_chunks), len(model_chunks.sedgrid_fnames)
+            )
+        )
     else:
-        _seds = g0.seds
-
-    # links to errors and biases
-    ast_error = obsmodel["error"]
-    ast_bias = obsmodel["bias"]
+        if type(sedgrid) == str:
+            g0 = grid.FileSEDGrid(sedgrid, backend=gridbackend)
+        else:
+            g0 = sedgrid
+        filters = sedgrid.filters
+        grid_lamb = g0.lamb[:]
+        noise_keys = obsmodel.keys()
 
-    # if the ast file includes the full covariance matrices, make links
+    # if the ast file includes the full covariance matrices, use them
     full_cov_mat = False
     if (
         use_full_cov_matrix
-        & ("q_norm" in obsmodel.keys())
-        & ("icov_diag" in obsmodel.keys())
-        & ("icov_offdiag" in obsmodel.keys())
+        & ("q_norm" in noise_keys)
+        & ("icov_diag" in noise_keys)
+        & ("icov_offdiag" in noise_keys)
     ):
         full_cov_mat = True
-        ast_q_norm = obsmodel["q_norm"]
-        ast_icov_diag = obsmodel["icov_diag"]
-        two_ast_icov_offdiag = 2.0 * obsmodel["icov_offdiag"]
-    else:
-        ast_ivar = 1.0 / np.asfortranarray(ast_error) ** 2
 
     if full_cov_mat:
         print("using full covariance matrix")
     else:
         print("not using full covariance matrix")
 
-    # number of observed SEDs to fit
-    nobs = len(obs)
-
     # augment the qnames to include the *full* model SED
     #  by this it means the physical model flux plus the noise model bias term
     qnames = qnames_in
-    filters = sedgrid.filters
     for i, cfilter in enumerate(filters):
         qnames.append("symlog" + cfilter + "_wd_bias")
 
-    # create the full model fluxes for later use
-    #   save as symmetric log, since the fluxes can be negative
-    model_seds_with_bias = np.asfortranarray(_seds + ast_bias)
-    # full_model_flux = np.sign(logtempseds) * np.log10(1 + np.abs(logtempseds * math.log(10)))
-    full_model_flux = (
-        np.sign(model_seds_with_bias)
-        * np.log1p(np.abs(model_seds_with_bias * math.log(10)))
-        / math.log(10)
-    )
+    if stream_models:
+        # the PDF bins are set from the range of the quantities over all
+        #   the models, the same for all the chunks
+        if grid_info_dict is None:
+            grid_info_dict = {}
+        missing_qnames = [qname for qname in qnames if qname not in grid_info_dict]
+        if len(missing_qnames) > 0:
+            print("computing the range of the quantities over all the models")
+            grid_info_dict = dict(
+                grid_info_dict, **model_chunks.grid_info(missing_qnames)
+            )
+        lnweight_sum = None if do_not_normalize else model_chunks.lnweight_sum()
+    else:
+        lnweight_sum = None
+        if not do_not_normalize:
+            g0_weight = g0["weight"]
+            lnweight_sum = np.log(g0_weight[g0_weight > 0.0].sum())
+
+    # if chosen, make 2D PDFs
+    pdf2d_qname_pairs = []
+    if pdf2d_outname is not None:
+        # only the parameters with more than one value
+        _pdf2d_params = [qname for qname in qnames if qname in pdf2d_param_list]
+        if stream_models:
+            _pdf2d_params = [
+                qname
+                for qname in _pdf2d_params
+                if grid_info_dict[qname]["num_unique"] > 1
+            ]
+        else:
+            _pdf2d_params = [
+                qname
+                for qname in _pdf2d_params
+                if grid_num_unique(g0, qname, g0[qname], 2) > 1
+            ]
+        _n_params = len(_pdf2d_params)
+        pdf2d_qname_pairs = [
+            _pdf2d_params[i] + "+" + _pdf2d_params[j]
+            for i in range(_n_params)
+            for j in range(i + 1, _n_params)
+        ]
+
+    # star independent setup for the models (the first chunk of models
+    #   when streaming, giving the PDF bins)
+    model_args = {
+        "qnames": qnames,
+        "filters": filters,
+        "max_nbins": max_nbins,
+        "grid_info_dict": grid_info_dict,
+        "pdf2d_qname_pairs": pdf2d_qname_pairs,
+        "full_cov_mat": full_cov_mat,
+        "lnweight_sum": lnweight_sum,
+    }
+    if stream_models:
+        chunk = next(model_chunks.chunks())
+        models = setup_models(chunk["grid"], chunk["seds"], chunk, **model_args)
+        del chunk
+    else:
+        # get the model SEDs
+        if hasattr(g0.seds, "read"):
+            _seds = g0.seds.read()
+        else:
+            _seds = g0.seds
+
+        # a compact noise model is evaluated on the model fluxes
+        if isinstance(obsmodel, CompactNoiseModel):
+            obsmodel = obsmodel.evaluate(_seds)
+
+        models = setup_models(g0, _seds, obsmodel, **model_args)
+
+        if len(g0["weight"]) != len(models["g0_indxs"]):
+            print("some zero weight models exist")
+            print("orig/g0_indxs", len(g0["weight"]), len(models["g0_indxs"]))
 
     # setup the arrays to temp store the results
     n_qnames = len(qnames)
@@ -461,95 +1131,77 @@ def Q_all_memory(
     # variable to save the lnp files
     save_lnp_vals = []
 
-    # setup the mapping for the 1D PDFs
-    fast_pdf1d_objs = []
+    # setup the arrays to save the 1d PDFs
+    fast_pdf1d_objs = models["pdf1d_objs"]
     save_pdf1d_vals = []
-
-    # make 1D PDF objects
-    for qname in qnames:
-
-        # get bin properties
-        qname_vals, nbins, logspacing, minval, maxval = setup_param_bins(
-            qname, max_nbins, g0, full_model_flux, filters, grid_info_dict
-        )
-
-        # generate the fast 1d pdf mapping
-        _tpdf1d = pdf1d(
-            qname_vals, nbins, logspacing=logspacing, minval=minval, maxval=maxval
-        )
-        fast_pdf1d_objs.append(_tpdf1d)
-
-        # setup the arrays to save the 1d PDFs
-        save_pdf1d_vals.append(np.zeros((nobs + 1, nbins)))
+    for _tpdf1d in fast_pdf1d_objs:
+        save_pdf1d_vals.append(np.zeros((nobs + 1, _tpdf1d.nbins)))
         save_pdf1d_vals[-1][-1, :] = _tpdf1d.bin_vals
 
-    # if chosen, make 2D PDFs
+    # arrays for the 2D PDFs and bins
     if pdf2d_outname is not None:
-
-        # setup the 2D PDFs
-        _pdf2d_params = [
-            qname
-            for qname in qnames
-            if qname in pdf2d_param_list and len(np.unique(g0[qname])) > 1
-        ]
-        _n_params = len(_pdf2d_params)
-        pdf2d_qname_pairs = [
-            _pdf2d_params[i] + "+" + _pdf2d_params[j]
-            for i in range(_n_params)
-            for j in range(i + 1, _n_params)
-        ]
-        fast_pdf2d_objs = []
         save_pdf2d_vals = []
-
-        # make 2D PDF objects
-        for qname_pair in pdf2d_qname_pairs:
-            qname_1, qname_2 = qname_pair.split("+")
-
-            # get bin properties
-            (
-                qname_vals_p1,
-                nbins_p1,
-                logspacing_p1,
-                minval_p1,
-                maxval_p1,
-            ) = setup_param_bins(
-                qname_1, max_nbins, g0, full_model_flux, filters, grid_info_dict
-            )
-            (
-                qname_vals_p2,
-                nbins_p2,
-                logspacing_p2,
-                minval_p2,
-                maxval_p2,
-            ) = setup_param_bins(
-                qname_2, max_nbins, g0, full_model_flux, filters, grid_info_dict
-            )
-
-            # make 2D PDF
-            _tpdf2d = pdf2d(
-                qname_vals_p1,
-                qname_vals_p2,
-                nbins_p1,
-                nbins_p2,
-                logspacing_p1=logspacing_p1,
-                logspacing_p2=logspacing_p2,
-                minval_p1=minval_p1,
-                maxval_p1=maxval_p1,
-                minval_p2=minval_p2,
-                maxval_p2=maxval_p2,
-            )
-            fast_pdf2d_objs.append(_tpdf2d)
-            # arrays for the PDFs and bins
+        for _tpdf2d in models["pdf2d_objs"]:
+            nbins_p1 = _tpdf2d.nbins_p1
+            nbins_p2 = _tpdf2d.nbins_p2
             save_pdf2d_vals.append(np.zeros((nobs + 2, nbins_p1, nbins_p2)))
             save_pdf2d_vals[-1][-2, :, :] = np.tile(
                 _tpdf2d.bin_vals_p1, (nbins_p2, 1)
             ).T
             save_pdf2d_vals[-1][-1, :, :] = np.tile(_tpdf2d.bin_vals_p2, (nbins_p1, 1))
 
+    # arrays with one row per star, saved in the checkpoints
+    checkpoint_arrays = {
+        "best_vals": best_vals,
+        "exp_vals": exp_vals,
+        "per_vals": per_vals,
+        "chi2_vals": chi2_vals,
+        "chi2_indx": chi2_indx,
+        "lnp_vals": lnp_vals,
+        "lnp_indx": lnp_indx,
+        "best_specgrid_indx": best_specgrid_indx,
+        "total_log_norm": total_log_norm,
+    }
+    for k in range(n_qnames):
+        checkpoint_arrays["pdf1d_{0:d}".format(k)] = save_pdf1d_vals[k]
+    if pdf2d_outname is not None:
+        for k in range(len(pdf2d_qname_pairs)):
+            checkpoint_arrays["pdf2d_{0:d}".format(k)] = save_pdf2d_vals[k]
+
+    # append-only checkpoint of the results for the incremental saves
+    checkpoint = None
+    if save_every_npts is not None:
+        if checkpoint_dir is None:
+            for outname in [stats_outname, pdf1d_outname, pdf2d_outname, lnp_outname]:
+                if outname is not None:
+                    checkpoint_dir = os.path.splitext(outname)[0] + "_checkpoint"
+                    break
+        if checkpoint_dir is not None:
+            checkpoint = FitCheckpoint(checkpoint_dir)
+
+    # the lnps of several model grids are saved with the index of the model
+    #   in its subgrid and the subgrid number (as merged subgrid lnp files)
+    lnp_file_columns = lnp_columns
+    lnp_grid_offsets = None
+    if stream_models and len(model_chunks.n_models_grids) > 1:
+        lnp_file_columns = dict(lnp_columns, subgrid=np.int64)
+        lnp_grid_offsets = model_chunks.offsets
+
     # if this is a resume job, read in the already computed stats and
     #     fill the variables
     # also - find the start position for the resumed run
-    if resume:
+    if resume and (checkpoint is not None) and checkpoint.exists():
+        start_pos = checkpoint.restore(checkpoint_arrays)
+        print(
+            "resuming run from the checkpoint in "
+            + checkpoint_dir
+            + " with start indx = "
+            + str(start_pos)
+            + " out of "
+            + str(nobs)
+        )
+
+    elif resume:
         stats_table = Table.read(stats_outname)
 
         for k, qname in enumerate(qnames):
@@ -558,11 +1210,13 @@ def Q_all_memory(
             for i, pval in enumerate(p):
                 per_vals[:, k, i] = stats_table["{0:s}_p{1:d}".format(qname, int(pval))]
 
-        chi2_vals = stats_table["chi2min"]
-        chi2_indx = stats_table["chi2min_indx"]
-        lnp_vals = stats_table["Pmax"]
-        lnp_indx = stats_table["Pmax_indx"]
-        best_specgrid_indx = stats_table["specgrid_indx"]
+        chi2_vals[:] = stats_table["chi2min"]
+        chi2_indx[:] = stats_table["chi2min_indx"]
+        lnp_vals[:] = stats_table["Pmax"]
+        lnp_indx[:] = stats_table["Pmax_indx"]
+        best_specgrid_indx[:] = stats_table["specgrid_indx"]
+        if "total_log_norm" in stats_table.colnames:
+            total_log_norm[:] = stats_table["total_log_norm"]
 
         (indxs,) = np.where(stats_table["Pmax"] != 0.0)
         start_pos = max(indxs) + 1
@@ -578,197 +1232,158 @@ def Q_all_memory(
             print("restoring the already computed 1D PDFs from " + pdf1d_outname)
             with fits.open(pdf1d_outname) as hdulist:
                 for k in range(len(qnames)):
-                    save_pdf1d_vals[k] = hdulist[k + 1].data
+                    save_pdf1d_vals[k][:] = hdulist[k + 1].data
 
         # read in the already computed 2D PDFs
         if pdf2d_outname is not None:
             print("restoring the already computed 2D PDFs from " + pdf2d_outname)
             with fits.open(pdf2d_outname) as hdulist:
                 for k in range(len(pdf2d_qname_pairs)):
-                    save_pdf2d_vals[k] = hdulist[k + 1].data
+                    save_pdf2d_vals[k][:] = hdulist[k + 1].data
+
+        # start the checkpoint with the restored stars
+        if checkpoint is not None:
+            checkpoint.start()
+            checkpoint.append(
+                0,
+                start_pos,
+                {name: arr[:start_pos] for name, arr in checkpoint_arrays.items()},
+            )
 
     else:
         start_pos = 0
 
         # setup a new lnp file
         if lnp_outname is not None:
-            outfile = tables.open_file(lnp_outname, "w")
-            # Save wavelengths in root, remember #n_stars = root._v_nchildren -1
-            outfile.create_array(outfile.root, "grid_waves", g0.lamb[:])
             filters = obs.getFilters()
-            outfile.create_array(outfile.root, "obs_filters", filters[:])
-            outfile.close()
-
-    # loop over the objects and get all the requested quantities
-    g0_specgrid_indx = g0["specgrid_indx"]
-    _p = np.asarray(p, dtype=float)
-
-    it = tqdm(
-        islice(obs.enumobs(), int(start_pos), None),
-        total=len(obs) - start_pos,
-        desc="Calculating Lnp/Stats",
-    )
-    for e, obj in it:
-        # calculate the full nD posterior
-        (sed) = obj
-
-        cur_mask = sed == 0
-        # need an alternate way to generate the mask as zeros can be
-        # valid values in the observed SED (KDG 29 Jan 2016)
-        # currently, set mask to False always
-        cur_mask[:] = False
-
-        if full_cov_mat:
-            (lnp, chi2) = N_covar_logLikelihood(
-                sed,
-                model_seds_with_bias,
-                ast_q_norm,
-                ast_icov_diag,
-                two_ast_icov_offdiag,
-                lnp_threshold=abs(threshold),
+            create_lnp_file(
+                lnp_outname,
+                len(filters),
+                grid_waves=grid_lamb,
+                obs_filters=filters[:],
+                columns=lnp_file_columns,
             )
-        else:
-            (lnp, chi2) = N_logLikelihood_NM(
-                sed,
-                model_seds_with_bias,
-                ast_ivar,
-                mask=cur_mask,
-                lnp_threshold=abs(threshold),
-            )
-
-        lnp = lnp[g0_indxs]
-        chi2 = chi2[g0_indxs]
-        # lnp = numexpr.evaluate('lnp + g0_weights')
-        lnp += g0_weights  # multiply by the prior weights (sum in log space)
 
-        (indx,) = np.where((lnp - max(lnp[np.isfinite(lnp)])) > threshold)
-
-        # now generate the sparse likelihood (remove later if this works
-        #       by updating code below)
-        #   checked if changing to the full likelihood speeds things up
-        #       - the answer is no
-        #   and is likely related to the switch here to the sparse
-        #       likelihood for the weight calculation
-        lnps = lnp[indx]
-        chi2s = chi2[indx]
-
-        # log_norm = np.log(getNorm_lnP(lnps))
-        # if not np.isfinite(log_norm):
-        #    log_norm = lnps.max()
-        log_norm = lnps.max()
-        weights = np.exp(lnps - log_norm)
+        if checkpoint is not None:
+            checkpoint.start()
+    checkpoint_pos = start_pos
+
+    # everything needed to fit a block of stars
+    fit_setup = {
+        "pdf1d_bin_vals": [cpdf1d.bin_vals for cpdf1d in fast_pdf1d_objs],
+        "p": np.asarray(p, dtype=float),
+        "threshold": threshold,
+        "lnp_npts": lnp_npts,
+        "save_lnp": lnp_outname is not None,
+    }
+
+    if stream_models:
+        # the blocks of stars are fit to each chunk of models in turn
+        if prune_models or progressive_chi2:
+            print("prune_models and progressive_chi2 not used with model chunks")
+        nstars_block = nstars_per_block(
+            block_memory, model_chunks.chunk_size or max(model_chunks.n_models_grids)
+        )
+        fit_setup["model_chunks"] = model_chunks
+        fit_setup["model_args"] = model_args
+        fit_func = fit_block_chunks
+    else:
+        # fit blocks of stars to amortize each pass over the model grid
+        nstars_block = nstars_per_block(block_memory, len(models["likelihood"]))
+        fit_setup.update(
+            {
+                "likelihood": models["likelihood"],
+                "marginals": models["marginals"],
+                "g0_indxs": models["g0_indxs"],
+                "g0_specgrid_indx": np.asarray(g0["specgrid_indx"]),
+                "block_fitting": (nstars_block > 1)
+                and (not prune_models)
+                and (not progressive_chi2),
+                "model_index": None,
+                "progressive_chi2": progressive_chi2,
+            }
+        )
+        if prune_models:
+            print("building the flux-space index of the models")
+            fit_setup["model_index"] = ModelFluxIndex(models["likelihood"])
+        # star independent terms computed once, before the fit setup is
+        #   shared with the worker processes
+        models["likelihood"].prepare(
+            block=fit_setup["block_fitting"], progressive=progressive_chi2
+        )
+        fit_func = fit_block
+    del models
 
-        # normalize the weights make sure they sum to one
-        #   needed for np.random.choice
-        weight_sum = np.sum(weights)
-        weights /= weight_sum
+    if nstars_block > 1:
+        print("fitting {} stars per block".format(nstars_block))
 
-        # save the current set of lnps
-        if lnp_outname is not None:
-            if lnp_npts is not None:
-                if lnp_npts < len(indx):
-                    rindx = np.random.choice(indx, size=lnp_npts, replace=False)
-                if lnp_npts >= len(indx):
-                    rindx = indx
-            else:
-                rindx = indx
-            save_lnp_vals.append(
-                [
-                    e,
-                    np.array(g0_indxs[rindx], dtype=np.int64),
-                    np.array(lnp[rindx], dtype=np.float32),
-                    np.array(chi2[rindx], dtype=np.float32),
-                    np.array([sed]).T,
-                ]
+    # loop over the objects and get all the requested quantities
+    blocks = chunks(islice(obs.enumobs(), int(start_pos), None), nstars_block)
+    pbar = tqdm(total=len(obs) - start_pos, desc="Calculating Lnp/Stats")
+    pool = None
+    shms = []
+    try:
+        if nprocs > 1:
+            # the workers use the same copy of the fit setup in shared memory
+            print("fitting with {} processes".format(nprocs))
+            pool = multiprocessing.Pool(
+                nprocs,
+                initializer=_init_fit_worker,
+                initargs=(share(fit_setup, shms),),
             )
-
-        # To merge the stats for different subgrids, we need the total
-        # weight of a grid, which is sum(exp(lnps)). Since sum(exp(lnps
-        # - log_norm - log(weight_sum))) = 1, the relative weight of
-        # each subgrid will be exp(log_norm + log(weight_sum)).
-        # Therefore, we also store the following quantity:
-        total_log_norm[e] = log_norm + np.log(weight_sum)
-
-        # index to the full model grid for the best fit values
-        best_full_indx = g0_indxs[indx[weights.argmax()]]
-
-        # index to the spectral grid
-        best_specgrid_indx[e] = g0_specgrid_indx[best_full_indx]
-
-        # goodness of fit quantities
-        chi2_vals[e] = chi2s.min()
-        chi2_indx[e] = g0_indxs[indx[chi2s.argmin()]]
-        lnp_vals[e] = lnps.max()
-        lnp_indx[e] = best_full_indx
-
-        # calculate quantities for individual parameters:
-        # best value, expectation value, 1D PDF, percentiles
-        for k, qname in enumerate(qnames):
-            if "_bias" in qname:
-                fname = (qname.replace("_wd_bias", "")).replace("symlog", "")
-                q = full_model_flux[:, filters.index(fname)]
-            else:
-                q = g0[qname]
-
-            # best value
-            best_vals[e, k] = q[best_full_indx]
-
-            # expectation value
-            exp_vals[e, k] = expectation(q[g0_indxs[indx]], weights=weights)
-
-            # percentile values
-            pdf1d_bins, pdf1d_vals = fast_pdf1d_objs[k].gen1d(g0_indxs[indx], weights)
-
-            save_pdf1d_vals[k][e, :] = pdf1d_vals
-            if pdf1d_vals.max() > 0:
-                # remove normalization to allow for post processing with
-                #   different distance runs (needed for the SMIDGE-SMC)
-                # pdf1d_vals /= pdf1d_vals.max()
-                per_vals[e, k, :] = percentile(pdf1d_bins, _p, weights=pdf1d_vals)
-            else:
-                per_vals[e, k, :] = [0.0, 0.0, 0.0]
-
-        # calculate 2D PDFs for the subset of parameter pairs
-        if pdf2d_outname is not None:
-            for k in range(len(pdf2d_qname_pairs)):
-                save_pdf2d_vals[k][e, :, :] = fast_pdf2d_objs[k].gen2d(
-                    g0_indxs[indx], weights
-                )
-
-        # incremental save (useful if job dies early to recover most
-        #    of the computations)
-        if save_every_npts is not None:
-            if (e > 0) & (e % save_every_npts == 0):
-                # save the 1D PDFs
-                if pdf1d_outname is not None:
-                    save_pdf1d(pdf1d_outname, save_pdf1d_vals, qnames)
-
-                # save the 2D PDFs
-                if pdf2d_outname is not None:
-                    save_pdf2d(pdf2d_outname, save_pdf2d_vals, pdf2d_qname_pairs)
-
-                # save the stats/catalog
-                if stats_outname is not None:
-                    save_stats(
-                        stats_outname,
-                        prev_result,
-                        best_vals,
-                        exp_vals,
-                        per_vals,
-                        chi2_vals,
-                        chi2_indx,
-                        lnp_vals,
-                        lnp_indx,
-                        best_specgrid_indx,
-                        total_log_norm,
-                        qnames,
-                        p,
+            block_results = pool.imap(_fit_block_worker, blocks)
+        else:
+            block_results = (fit_func(block, fit_setup) for block in blocks)
+
+        for res in block_results:
+            block_e = res["e"]
+            best_vals[block_e, :] = res["best_vals"]
+            exp_vals[block_e, :] = res["exp_vals"]
+            per_vals[block_e, :, :] = res["per_vals"]
+            chi2_vals[block_e] = res["chi2_vals"]
+            chi2_indx[block_e] = res["chi2_indx"]
+            lnp_vals[block_e] = res["lnp_vals"]
+            lnp_indx[block_e] = res["lnp_indx"]
+            best_specgrid_indx[block_e] = res["best_specgrid_indx"]
+            total_log_norm[block_e] = res["total_log_norm"]
+            for k in range(n_qnames):
+                save_pdf1d_vals[k][block_e, :] = res["pdf1d_vals"][k]
+            if pdf2d_outname is not None:
+                for k in range(len(pdf2d_qname_pairs)):
+                    save_pdf2d_vals[k][block_e, :, :] = res["pdf2d_vals"][k]
+            save_lnp_vals += res["save_lnp_vals"]
+            pbar.update(len(block_e))
+
+            # incremental save (useful if job dies early to recover most
+            #    of the computations)
+            #  only the stars fit since the previous checkpoint are saved,
+            #    the output files are written at the end
+            if checkpoint is not None:
+                if any((e > 0) & (e % save_every_npts == 0) for e in block_e):
+                    # save the lnps first, the stars in the checkpoint
+                    #   are then always in the lnp file
+                    if lnp_outname is not None:
+                        save_lnp(
+                            lnp_outname, save_lnp_vals, grid_offsets=lnp_grid_offsets
+                        )
+                        save_lnp_vals = []
+
+                    end_pos = max(block_e) + 1
+                    checkpoint.append(
+                        checkpoint_pos,
+                        end_pos,
+                        {
+                            name: arr[checkpoint_pos:end_pos]
+                            for name, arr in checkpoint_arrays.items()
+                        },
                     )
-
-                # save the lnps
-                if lnp_outname is not None:
-                    save_lnp(lnp_outname, save_lnp_vals)
-                    save_lnp_vals = []
+                    checkpoint_pos = end_pos
+    finally:
+        pbar.close()
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        release(shms)
 
     # do the final save of everything (or the last set for the lnp values)
 
@@ -800,7 +1415,11 @@ def Q_all_memory(
 
     # save the lnps
     if lnp_outname is not None:
-        save_lnp(lnp_outname, save_lnp_vals)
+        save_lnp(lnp_outname, save_lnp_vals, grid_offsets=lnp_grid_offsets)
+
+    # all the outputs are saved, the checkpoint is not needed anymore
+    if checkpoint is not None:
+        checkpoint.remove()
 
 
 def IAU_names_and_extra_info(obsdata, surveyname="PHAT", extraInfo=False):
@@ -895,6 +1514,11 @@ def summary_table_memory(
     surveyname="PHAT",
     extraInfo=False,
     do_not_normalize=False,
+    block_memory=None,
+    nprocs=1,
+    prune_models=False,
+    progressive_chi2=False,
+    checkpoint_dir=None,
 ):
     """
     Do the fitting in memory
@@ -904,9 +1528,10 @@ def summary_table_memory(
     obs : Observation object instance
         observation catalog
     noisemodel : beast noisemodel instance
-        noise model data
-    sedgrid : str or grid.SEDgrid instance
-        model grid
+        noise model data (None with model chunks)
+    sedgrid : str, grid.SEDgrid or ModelChunks instance
+        model grid, or model grid and noise model files read in chunks
+        of models (see beast.fitting.modelchunks)
     keys : str or list of str
         if str - name of the quantity or expression to evaluate from the grid table
         if list - list of quantities or expresions
@@ -914,7 +1539,7 @@ def summary_table_memory(
         backend to use to load the grid if necessary (memory, cache, hdf)
         (see beast.core.grid)
     save_every_npts : integer
-        set to save the files below (if set) every n stars
+        set to checkpoint the results every n stars
         a requirement for recovering from partially complete runs
     resume : bool
         set to designate this run is resuming a partially complete run
@@ -948,6 +1573,20 @@ def summary_table_memory(
         should have no effect on the final outcome when using only a
         single grid, but is essential when using the subgridding
         approach.
+    block_memory : float
+        set to fit blocks of stars at once, with the number of stars per
+        block set by this memory budget (in bytes)
+    nprocs : int
+        number of processes to use to fit the stars, all sharing a single
+        copy of the fitting arrays
+    prune_models : bool
+        set to only compute the likelihood of the candidate models of each
+        star given by a flux-space index of the models
+    progressive_chi2 : bool
+        set to compute the chi2 one filter at a time, dropping the models
+        that cannot pass the threshold as soon as possible
+    checkpoint_dir : str
+        directory for the checkpoint files of the incremental saves
 
     Returns
     -------
@@ -997,4 +1636,9 @@ def summary_table_memory(
         lnp_outname=lnp_outname,
         use_full_cov_matrix=use_full_cov_matrix,
         do_not_normalize=do_not_normalize,
+        block_memory=block_memory,
+        nprocs=nprocs,
+        prune_models=prune_models,
+        progressive_chi2=progressive_chi2,
+        checkpoint_dir=checkpoint_dir,
     )
@@ -1 +1 @@
-from beast.fitting.fit_metrics.common import percentile, expectation
+from beast.fitting.fit_metrics.common import percentile, percentile_block, expectation
@@ -123,6 +123,71 @@ def percentile(data, percentiles, weights=None):
     return o
 
 
+def percentile_block(data, percentiles, weights):
+    """Compute weighted percentiles for many weight sets on the same data.
+
+    Vectorized version of percentile for the binned 1D PDFs of many objects
+    that share the same, sorted, bin values.  The interpolation follows the
+    same rule (and floating point operations) as percentile so the results
+    are identical.
+
+    INPUTS:
+    -------
+    data: ndarray[float, ndim=1]
+        data points sorted in increasing order (e.g., bin centers)
+    percentiles: ndarray[float, ndim=1]
+        percentiles to use. (between 0 and 100)
+    weights: ndarray[float, ndim=2]
+        Weights of each point in data for each object (nobjects, ndata)
+        All the weights must be non-negative and the sum must be
+        greater than zero for each object.
+
+    OUTPUTS:
+    -------
+    the weighted percentiles of the data (nobjects, npercentiles).
+    """
+    _data = np.asarray(data, dtype=float)
+    _wt = np.atleast_2d(np.asarray(weights, dtype=float))
+    _p = np.atleast_1d(np.asarray(percentiles, dtype=float)) * 0.01
+
+    if not np.greater_equal(_p, 0.0).all():
+        raise ValueError("Percentiles less than 0")
+    if not np.less_equal(_p, 1.0).all():
+        raise ValueError("Percentiles greater than 100")
+    if _wt.shape[1] != len(_data):
+        raise ValueError("weights must be the same shape as data")
+    if not np.greater_equal(_wt, 0.0).all():
+        raise ValueError("Not all weights are non-negative.")
+
+    aw = np.cumsum(_wt, axis=1)
+    if not (aw[:, -1] > 0).all():
+        raise ValueError("Nonpositive weight sum")
+    w = (aw - 0.5 * _wt) / np.sum(_wt, axis=1)[:, None]
+
+    # same interpolation as np.interp
+    #   j is the last point with w[j] <= p (w is non-decreasing)
+    n_data = len(_data)
+    j = np.sum(w[:, :, None] <= _p[None, None, :], axis=1) - 1
+    jc = np.clip(j, 0, n_data - 2)
+    x0 = np.take_along_axis(w, jc, axis=1)
+    x1 = np.take_along_axis(w, jc + 1, axis=1)
+    y0 = _data[jc]
+    y1 = _data[jc + 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (y1 - y0) / (x1 - x0)
+        o = slope * (_p[None, :] - x0) + y0
+    o = np.where(x0 == _p[None, :], y0, o)
+    o = np.where(j < 0, _data[0], o)
+    o = np.where(j >= n_data - 1, _data[-1], o)
+
+    # equal weights give the normal percentiles (as in percentile)
+    (eq_indxs,) = np.where(np.equal(_wt, 1.0).all(axis=1))
+    for k in eq_indxs:
+        o[k, :] = np.percentile(_data, list(percentiles))
+
+    return o
+
+
 def expectation(q, weights=None):
     """
     the expectation (or expected value or first moment) refers, to the value of
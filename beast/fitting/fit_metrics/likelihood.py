@@ -6,6 +6,8 @@ This package implements many likelihoods based on the common chi2 statistics
 python/numpy version.
 
 N_logLikelihood   Computes a normal likelihood (default, symmetric errors)
+N_logLikelihood_NM_block  Normal likelihood for a block of stars at once
+PreparedLikelihood  Star independent terms precomputed once for all stars
 SN_logLikelihood  Computes a Split Normal likelihood (asymmetric errors)
 getNorm_lnP       Compute the norm of a log-likelihood (overflow robust)
 """
@@ -17,6 +19,13 @@ __all__ = [
     "N_logLikelihood_NM",
     "N_covar_logLikelihood",
     "N_covar_logLikelihood_cholesky",
+    "N_chi2_NM_block_terms",
+    "N_chi2_NM_block",
+    "N_logLikelihood_NM_block",
+    "N_covar_chi2_block_terms",
+    "N_covar_chi2_block",
+    "N_covar_logLikelihood_block",
+    "PreparedLikelihood",
     "getNorm_lnP",
 ]
 
@@ -245,6 +254,563 @@ def N_covar_logLikelihood_cholesky(flux, inv_cholesky_covar, lnQ, bias, fluxmod)
     return lnP
 
 
+def N_chi2_NM_block_terms(fluxmod_wbias, ivar):
+    """ compute the star independent terms of the expanded chi2 used by
+    N_chi2_NM_block.
+
+    Parameters
+    ----------
+    fluxmod_wbias: np.ndarray[float, ndim=2]
+        array of modeled fluxes + ast-derived biases (nmodels, nfilters)
+
+    ivar: np.ndarray[float, ndim=2]
+        array of ast-derived inverse variances (nmodels, nfilters)
+
+    Returns
+    -------
+    (ivar_fluxmod, fluxmod2_ivar)
+    ivar_fluxmod: np.ndarray[float, ndim=2]
+        ivar * fluxmod_wbias (nmodels, nfilters)
+    fluxmod2_ivar: np.ndarray[float, ndim=1]
+        sum over filters of fluxmod_wbias^2 * ivar (nmodels)
+    """
+    ivar_fluxmod = ivar * fluxmod_wbias
+    fluxmod2_ivar = np.einsum("ij,ij->i", ivar_fluxmod, fluxmod_wbias)
+
+    return (ivar_fluxmod, fluxmod2_ivar)
+
+
+def N_chi2_NM_block(
+    fluxes, fluxmod_wbias, ivar, ivar_fluxmod=None, fluxmod2_ivar=None
+):
+    """ compute the non-reduced chi2 between a block of stars and the models
+    taking into account the noise model computed from ASTs.
+
+    The quadratic form is expanded,
+
+        chi2 = sum_k flux_k^2 ivar_k - 2 flux_k (ivar fluxmod)_k
+               + (fluxmod^2 ivar)_k
+
+    so the star dependent part becomes matrix products against star
+    independent terms, amortizing one pass over the model grid over all
+    the stars in the block.
+
+    Parameters
+    ----------
+    fluxes:    np.ndarray[float, ndim=2]
+        array of fluxes (nstars, nfilters)
+
+    fluxmod_wbias: np.ndarray[float, ndim=2]
+        array of modeled fluxes + ast-derived biases (nmodels, nfilters)
+
+    ivar: np.ndarray[float, ndim=2]
+        array of ast-derived inverse variances (nmodels, nfilters)
+
+    ivar_fluxmod, fluxmod2_ivar: np.ndarray, optional
+        precomputed star independent terms (see N_chi2_NM_block_terms)
+
+    Returns
+    -------
+    chi2:    np.ndarray[float, ndim=2]
+        array of chi2 values (nstars, nmodels)
+    """
+    if (ivar_fluxmod is None) or (fluxmod2_ivar is None):
+        ivar_fluxmod, fluxmod2_ivar = N_chi2_NM_block_terms(fluxmod_wbias, ivar)
+
+    _fluxes = np.atleast_2d(fluxes)
+
+    chi2 = np.dot(_fluxes * _fluxes, ivar.T)
+    chi2 -= 2.0 * np.dot(_fluxes, ivar_fluxmod.T)
+    chi2 += fluxmod2_ivar[None, :]
+
+    # the expansion can give tiny negative values through round off
+    np.maximum(chi2, 0.0, out=chi2)
+
+    return chi2
+
+
+def N_logLikelihood_NM_block(
+    fluxes, fluxmod_wbias, ivar, ivar_fluxmod=None, fluxmod2_ivar=None
+):
+    """ Computes the log of the chi2 likelihood between a block of stars
+    and the models taking into account the noise model.
+
+    Parameters
+    ----------
+    fluxes: np.ndarray[float, ndim=2]
+        array of fluxes (nstars, nfilters)
+
+    fluxmod_wbias: np.ndarray[float, ndim=2]
+        array of modeled fluxes + ast-derived biases (nmodels, nfilters)
+
+    ivar: np.ndarray[float, ndim=2]
+        array of ast-derived inverse variances (nmodels, nfilters)
+
+    ivar_fluxmod, fluxmod2_ivar: np.ndarray, optional
+        precomputed star independent terms (see N_chi2_NM_block_terms)
+
+    Returns
+    -------
+    (lnp, chi2)
+    lnP:    np.ndarray[float, ndim=2]
+            array of ln(P) values (nstars, nmodels)
+    chi2:    np.ndarray[float, ndim=2]
+            array of chi-squared values (nstars, nmodels)
+    """
+    n = np.shape(fluxmod_wbias)[1]
+    lnQ = n * 0.5 * np.log(2.0 * np.pi) - 0.5 * np.sum(np.log(ivar), axis=1)
+
+    _chi2 = N_chi2_NM_block(
+        fluxes,
+        fluxmod_wbias,
+        ivar,
+        ivar_fluxmod=ivar_fluxmod,
+        fluxmod2_ivar=fluxmod2_ivar,
+    )
+
+    lnP = -lnQ[None, :] - 0.5 * _chi2
+
+    return (lnP, _chi2)
+
+
+def N_covar_chi2_block_terms(fluxmod_wbias, icov_diag, two_icov_offdiag):
+    """ compute the star independent terms of the expanded chi2 used by
+    N_covar_chi2_block.
+
+    Parameters
+    ----------
+    fluxmod_wbias: np.ndarray[float, ndim=2]
+        array of modeled fluxes + ast-derived biases (nmodels, nfilters)
+
+    icov_diag: np.ndarray[float, ndim=2]
+        array giving the diagnonal terms of the covariance matrix inverse
+
+    two_icov_offdiag: np.ndarray[float, ndim=2]
+        array giving 2x the off diagonal terms of the covariance matrix inverse
+
+    Returns
+    -------
+    (icov_fluxmod, fluxmod_icov_fluxmod)
+    icov_fluxmod: np.ndarray[float, ndim=2]
+        inverse covariance matrix times fluxmod_wbias (nmodels, nfilters)
+    fluxmod_icov_fluxmod: np.ndarray[float, ndim=1]
+        fluxmod_wbias^T icov fluxmod_wbias (nmodels)
+    """
+    n_models, n_filters = fluxmod_wbias.shape
+
+    icov_fluxmod = icov_diag * fluxmod_wbias
+    m_start = 0
+    for k in range(n_filters - 1):
+        m_end = m_start + n_filters - k - 1
+        half_offdiag = 0.5 * two_icov_offdiag[:, m_start:m_end]
+        icov_fluxmod[:, k] += np.einsum(
+            "ij,ij->i", half_offdiag, fluxmod_wbias[:, k + 1 :]
+        )
+        icov_fluxmod[:, k + 1 :] += half_offdiag * fluxmod_wbias[:, k, None]
+        m_start = m_end
+
+    fluxmod_icov_fluxmod = np.einsum("ij,ij->i", icov_fluxmod, fluxmod_wbias)
+
+    return (icov_fluxmod, fluxmod_icov_fluxmod)
+
+
+def N_covar_chi2_block(
+    fluxes,
+    fluxmod_wbias,
+    icov_diag,
+    two_icov_offdiag,
+    icov_fluxmod=None,
+    fluxmod_icov_fluxmod=None,
+):
+    """ compute the non-reduced chi2 between a block of stars and the models
+    using the full covariance matrix information computed from ASTs.
+
+    The quadratic form is expanded into a term quadratic in the observed
+    fluxes (computed from the packed products of the fluxes against the
+    packed inverse covariances), a cross term and a star independent term.
+
+    Parameters
+    ----------
+    fluxes:    np.ndarray[float, ndim=2]
+        array of fluxes (nstars, nfilters)
+
+    fluxmod_wbias: np.ndarray[float, ndim=2]
+        array of modeled fluxes (nmodels, nfilters)
+
+    icov_diag: np.ndarray[float, ndim=2]
+        array giving the diagnonal terms of the covariance matrix inverse
+
+    two_icov_offdiag: np.ndarray[float, ndim=2]
+        array giving 2x the off diagonal terms of the covariance matrix inverse
+
+    icov_fluxmod, fluxmod_icov_fluxmod: np.ndarray, optional
+        precomputed star independent terms (see N_covar_chi2_block_terms)
+
+    Returns
+    -------
+    chi2:    np.ndarray[float, ndim=2]
+        array of chi2 values (nstars, nmodels)
+    """
+    if (icov_fluxmod is None) or (fluxmod_icov_fluxmod is None):
+        icov_fluxmod, fluxmod_icov_fluxmod = N_covar_chi2_block_terms(
+            fluxmod_wbias, icov_diag, two_icov_offdiag
+        )
+
+    _fluxes = np.atleast_2d(fluxes)
+    n_filters = _fluxes.shape[1]
+
+    # products of the observed fluxes in the same order as the packed
+    #   off diagonal terms
+    indx1, indx2 = np.triu_indices(n_filters, k=1)
+
+    chi2 = np.dot(_fluxes * _fluxes, icov_diag.T)
+    chi2 += np.dot(_fluxes[:, indx1] * _fluxes[:, indx2], two_icov_offdiag.T)
+    chi2 -= 2.0 * np.dot(_fluxes, icov_fluxmod.T)
+    chi2 += fluxmod_icov_fluxmod[None, :]
+
+    # the expansion can give tiny negative values through round off
+    np.maximum(chi2, 0.0, out=chi2)
+
+    return chi2
+
+
+def N_covar_logLikelihood_block(
+    fluxes,
+    fluxmod_wbias,
+    q_norm,
+    icov_diag,
+    two_icov_offdiag,
+    icov_fluxmod=None,
+    fluxmod_icov_fluxmod=None,
+):
+    """ Computes the log of the chi2 likelihood between a block of stars
+    and the models using the full covariance matrix information.
+
+    Parameters
+    ----------
+    fluxes: np.ndarray[float, ndim=2]
+        array of fluxes (nstars, nfilters)
+
+    fluxmod_wbias: np.ndarray[float, ndim=2]
+        array of modeled fluxes + ast-derived biases (nmodels, nfilters)
+
+    q_norm: np.ndarray[float, ndim=1]
+        array givign the q normalization of the likelihood
+        q_norm = ln(1./Q) where Q = det(cov matrix)
+
+    icov_diag: np.ndarray[float, ndim=2]
+        array giving the diagnonal terms of the covariance matrix inverse
+
+    two_icov_offdiag: np.ndarray[float, ndim=2]
+        array giving 2x the off diagonal terms of the covariance matrix inverse
+
+    icov_fluxmod, fluxmod_icov_fluxmod: np.ndarray, optional
+        precomputed star independent terms (see N_covar_chi2_block_terms)
+
+    Returns
+    -------
+    (lnp, chi2)
+    lnP:    np.ndarray[float, ndim=2]
+            array of ln(P) values (nstars, nmodels)
+    chi2:    np.ndarray[float, ndim=2]
+            array of chi-squared values (nstars, nmodels)
+    """
+    n_filters = np.shape(fluxmod_wbias)[1]
+    pi_term = -0.5 * n_filters * np.log(2.0 * np.pi)
+
+    _chi2 = N_covar_chi2_block(
+        fluxes,
+        fluxmod_wbias,
+        icov_diag,
+        two_icov_offdiag,
+        icov_fluxmod=icov_fluxmod,
+        fluxmod_icov_fluxmod=fluxmod_icov_fluxmod,
+    )
+
+    lnP = pi_term + q_norm[None, :] - (0.5 * _chi2)
+
+    return (lnP, _chi2)
+
+
+class PreparedLikelihood(object):
+    """ Likelihood of the models with all the star independent terms
+    computed once.
+
+    The per model normalization (lnQ or q_norm), the prior log-weights and
+    the inverse (co)variances are prepared at creation so that each star
+    (or block of stars) only needs the chi2 computation.
+    The packed off diagonal inverse covariance terms are stored in Fortran
+    order making the per filter slices used by N_covar_chi2 contiguous.
+
+    Masks are not supported (they are not used in the fitting).
+    """
+
+    def __init__(
+        self,
+        fluxmod_wbias,
+        ivar=None,
+        q_norm=None,
+        icov_diag=None,
+        icov_offdiag=None,
+        lnprior=None,
+        model_indxs=None,
+    ):
+        """
+        Parameters
+        ----------
+        fluxmod_wbias: np.ndarray[float, ndim=2]
+            array of modeled fluxes + ast-derived biases (nmodels, nfilters)
+
+        ivar: np.ndarray[float, ndim=2]
+            array of ast-derived inverse variances (nmodels, nfilters)
+            set to use the noise model without covariances
+
+        q_norm: np.ndarray[float, ndim=1]
+            array giving the q normalization of the likelihood
+            q_norm = ln(1./Q) where Q = det(cov matrix)
+
+        icov_diag: np.ndarray[float, ndim=2]
+            array giving the diagnonal terms of the covariance matrix inverse
+
+        icov_offdiag: np.ndarray[float, ndim=2]
+            array giving the off diagonal terms of the covariance matrix inverse
+
+        lnprior: np.ndarray[float, ndim=1]
+            log of the prior weights of the models (after the model_indxs
+            selection), added to the log-likelihoods
+
+        model_indxs: np.ndarray[int, ndim=1]
+            indexes of the models to use (e.g., only the non-zero weights)
+            the outputs are for these models only
+        """
+        if model_indxs is None:
+            _sel = slice(None)
+        else:
+            _sel = model_indxs
+
+        self.fluxmod_wbias = np.asfortranarray(fluxmod_wbias[_sel])
+        n_models, n_filters = self.fluxmod_wbias.shape
+
+        if ivar is not None:
+            self.full_cov_mat = False
+            self.ivar = np.asfortranarray(ivar[_sel])
+            # lnQ = -0.5 * nj *  ln( 2 * pi) - sum_j {ln( err[j] ) }
+            lnQ = n_filters * 0.5 * np.log(2.0 * np.pi) - 0.5 * np.sum(
+                np.log(self.ivar), axis=1
+            )
+            self.lnp_norm = -lnQ
+        elif (q_norm is not None) & (icov_diag is not None) & (
+            icov_offdiag is not None
+        ):
+            self.full_cov_mat = True
+            self.icov_diag = np.asfortranarray(icov_diag[_sel])
+            self.two_icov_offdiag = np.asfortranarray(2.0 * icov_offdiag[_sel])
+            pi_term = -0.5 * n_filters * np.log(2.0 * np.pi)
+            self.lnp_norm = pi_term + q_norm[_sel]
+        else:
+            raise ValueError("ivar or q_norm, icov_diag and icov_offdiag needed")
+
+        if lnprior is not None:
+            self.lnp_norm = self.lnp_norm + lnprior
+
+        # star independent terms of the expanded chi2 (see block)
+        self._block_terms = None
+        # order of the filters for the progressive chi2
+        self._filter_order = None
+
+    def __len__(self):
+        return len(self.lnp_norm)
+
+    def prepare(self, block=False, progressive=False):
+        """ Compute the star independent terms used by block and/or
+        progressive now instead of at their first call (e.g., before the
+        likelihood is shared with worker processes, so that the workers
+        use the same copy of these terms)
+
+        Parameters
+        ----------
+        block: bool
+            compute the expanded chi2 terms used by block
+
+        progressive: bool
+            compute the order of the filters used by progressive
+
+        Returns
+        -------
+        self
+        """
+        if block and (self._block_terms is None):
+            if self.full_cov_mat:
+                self._block_terms = N_covar_chi2_block_terms(
+                    self.fluxmod_wbias, self.icov_diag, self.two_icov_offdiag
+                )
+            else:
+                self._block_terms = N_chi2_NM_block_terms(
+                    self.fluxmod_wbias, self.ivar
+                )
+
+        # most constraining filters first, based on the typical chi2
+        #   contribution of each filter over the model grid
+        if progressive and (not self.full_cov_mat) and (self._filter_order is None):
+            fluxdiff = self.fluxmod_wbias - np.median(self.fluxmod_wbias, axis=0)
+            self._filter_order = np.argsort(
+                -np.median(fluxdiff * fluxdiff * self.ivar, axis=0)
+            )
+
+        return self
+
+    def __call__(self, flux, indxs=None):
+        """ Compute the log-likelihood of one star
+
+        Parameters
+        ----------
+        flux: np.ndarray[float, ndim=1]
+            array of fluxes
+
+        indxs: np.ndarray[int, ndim=1]
+            set to only compute the log-likelihood of these models
+
+        Returns
+        -------
+        (lnp, chi2)
+        lnP:    np.ndarray[float, ndim=1]
+                array of ln(P) values including the prior (nmodels)
+        chi2:    np.ndarray[float, ndim=1]
+                array of chi-squared values (nmodels)
+        """
+        if indxs is None:
+            _sel = slice(None)
+        else:
+            _sel = indxs
+
+        if self.full_cov_mat:
+            _chi2 = N_covar_chi2(
+                flux,
+                self.fluxmod_wbias[_sel],
+                self.icov_diag[_sel],
+                self.two_icov_offdiag[_sel],
+            )
+        else:
+            _chi2 = N_chi2_NM(flux, self.fluxmod_wbias[_sel], self.ivar[_sel])
+
+        lnP = self.lnp_norm[_sel] - 0.5 * _chi2
+
+        return (lnP, _chi2)
+
+    def block(self, fluxes):
+        """ Compute the log-likelihood of a block of stars
+
+        Parameters
+        ----------
+        fluxes: np.ndarray[float, ndim=2]
+            array of fluxes (nstars, nfilters)
+
+        Returns
+        -------
+        (lnp, chi2)
+        lnP:    np.ndarray[float, ndim=2]
+                array of ln(P) values including the prior (nstars, nmodels)
+        chi2:    np.ndarray[float, ndim=2]
+                array of chi-squared values (nstars, nmodels)
+        """
+        self.prepare(block=True)
+        if self.full_cov_mat:
+            _chi2 = N_covar_chi2_block(
+                fluxes,
+                self.fluxmod_wbias,
+                self.icov_diag,
+                self.two_icov_offdiag,
+                icov_fluxmod=self._block_terms[0],
+                fluxmod_icov_fluxmod=self._block_terms[1],
+            )
+        else:
+            _chi2 = N_chi2_NM_block(
+                fluxes,
+                self.fluxmod_wbias,
+                self.ivar,
+                ivar_fluxmod=self._block_terms[0],
+                fluxmod2_ivar=self._block_terms[1],
+            )
+
+        lnP = self.lnp_norm[None, :] - 0.5 * _chi2
+
+        return (lnP, _chi2)
+
+    def progressive(self, flux, threshold, indxs=None, n_ref=8):
+        """ Compute the log-likelihood of one star only for the models that
+        pass the sparse likelihood threshold.
+
+        The chi2 is accumulated one filter at a time, most constraining
+        filter first.  As the per filter terms are positive,
+        lnp_norm - 0.5 * partial chi2 is an upper bound on the lnp of a
+        model and the models with this bound below the lnp of the best
+        reference model plus the threshold are dropped after each filter.
+        The reference models are the n_ref models with the highest bound
+        after the first filter.
+
+        Only for the noise model without covariances, with the full
+        covariance matrix the log-likelihood of all the models is returned.
+
+        Parameters
+        ----------
+        flux: np.ndarray[float, ndim=1]
+            array of fluxes
+
+        threshold: float
+            threshold on lnp - max(lnp) defining the sparse likelihood
+
+        indxs: np.ndarray[int, ndim=1]
+            set to only consider these models (sorted)
+
+        n_ref: int
+            number of reference models
+
+        Returns
+        -------
+        (indxs, lnp, chi2)
+        indxs:  np.ndarray[int, ndim=1]
+                sorted indexes of the models kept, includes all the models
+                passing the threshold
+        lnP:    np.ndarray[float, ndim=1]
+                array of ln(P) values including the prior (nkept)
+        chi2:    np.ndarray[float, ndim=1]
+                array of chi-squared values (nkept)
+        """
+        if indxs is None:
+            indxs = np.arange(len(self))
+
+        if self.full_cov_mat or (len(indxs) <= n_ref):
+            (lnP, _chi2) = self(flux, indxs=indxs)
+            return (indxs, lnP, _chi2)
+
+        self.prepare(progressive=True)
+        _chi2 = np.zeros(len(indxs))
+        lnp_min = -np.inf
+        for i, k in enumerate(self._filter_order):
+            if i > 0:
+                # drop the models that cannot pass the threshold
+                (gindxs,) = np.where(lnP > lnp_min)
+                indxs = indxs[gindxs]
+                _chi2 = _chi2[gindxs]
+
+            temp = flux[k] - self.fluxmod_wbias[indxs, k]
+            _chi2 += temp * temp * self.ivar[indxs, k]
+            lnP = self.lnp_norm[indxs] - 0.5 * _chi2
+
+            if i == 0:
+                # full log-likelihood of the reference models
+                #   small margin for the rounding in the chi2 sums
+                rindxs = np.argpartition(-lnP, n_ref)[:n_ref]
+                (ref_lnP, _) = self(flux, indxs=indxs[rindxs])
+                lnp_min = np.max(ref_lnP) + threshold
+                lnp_min -= 1e-8 * (1.0 + abs(lnp_min))
+                if not np.isfinite(lnp_min):
+                    lnp_min = -np.inf
+
+        (gindxs,) = np.where(lnP > lnp_min)
+        return (indxs[gindxs], lnP[gindxs], _chi2[gindxs])
+
+
 def getNorm_lnP(lnP):
     """ Compute the norm of a log-likelihood
     To make sure we don't have overflows, we normalize the sum by its max
@@ -0,0 +1,263 @@
+"""
+Files with the sparse likelihoods (lnp) of the stars
+
+Columnar ragged layout: the sparse lnp values of all the stars are
+concatenated in the idx, lnp and chi2 datasets (plus any other per model
+column, e.g., subgrid for merged files), the values for the k-th star in
+the file being at offsets[k]:offsets[k + 1].  star_indx gives the index
+of each star in the catalog and input the observed fluxes.  All these
+datasets are chunked, compressed and extendable, so blocks of stars are
+appended without touching the previous ones, and all the stars are read
+with a few bulk reads.
+
+The legacy layout with one group per star (star_#, each with the idx,
+lnp, chi2 and input arrays) is still read.
+"""
+import numpy as np
+import h5py
+import tables
+
+__all__ = [
+    "is_ragged_lnp",
+    "create_lnp_file",
+    "append_lnp",
+    "read_lnp_file",
+    "write_lnp_file",
+    "select_lnp_stars",
+]
+
+# types of the per model columns written by the fitting
+lnp_columns = {"idx": np.int64, "lnp": np.float32, "chi2": np.float32}
+
+_lnp_filters = tables.Filters(complevel=4, complib="zlib", shuffle=True)
+
+
+def is_ragged_lnp(lnp_hdf):
+    """
+    Check if an open lnp file (h5py or tables) has the columnar layout
+    """
+    if isinstance(lnp_hdf, tables.File):
+        return "/offsets" in lnp_hdf
+    return "offsets" in lnp_hdf
+
+
+def create_lnp_file(
+    filename, n_filters, grid_waves=None, obs_filters=None, columns=None
+):
+    """
+    Create an empty lnp file with the columnar layout
+
+    Parameters
+    ----------
+    filename : str
+        name of the file (overwritten if it exists)
+    n_filters : int
+        number of observed fluxes per star (None to not save them)
+    grid_waves : ndarray, optional
+        wavelengths of the model grid
+    obs_filters : list of str, optional
+        names of the observed filters
+    columns : dict, optional
+        name: type of the per model columns (default: idx, lnp, chi2)
+    """
+    if columns is None:
+        columns = lnp_columns
+
+    with tables.open_file(filename, "w") as outfile:
+        if grid_waves is not None:
+            outfile.create_array(outfile.root, "grid_waves", grid_waves)
+        if obs_filters is not None:
+            outfile.create_array(outfile.root, "obs_filters", obs_filters)
+
+        for cname, ctype in columns.items():
+            outfile.create_earray(
+                outfile.root,
+                cname,
+                atom=tables.Atom.from_dtype(np.dtype(ctype)),
+                shape=(0,),
+                filters=_lnp_filters,
+                expectedrows=1000000,
+            )
+        offsets = outfile.create_earray(
+            outfile.root,
+            "offsets",
+            atom=tables.Int64Atom(),
+            shape=(0,),
+            filters=_lnp_filters,
+        )
+        offsets.append(np.zeros(1, dtype=np.int64))
+        outfile.create_earray(
+            outfile.root,
+            "star_indx",
+            atom=tables.Int64Atom(),
+            shape=(0,),
+            filters=_lnp_filters,
+        )
+        if n_filters is not None:
+            outfile.create_earray(
+                outfile.root,
+                "input",
+                atom=tables.Float64Atom(),
+                shape=(0, n_filters),
+                filters=_lnp_filters,
+            )
+
+
+def append_lnp(filename, lnp_data):
+    """
+    Append stars to an lnp file with the columnar layout
+
+    Stars with an index not larger than the last star already in the file
+    are skipped (e.g., stars saved again when resuming a run).
+
+    Parameters
+    ----------
+    filename : str
+        name of the file
+    lnp_data : dict
+        star_indx, offsets (starting at 0), input and the per model columns
+        of the stars to append (see read_lnp_file)
+    """
+    with tables.open_file(filename, "a") as outfile:
+        root = outfile.root
+        n_prev = root.offsets[-1]
+
+        star_indx = np.asarray(lnp_data["star_indx"], dtype=np.int64)
+        offsets = np.asarray(lnp_data["offsets"], dtype=np.int64)
+        first = 0
+        if root.star_indx.nrows > 0:
+            first = np.searchsorted(star_indx, root.star_indx[-1], side="right")
+        if first >= len(star_indx):
+            return
+
+        sel = slice(offsets[first], offsets[-1])
+        for cnode in root._f_iter_nodes("EArray"):
+            cname = cnode.name
+            if cname in ["offsets", "star_indx", "input"]:
+                continue
+            cnode.append(np.asarray(lnp_data[cname][sel], dtype=cnode.dtype))
+        root.offsets.append(n_prev + offsets[first + 1 :] - offsets[first])
+        root.star_indx.append(star_indx[first:])
+        if "/input" in outfile:
+            root.input.append(np.asarray(lnp_data["input"][first:], dtype=float))
+
+
+def read_lnp_file(filename):
+    """
+    Read all the stars in an lnp file, columnar or legacy layout
+
+    For the legacy layout, the stars are in the order of the groups
+    in the file.
+
+    Parameters
+    ----------
+    filename : str
+        name of the file
+
+    Returns
+    -------
+    lnp_data : dict
+        star_indx : index of the stars in the catalog (nstars)
+        offsets : start of the values of each star in the per model
+            columns, plus the total length (nstars + 1)
+        input : observed fluxes (nstars, nfilters), if in the file
+        the per model columns (idx, lnp, chi2, ...) concatenated over the stars
+    """
+    lnp_data = {}
+    with h5py.File(filename, "r") as lnp_hdf:
+        if is_ragged_lnp(lnp_hdf):
+            for cname, cdata in lnp_hdf.items():
+                if cname not in ["grid_waves", "obs_filters"]:
+                    lnp_data[cname] = cdata[()]
+        else:
+            star_key_list = [sname for sname in lnp_hdf.keys() if "star" in sname]
+            lnp_data["star_indx"] = np.array(
+                [int(sname.split("_")[-1]) for sname in star_key_list], dtype=np.int64
+            )
+            sizes = [lnp_hdf[sname]["lnp"].shape[0] for sname in star_key_list]
+            lnp_data["offsets"] = np.concatenate([[0], np.cumsum(sizes)]).astype(
+                np.int64
+            )
+            if len(star_key_list) > 0:
+                cnames = list(lnp_hdf[star_key_list[0]].keys())
+                for cname in cnames:
+                    cvals = [lnp_hdf[sname][cname][()] for sname in star_key_list]
+                    if cname == "input":
+                        lnp_data[cname] = np.array([np.ravel(cval) for cval in cvals])
+                    else:
+                        lnp_data[cname] = np.concatenate(cvals)
+
+    return lnp_data
+
+
+def write_lnp_file(filename, lnp_data, grid_waves=None, obs_filters=None):
+    """
+    Write stars to a new lnp file with the columnar layout
+
+    Parameters
+    ----------
+    filename : str
+        name of the file (overwritten if it exists)
+    lnp_data : dict
+        stars to write (see read_lnp_file)
+    grid_waves : ndarray, optional
+        wavelengths of the model grid
+    obs_filters : list of str, optional
+        names of the observed filters
+    """
+    columns = {
+        cname: cdata.dtype
+        for cname, cdata in lnp_data.items()
+        if cname not in ["star_indx", "offsets", "input"]
+    }
+    n_filters = None
+    if "input" in lnp_data:
+        n_filters = lnp_data["input"].shape[1]
+    create_lnp_file(
+        filename,
+        n_filters,
+        grid_waves=grid_waves,
+        obs_filters=obs_filters,
+        columns=columns,
+    )
+    # written directly as star_indx may not be increasing (e.g., legacy files)
+    with tables.open_file(filename, "a") as outfile:
+        root = outfile.root
+        for cname in columns.keys():
+            getattr(root, cname).append(lnp_data[cname])
+        root.offsets.append(np.asarray(lnp_data["offsets"][1:], dtype=np.int64))
+        root.star_indx.append(np.asarray(lnp_data["star_indx"], dtype=np.int64))
+        if n_filters is not None:
+            root.input.append(np.asarray(lnp_data["input"], dtype=float))
+
+
+def select_lnp_stars(lnp_data, indxs):
+    """
+    Select stars from lnp data
+
+    Parameters
+    ----------
+    lnp_data : dict
+        lnp data (see read_lnp_file)
+    indxs : ndarray
+        positions of the stars in lnp_data to select (in this order)
+
+    Returns
+    -------
+    lnp_data : dict
+        lnp data of the selected stars
+    """
+    offsets = lnp_data["offsets"]
+    sizes = offsets[1:][indxs] - offsets[:-1][indxs]
+    new_offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    pos = np.repeat(offsets[:-1][indxs] - new_offsets[:-1], sizes) + np.arange(
+        new_offsets[-1]
+    )
+
+    new_lnp_data = {"offsets": new_offsets}
+    for cname, cdata in lnp_data.items():
+        if cname in ["star_indx", "input"]:
+            new_lnp_data[cname] = cdata[indxs]
+        elif cname != "offsets":
+            new_lnp_data[cname] = cdata[pos]
+    return new_lnp_data
@@ -0,0 +1,197 @@
+# class to generate all the 1D/2D PDFs and expectation values for many
+#  objects all with sparse nD likelihoods on the same grid of models
+import copy
+
+import numpy as np
+from scipy import sparse
+
+__all__ = ["MarginalProjection", "concatenate_projections"]
+
+
+class MarginalProjection:
+    def __init__(self, n_gridvals, pdf1d_objs, pdf2d_objs=None, exp_gridvals=None):
+        """
+        Create a sparse projection operator that gives all the 1D PDFs,
+        2D PDFs and expectation values of an object from one
+        sparse product with its nD probabilities
+
+        The operator is a CSR matrix with one row per grid point and one
+        column per output (1D PDF bins for each pdf1d, 2D PDF bins for each
+        pdf2d, one column per expectation value and a column giving the
+        sum of the weights).  The sparse weights of a block of objects are
+        a CSR matrix with one row per object, and their product with the
+        operator only touches the grid points in the sparse likelihoods.
+
+        Parameters
+        ----------
+        n_gridvals : int
+            number of grid points
+        pdf1d_objs : list of pdf1d objects
+            1D pdf mappings
+        pdf2d_objs : list of pdf2d objects, optional
+            2D pdf mappings
+        exp_gridvals : list of ndarrays, optional
+            1D `float` arrays with the values of the quantities for all
+            the grid points, one per expectation value
+        """
+        self.n_gridvals = n_gridvals
+        if pdf2d_objs is None:
+            pdf2d_objs = []
+        if exp_gridvals is None:
+            exp_gridvals = []
+
+        self.n_pdf1d = len(pdf1d_objs)
+        self.n_pdf2d = len(pdf2d_objs)
+        self.n_exp = len(exp_gridvals)
+
+        rows = []
+        cols = []
+        vals = []
+        all_indxs = np.arange(n_gridvals)
+
+        # 1D PDF bins
+        self.pdf1d_slices = []
+        n_cols = 0
+        for cpdf1d in pdf1d_objs:
+            if not cpdf1d.bad:
+                (cindxs,) = np.where(cpdf1d.bin_indx < cpdf1d.nbins)
+                rows.append(cindxs)
+                cols.append(n_cols + cpdf1d.bin_indx[cindxs])
+                vals.append(np.ones(len(cindxs)))
+            self.pdf1d_slices.append(slice(n_cols, n_cols + cpdf1d.nbins))
+            n_cols += cpdf1d.nbins
+
+        # 2D PDF bins
+        self.pdf2d_slices = []
+        self.pdf2d_shapes = []
+        for cpdf2d in pdf2d_objs:
+            (cindxs,) = np.where(cpdf2d.bin_indx < cpdf2d.n_bins)
+            rows.append(cindxs)
+            cols.append(n_cols + cpdf2d.bin_indx[cindxs])
+            vals.append(np.ones(len(cindxs)))
+            self.pdf2d_slices.append(slice(n_cols, n_cols + cpdf2d.n_bins))
+            self.pdf2d_shapes.append((cpdf2d.nbins_p1, cpdf2d.nbins_p2))
+            n_cols += cpdf2d.n_bins
+
+        # expectation values and the sum of the weights for the normalization
+        self.exp_slice = slice(n_cols, n_cols + self.n_exp)
+        for k, cgridvals in enumerate(exp_gridvals):
+            rows.append(all_indxs)
+            cols.append(np.full(n_gridvals, n_cols + k))
+            vals.append(np.asarray(cgridvals, dtype=float))
+        n_cols += self.n_exp
+
+        self.norm_col = n_cols
+        rows.append(all_indxs)
+        cols.append(np.full(n_gridvals, self.norm_col))
+        vals.append(np.ones(n_gridvals))
+        n_cols += 1
+
+        self.n_cols = n_cols
+        self.operator = sparse.csr_matrix(
+            (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(n_gridvals, n_cols),
+        )
+
+    def take(self, indxs):
+        """
+        Projection for a subset of the grid points
+
+        Parameters
+        ----------
+        indxs : ndarray
+            1D `int` array with the indxs of the grid points to keep,
+            the grid points of the new projection being in this order
+
+        Returns
+        -------
+        proj : MarginalProjection
+            projection with the same outputs for the selected grid points
+        """
+        proj = copy.copy(self)
+        proj.operator = self.operator[indxs]
+        proj.n_gridvals = len(indxs)
+        return proj
+
+    def gridvals(self, gindxs):
+        """
+        Values of the quantities of the expectation values at grid points
+
+        Parameters
+        ----------
+        gindxs : ndarray
+            1D `int` array with the indxs of the grid points
+
+        Returns
+        -------
+        vals : ndarray
+            2D `float` array with the values (len(gindxs), n_exp)
+        """
+        return self.operator[gindxs][:, self.exp_slice].toarray()
+
+    def gen_block(self, gindxs, weights):
+        """
+        Compute the 1D PDFs, 2D PDFs and expectation values for many
+        objects at once based on their sparse nD probabilities
+
+        Parameters
+        ----------
+        gindxs : list of ndarrays
+            1D `int` arrays with the indxs of the weights in the full model
+            grid, one per object
+        weights : list of ndarrays
+            1D `float` arrays with the fit probabilities (likelihood*prior)
+            at each grid point, one per object
+
+        Returns
+        -------
+        exp_vals : ndarray
+            2D `float` array giving the expectation values (nobjects, n_exp)
+        pdf1d_vals : list of ndarrays
+            2D `float` arrays giving the 1D pPDF values (nobjects, nbins),
+            one per pdf1d
+        pdf2d_vals : list of ndarrays
+            3D `float` arrays giving the 2D pPDF values
+            (nobjects, nbins_p1, nbins_p2), one per pdf2d
+        """
+        n_objs = len(gindxs)
+
+        # sparse weights, one row per object
+        n_per_obj = [len(cindxs) for cindxs in gindxs]
+        indptr = np.concatenate([[0], np.cumsum(n_per_obj)])
+        sparse_weights = sparse.csr_matrix(
+            (np.concatenate(weights), np.concatenate(gindxs), indptr),
+            shape=(n_objs, self.n_gridvals),
+        )
+
+        proj = (sparse_weights @ self.operator).toarray()
+
+        exp_vals = proj[:, self.exp_slice] / proj[:, self.norm_col, None]
+        pdf1d_vals = [proj[:, cslice] for cslice in self.pdf1d_slices]
+        pdf2d_vals = [
+            proj[:, cslice].reshape((n_objs,) + cshape)
+            for cslice, cshape in zip(self.pdf2d_slices, self.pdf2d_shapes)
+        ]
+
+        return (exp_vals, pdf1d_vals, pdf2d_vals)
+
+
+def concatenate_projections(projs):
+    """
+    Concatenate the grid points of projections with the same outputs
+
+    Parameters
+    ----------
+    projs : list of MarginalProjection
+        projections with the same 1D/2D PDF bins and expectation values,
+        e.g., for different chunks of a model grid
+
+    Returns
+    -------
+    proj : MarginalProjection
+        projection for all the grid points, in order
+    """
+    proj = copy.copy(projs[0])
+    proj.operator = sparse.vstack([cproj.operator for cproj in projs], format="csr")
+    proj.n_gridvals = proj.operator.shape[0]
+    return proj
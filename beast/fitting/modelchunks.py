@@ -0,0 +1,232 @@
+"""
+Model grids and noise models read in chunks of models
+
+Used to fit grids that do not fit in memory: the model fluxes, grid
+properties and noise model are read from the HDF5 files one chunk of
+models at a time, so only one chunk is in memory at once.  Several grids
+(e.g., the subgrids of a split grid) are read one after the other as one
+grid, the index of a model being its position in the concatenated grids.
+"""
+import math
+
+import numpy as np
+import h5py
+
+from beast.physicsmodel import grid
+from beast.physicsmodel.helpers.hdfstore import HDFStore
+from beast.physicsmodel.helpers.gridstats import read_grid_stats
+from beast.physicsmodel.helpers.gridcolumns import open_grid_table
+from beast.observationmodel.noisemodel.compact import (
+    CompactNoiseModel,
+    is_compact_noisemodel,
+)
+
+__all__ = ["ModelChunks"]
+
+# per model noise model arrays needed for the fitting
+_noise_keys = ["error", "bias", "q_norm", "icov_diag", "icov_offdiag"]
+
+
+class ModelChunks(object):
+    """ Model grids and noise models read from disk in chunks of models """
+
+    def __init__(self, sedgrid_fnames, noise_fnames, chunk_size=None):
+        """
+        Parameters
+        ----------
+        sedgrid_fnames : str or list of str
+            model grid file(s) (HDF5)
+        noise_fnames : str or list of str
+            noise model file for each model grid (HDF5), compact noise
+            models are evaluated on the fluxes of each chunk
+        chunk_size : int, optional
+            number of models per chunk (default is one chunk per grid file)
+        """
+        if isinstance(sedgrid_fnames, str):
+            sedgrid_fnames = [sedgrid_fnames]
+        if isinstance(noise_fnames, str):
+            noise_fnames = [noise_fnames]
+        if len(sedgrid_fnames) != len(noise_fnames):
+            raise ValueError("one noise model file is needed per model grid file")
+
+        self.sedgrid_fnames = list(sedgrid_fnames)
+        self.noise_fnames = list(noise_fnames)
+        self.chunk_size = chunk_size
+
+        # only the file names are kept, the files are opened when reading
+        g0 = grid.FileSEDGrid(self.sedgrid_fnames[0], backend="hdf")
+        self.filters = g0.filters
+        self.lamb = g0.lamb.read()
+        self.grid_keys = g0.keys()
+        g0.store.close_source(force=True)
+
+        self.n_models_grids = []
+        for fname in self.sedgrid_fnames:
+            with HDFStore(fname, mode="r") as hd:
+                self.n_models_grids.append(hd["/seds"].shape[0])
+        self.offsets = np.concatenate([[0], np.cumsum(self.n_models_grids)])
+
+        if is_compact_noisemodel(self.noise_fnames[0]):
+            nkeys = CompactNoiseModel(self.noise_fnames[0]).keys()
+        else:
+            with h5py.File(self.noise_fnames[0], "r") as nfile:
+                nkeys = list(nfile.keys())
+        self.noise_keys = [ckey for ckey in _noise_keys if ckey in nkeys]
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def keys(self):
+        """ names of the grid properties """
+        return self.grid_keys
+
+    @property
+    def has_full_cov(self):
+        """ True if the noise models include the full covariance matrices """
+        return all(
+            ckey in self.noise_keys for ckey in ["q_norm", "icov_diag", "icov_offdiag"]
+        )
+
+    def chunks(self):
+        """
+        Read the chunks of models in order
+
+        Yields
+        ------
+        chunk : dict
+            start : index of the first model of the chunk
+            seds : model fluxes (nmodels, nfilters)
+            grid : grid properties (structured ndarray, nmodels)
+            the noise model arrays (error, bias and, if in the noise
+            model files, q_norm, icov_diag and icov_offdiag)
+        """
+        for fname, noise_fname, offset, n_models in zip(
+            self.sedgrid_fnames, self.noise_fnames, self.offsets, self.n_models_grids
+        ):
+            size = n_models if self.chunk_size is None else self.chunk_size
+            if is_compact_noisemodel(noise_fname):
+                compact_noise = CompactNoiseModel(noise_fname)
+                nfile = None
+            else:
+                compact_noise = None
+                nfile = h5py.File(noise_fname, "r")
+            try:
+                with HDFStore(fname, mode="r") as hd:
+                    seds = hd["/seds"]
+                    grid_table = open_grid_table(hd)
+                    for start in range(0, n_models, size):
+                        stop = min(start + size, n_models)
+                        chunk = {
+                            "start": int(offset + start),
+                            "seds": seds[start:stop],
+                            "grid": grid_table.read(start, stop),
+                        }
+                        if compact_noise is not None:
+                            chunk_noise = compact_noise.evaluate(chunk["seds"])
+                            for ckey in self.noise_keys:
+                                chunk[ckey] = chunk_noise[ckey]
+                        else:
+                            for ckey in self.noise_keys:
+                                chunk[ckey] = nfile[ckey][start:stop]
+                        yield chunk
+            finally:
+                if nfile is not None:
+                    nfile.close()
+
+    def lnweight_sum(self):
+        """
+        Log of the sum of the positive prior weights of all the models
+        """
+        weight_sum = 0.0
+        for fname in self.sedgrid_fnames:
+            with HDFStore(fname, mode="r") as hd:
+                grid_table = open_grid_table(hd)
+                n_models = grid_table.nrows
+                size = n_models if self.chunk_size is None else self.chunk_size
+                for start in range(0, n_models, size):
+                    weights = grid_table.read(start, start + size, field="weight")
+                    weight_sum += weights[weights > 0.0].sum()
+        return np.log(weight_sum)
+
+    def grid_info(self, qnames, cap_unique=1000):
+        """
+        Range and number of unique values of quantities over all the models
+
+        Parameters
+        ----------
+        qnames : list of str
+            names of the grid properties, and of the full model fluxes
+            ('symlog' + filter + '_wd_bias', as defined in fit.py)
+        cap_unique : int
+            stop counting the unique values of a quantity at this number
+
+        The statistics stored with the grid files are used for the grid
+        properties when available (see beast.physicsmodel.helpers.gridstats).
+
+        Returns
+        -------
+        info_dict : dict
+            {name of quantity: {'min': min, 'max': max, 'num_unique': n}}
+            (as given by beast.tools.subgridding_tools.reduce_grid_info)
+        """
+        info_min = {}
+        info_max = {}
+        info_unique = {}
+
+        # grid properties with statistics stored in all the grid files
+        #   (the flux ranges depend on the noise model and are computed)
+        files_stats = [read_grid_stats(fname) for fname in self.sedgrid_fnames]
+        stored_qnames = []
+        for qname in qnames:
+            qstats = [cstats.get(qname, None) for cstats in files_stats]
+            if ("_bias" not in qname) and all(
+                (cstat is not None)
+                and (cstat["nrows"] == n_models)
+                and ((not cstat["capped"]) or (cstat["cap_unique"] >= cap_unique))
+                for cstat, n_models in zip(qstats, self.n_models_grids)
+            ):
+                stored_qnames.append(qname)
+                info_min[qname] = min(cstat["min"] for cstat in qstats)
+                info_max[qname] = max(cstat["max"] for cstat in qstats)
+                info_unique[qname] = qstats[0]["unique"]
+                for cstat in qstats[1:]:
+                    if len(info_unique[qname]) < cap_unique:
+                        info_unique[qname] = np.union1d(
+                            info_unique[qname], cstat["unique"]
+                        )
+        scan_qnames = [qname for qname in qnames if qname not in stored_qnames]
+
+        for chunk in self.chunks() if len(scan_qnames) > 0 else []:
+            full_model_flux = None
+            for qname in scan_qnames:
+                if "_bias" in qname:
+                    if full_model_flux is None:
+                        model_seds_with_bias = chunk["seds"] + chunk["bias"]
+                        full_model_flux = (
+                            np.sign(model_seds_with_bias)
+                            * np.log1p(np.abs(model_seds_with_bias * math.log(10)))
+                            / math.log(10)
+                        )
+                    fname = (qname.replace("_wd_bias", "")).replace("symlog", "")
+                    qvals = full_model_flux[:, self.filters.index(fname)]
+                else:
+                    qvals = chunk["grid"][qname]
+
+                if qname not in info_min:
+                    info_min[qname] = qvals.min()
+                    info_max[qname] = qvals.max()
+                    info_unique[qname] = np.unique(qvals)
+                else:
+                    info_min[qname] = min(info_min[qname], qvals.min())
+                    info_max[qname] = max(info_max[qname], qvals.max())
+                    if len(info_unique[qname]) < cap_unique:
+                        info_unique[qname] = np.union1d(info_unique[qname], qvals)
+
+        return {
+            qname: {
+                "min": info_min[qname],
+                "max": info_max[qname],
+                "num_unique": len(info_unique[qname]),
+            }
+            for qname in qnames
+        }
@@ -0,0 +1,155 @@
+"""
+Flux-space index of the model grid
+
+Gives for each star a superset of the models that can be within the
+sparse likelihood threshold of its best fit model, so that the exact
+likelihood only needs to be computed for these candidate models.
+
+The bound is based on the chi2 of a model always being larger than the
+per filter term (f_obs - f_mod)^2 / var_f, where var_f is the diagonal
+of the model covariance matrix (for the full covariance noise model this
+follows from the Cauchy-Schwarz inequality).  A model can only pass the
+threshold if its chi2 <= 2 (lnp_norm - lnp_max - threshold), where
+lnp_norm includes the Q normalization and the prior, and lnp_max is
+bounded from below by the lnp of a few models close to the star.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+__all__ = ["ModelFluxIndex"]
+
+
+def _covar_diag(icov_diag, two_icov_offdiag, chunk_size=10000):
+    """
+    Diagonal of the covariance matrices given the packed inverse
+    covariance matrices (same packing as N_covar_chi2)
+    """
+    n_models, n_filters = icov_diag.shape
+    iu, ju = np.triu_indices(n_filters, k=1)
+    fdiag = np.arange(n_filters)
+    var = np.empty((n_models, n_filters))
+    for i in range(0, n_models, chunk_size):
+        csel = slice(i, min(i + chunk_size, n_models))
+        icov = np.empty((csel.stop - i, n_filters, n_filters))
+        icov[:, fdiag, fdiag] = icov_diag[csel]
+        icov[:, iu, ju] = 0.5 * two_icov_offdiag[csel]
+        icov[:, ju, iu] = 0.5 * two_icov_offdiag[csel]
+        var[csel] = np.diagonal(np.linalg.inv(icov), axis1=1, axis2=2)
+    return var
+
+
+class ModelFluxIndex(object):
+    """ Per filter sorted model fluxes grouped in blocks with the maximum
+    variance and lnp normalization of each block, and a k-d tree over a
+    subsample of the models used to find reference models for a star.
+    """
+
+    def __init__(self, likelihood, block_size=256, n_seeds=8, n_tree=65536):
+        """
+        Parameters
+        ----------
+        likelihood : PreparedLikelihood
+            likelihood of the models
+
+        block_size : int
+            number of models per block in the sorted fluxes, the candidates
+            are the union of whole blocks
+
+        n_seeds : int
+            number of models close to the star used to bound the maximum
+            lnp of the star
+
+        n_tree : int
+            maximum number of models in the k-d tree used to find the
+            models close to the star
+        """
+        self.likelihood = likelihood
+        self.block_size = block_size
+        self.n_seeds = n_seeds
+
+        fluxmod = likelihood.fluxmod_wbias
+        n_models, n_filters = fluxmod.shape
+        if likelihood.full_cov_mat:
+            var = _covar_diag(likelihood.icov_diag, likelihood.two_icov_offdiag)
+        else:
+            var = 1.0 / likelihood.ivar
+
+        # sorted fluxes and per block bounds for each filter
+        starts = np.arange(0, n_models, block_size)
+        ends = np.minimum(starts + block_size, n_models)
+        self.block_starts = starts
+        self.block_ends = ends
+        self.sort_indxs = np.empty((n_models, n_filters), dtype=np.int64)
+        self.block_minflux = np.empty((len(starts), n_filters))
+        self.block_maxflux = np.empty((len(starts), n_filters))
+        self.block_maxvar = np.empty((len(starts), n_filters))
+        self.block_maxnorm = np.empty((len(starts), n_filters))
+        for k in range(n_filters):
+            sindxs = np.argsort(fluxmod[:, k], kind="stable")
+            sflux = fluxmod[sindxs, k]
+            self.sort_indxs[:, k] = sindxs
+            self.block_minflux[:, k] = sflux[starts]
+            self.block_maxflux[:, k] = sflux[ends - 1]
+            self.block_maxvar[:, k] = np.maximum.reduceat(var[sindxs, k], starts)
+            self.block_maxnorm[:, k] = np.maximum.reduceat(
+                likelihood.lnp_norm[sindxs], starts
+            )
+
+        # k-d tree in asinh scaled fluxes to find the reference models
+        self.flux_scale = np.sqrt(np.median(var, axis=0))
+        self.tree_indxs = np.arange(0, n_models, max(1, n_models // n_tree))
+        self.tree = cKDTree(self._scaled(fluxmod[self.tree_indxs]))
+
+    def __len__(self):
+        return len(self.likelihood)
+
+    def _scaled(self, flux):
+        return np.arcsinh(flux / self.flux_scale)
+
+    def candidates(self, flux, threshold):
+        """
+        Find the models that can pass the sparse likelihood threshold
+
+        Parameters
+        ----------
+        flux : np.ndarray[float, ndim=1]
+            observed fluxes of the star
+
+        threshold : float
+            threshold on lnp - max(lnp) defining the sparse likelihood
+
+        Returns
+        -------
+        indxs : np.ndarray[int, ndim=1]
+            sorted indexes of the candidate models (in the likelihood
+            models), a superset of the models passing the threshold
+        """
+        # lower bound on the max lnp from the models close to the star
+        (_, seeds) = self.tree.query(
+            self._scaled(flux), k=min(self.n_seeds, len(self.tree_indxs))
+        )
+        (lnp_seeds, _) = self.likelihood(flux, indxs=self.tree_indxs[np.atleast_1d(seeds)])
+        lnp_ref = np.max(lnp_seeds)
+        if not np.isfinite(lnp_ref):
+            return np.arange(len(self))
+
+        # blocks in each filter that can have models with
+        #   (f_obs - f_mod)^2 <= var * 2 (lnp_norm - lnp_ref - threshold)
+        # small margin for the rounding in the chi2 computation
+        dflux = np.maximum(
+            self.block_minflux - flux[None, :], flux[None, :] - self.block_maxflux
+        )
+        dflux = np.maximum(dflux, 0.0)
+        chi2_max = 2.0 * (self.block_maxnorm - lnp_ref - threshold)
+        good = (chi2_max >= 0) & (
+            dflux ** 2 <= (1.0 + 1e-6) * self.block_maxvar * chi2_max
+        )
+
+        # the filter with the fewest candidates gives the candidate models
+        n_cand = np.sum(good * (self.block_ends - self.block_starts)[:, None], axis=0)
+        k = np.argmin(n_cand)
+        (gblocks,) = np.where(good[:, k])
+        n_block = self.block_ends[gblocks] - self.block_starts[gblocks]
+        spos = np.repeat(self.block_starts[gblocks] - np.cumsum(n_block) + n_block, n_block)
+        spos += np.arange(len(spos))
+        return np.sort(self.sort_indxs[spos, k])
@@ -61,18 +61,14 @@ class pdf1d:
             )
 
             # get PDF bin associated with each grid val
+            #   grid vals outside of the bins are set to the overflow bin
+            #   (index nbins) that is dropped when generating the PDFs
             pdf_bin_num = np.digitize(tgridvals, self.bin_edges)
-
-            # array to hold indices for each bin
-            # (like the IDL version returned by the histogram function)
-            pdf_bin_indxs = []
-
-            for i in range(nbins):
-                # find the indicies for the current bin
-                cur_bin_indxs, = np.where(pdf_bin_num == (i + 1))
-
-                # save them
-                pdf_bin_indxs.append(cur_bin_indxs)
+            self.bin_indx = np.where(
+                (pdf_bin_num >= 1) & (pdf_bin_num <= self.nbins),
+                pdf_bin_num - 1,
+                self.nbins,
+            ).astype(np.int32)
 
             # transform the bin edges back to linear spacing if log spacing
             #  was asked for
@@ -80,8 +76,6 @@ class pdf1d:
                 self.bin_vals = np.power(10.0, self.bin_vals)
                 self.bin_edges = np.power(10.0, self.bin_edges)
 
-            self.pdf_bin_indxs = pdf_bin_indxs
-
     def gen1d(self, gindxs, weights):
         """
         Compute the 1D posterior PDFs based on the nD probabilities
@@ -105,11 +99,50 @@ class pdf1d:
         if self.bad:
             return (self.bin_vals, np.zeros((self.nbins)))
         else:
-            _tgrid = np.zeros(self.n_gridvals)
-            _tgrid[gindxs] = weights
-            _vals_1d = np.zeros(self.nbins)
-            for i in range(self.nbins):
-                if len(self.pdf_bin_indxs[i]) > 0:
-                    _vals_1d[i] = np.sum(_tgrid[self.pdf_bin_indxs[i]])
-
-            return (self.bin_vals, _vals_1d)
+            _vals_1d = np.bincount(
+                self.bin_indx[gindxs], weights=weights, minlength=self.nbins + 1
+            )
+
+            return (self.bin_vals, _vals_1d[: self.nbins])
+
+    def gen1d_block(self, gindxs, weights):
+        """
+        Compute the 1D posterior PDFs for many objects at once based on
+        their sparse nD probabilities
+
+        Parameters
+        ----------
+        gindxs : list of ndarrays
+            1D `int` arrays with the indxs of the weights in the full model
+            grid, one per object
+        weights : list of ndarrays
+            1D `float` arrays with the fit probabilities (likelihood*prior)
+            at each grid point, one per object
+
+        Returns
+        -------
+        bin_vals : ndarray
+            1D `float` array giving the values at the bin centers
+        vals_1d : ndarray
+            2D `float` array giving the bin pPDF values (nobjects, nbins)
+        """
+        n_objs = len(gindxs)
+        if self.bad:
+            return (self.bin_vals, np.zeros((n_objs, self.nbins)))
+        else:
+            # offset the bins of each object to get all the PDFs
+            #   from one bincount
+            n_per_obj = [len(cindxs) for cindxs in gindxs]
+            codes = self.bin_indx[np.concatenate(gindxs)] + np.repeat(
+                np.arange(n_objs) * (self.nbins + 1), n_per_obj
+            )
+            _vals_1d = np.bincount(
+                codes,
+                weights=np.concatenate(weights),
+                minlength=n_objs * (self.nbins + 1),
+            )
+
+            return (
+                self.bin_vals,
+                _vals_1d.reshape(n_objs, self.nbins + 1)[:, : self.nbins],
+            )
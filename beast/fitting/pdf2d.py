@@ -1,4 +1,4 @@
-# class to generate 1D PDFs for many objects all with
+# class to generate 2D PDFs for many objects all with
 #  spare or full nD likelihoods on the same grid of models
 import math
 import numpy as np
@@ -94,19 +94,18 @@ class pdf2d:
         pdf_bin_num_p1 = np.digitize(tgridvals_p1, self.bin_edges_p1)
         pdf_bin_num_p2 = np.digitize(tgridvals_p2, self.bin_edges_p2)
 
-        # array to hold indices for each bin
-        pdf_bin_indxs = [
-            [0 for j in range(self.nbins_p2)] for i in range(self.nbins_p1)
-        ]
-
-        for i in range(self.nbins_p1):
-            for j in range(self.nbins_p2):
-                # find the indicies for the current bin
-                (cur_bin_indxs,) = np.where(
-                    (pdf_bin_num_p1 == (i + 1)) & (pdf_bin_num_p2 == (j + 1))
-                )
-                # save them
-                pdf_bin_indxs[i][j] = cur_bin_indxs
+        # flattened 2D bin for each grid val
+        #   grid vals outside of the bins are set to the overflow bin
+        #   (index nbins_p1 * nbins_p2) that is dropped when generating the PDFs
+        self.n_bins = self.nbins_p1 * self.nbins_p2
+        self.bin_indx = np.where(
+            (pdf_bin_num_p1 >= 1)
+            & (pdf_bin_num_p1 <= self.nbins_p1)
+            & (pdf_bin_num_p2 >= 1)
+            & (pdf_bin_num_p2 <= self.nbins_p2),
+            (pdf_bin_num_p1 - 1) * self.nbins_p2 + (pdf_bin_num_p2 - 1),
+            self.n_bins,
+        ).astype(np.int32)
 
         # transform the bin edges back to linear spacing if log spacing
         #  was asked for
@@ -117,8 +116,6 @@ class pdf2d:
             self.bin_vals_p2 = np.power(10.0, self.bin_vals_p2)
             self.bin_edges_p2 = np.power(10.0, self.bin_edges_p2)
 
-        self.pdf_bin_indxs = pdf_bin_indxs
-
     def gen2d(self, gindxs, weights):
         """
         Compute the 2D posterior PDFs based on the nD probabilities
@@ -137,12 +134,46 @@ class pdf2d:
             2D `float` array giving the bin pPDF values
         """
 
-        _tgrid = np.zeros(self.n_gridvals)
-        _tgrid[gindxs] = weights
-        _vals_2d = np.zeros((self.nbins_p1, self.nbins_p2))
-        for i in range(self.nbins_p1):
-            for j in range(self.nbins_p2):
-                if len(self.pdf_bin_indxs[i][j]) > 0:
-                    _vals_2d[i, j] = np.sum(_tgrid[self.pdf_bin_indxs[i][j]])
+        _vals_2d = np.bincount(
+            self.bin_indx[gindxs], weights=weights, minlength=self.n_bins + 1
+        )
+
+        return _vals_2d[: self.n_bins].reshape(self.nbins_p1, self.nbins_p2)
+
+    def gen2d_block(self, gindxs, weights):
+        """
+        Compute the 2D posterior PDFs for many objects at once based on
+        their sparse nD probabilities
+
+        Parameters
+        ----------
+        gindxs : list of ndarrays
+            1D `int` arrays with the indxs of the weights in the full model
+            grid, one per object
+        weights : list of ndarrays
+            1D `float` arrays with the fit probabilities (likelihood*prior)
+            at each grid point, one per object
+
+        Returns
+        -------
+        vals_2d : ndarray
+            3D `float` array giving the bin pPDF values
+            (nobjects, nbins_p1, nbins_p2)
+        """
+        n_objs = len(gindxs)
+
+        # offset the bins of each object to get all the PDFs
+        #   from one bincount
+        n_per_obj = [len(cindxs) for cindxs in gindxs]
+        codes = self.bin_indx[np.concatenate(gindxs)] + np.repeat(
+            np.arange(n_objs) * (self.n_bins + 1), n_per_obj
+        )
+        _vals_2d = np.bincount(
+            codes,
+            weights=np.concatenate(weights),
+            minlength=n_objs * (self.n_bins + 1),
+        )
 
-        return _vals_2d
+        return _vals_2d.reshape(n_objs, self.n_bins + 1)[:, : self.n_bins].reshape(
+            n_objs, self.nbins_p1, self.nbins_p2
+        )
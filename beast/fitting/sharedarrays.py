@@ -0,0 +1,142 @@
+"""
+Shared memory copies of the fitting setup
+
+Used to give worker processes access to a single copy of the large arrays
+(model fluxes, inverse (co)variances, prior weights, PDF bin maps, ...)
+needed to fit the stars of a catalog.
+
+The arrays are copied into `multiprocessing.shared_memory` blocks by the
+parent process with `share`, and the workers rebuild the same structure
+as zero copy views on these blocks with `attach`.  Dicts, lists, tuples,
+scipy CSR matrices and the objects defined in beast.fitting (e.g.,
+PreparedLikelihood, MarginalProjection) are handled recursively, any
+other value is pickled with the description.
+"""
+import numpy as np
+from scipy import sparse
+
+__all__ = ["share", "attach", "release"]
+
+
+def _share_array(arr, shms):
+    """ copy an array to a new shared memory block """
+    from multiprocessing import shared_memory
+
+    order = "F" if (arr.flags.f_contiguous and not arr.flags.c_contiguous) else "C"
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    shms.append(shm)
+    sarr = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf, order=order)
+    sarr[...] = arr
+    return ("array", shm.name, arr.shape, arr.dtype.str, order)
+
+
+def share(value, shms, memo=None):
+    """
+    Copy the arrays in value to shared memory
+
+    Parameters
+    ----------
+    value : object
+        ndarray, csr_matrix, dict, list, tuple, beast.fitting object or
+        any picklable value
+    shms : list
+        the created SharedMemory blocks are appended to this list, they
+        need to be released by the caller (see release)
+    memo : dict, optional
+        descriptions of the arrays and objects already shared, by id,
+        so that values referenced multiple times are only copied once
+
+    Returns
+    -------
+    desc : tuple
+        picklable description of value to use with attach
+    """
+    if memo is None:
+        memo = {}
+    if id(value) in memo:
+        return memo[id(value)][1]
+
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        desc = _share_array(value, shms)
+    elif sparse.isspmatrix_csr(value):
+        desc = (
+            "csr",
+            value.shape,
+            share(value.data, shms, memo),
+            share(value.indices, shms, memo),
+            share(value.indptr, shms, memo),
+        )
+    elif isinstance(value, dict):
+        return ("dict", {k: share(v, shms, memo) for k, v in value.items()})
+    elif isinstance(value, (list, tuple)):
+        return (type(value).__name__, [share(v, shms, memo) for v in value])
+    elif hasattr(value, "__dict__") and type(value).__module__.startswith(
+        "beast.fitting"
+    ):
+        desc = ("object", type(value), share(value.__dict__, shms, memo)[1])
+    else:
+        return ("value", value)
+
+    # keep a reference to the value so its id is not reused
+    memo[id(value)] = (value, desc)
+    return desc
+
+
+def attach(desc, shms):
+    """
+    Rebuild a value shared with share using views on the shared memory
+
+    Parameters
+    ----------
+    desc : tuple
+        description returned by share
+    shms : list
+        the attached SharedMemory blocks are appended to this list, they
+        need to be kept while the value is in use
+
+    Returns
+    -------
+    value : object
+        value with the arrays as views on the shared memory
+    """
+    from multiprocessing import shared_memory
+
+    dtype = desc[0]
+    if dtype == "array":
+        shm = shared_memory.SharedMemory(name=desc[1])
+        shms.append(shm)
+        return np.ndarray(desc[2], dtype=np.dtype(desc[3]), buffer=shm.buf, order=desc[4])
+    elif dtype == "csr":
+        data, indices, indptr = [attach(cdesc, shms) for cdesc in desc[2:]]
+        return sparse.csr_matrix((data, indices, indptr), shape=desc[1], copy=False)
+    elif dtype == "dict":
+        return {k: attach(v, shms) for k, v in desc[1].items()}
+    elif dtype == "list":
+        return [attach(v, shms) for v in desc[1]]
+    elif dtype == "tuple":
+        return tuple(attach(v, shms) for v in desc[1])
+    elif dtype == "object":
+        obj = desc[1].__new__(desc[1])
+        obj.__dict__.update({k: attach(v, shms) for k, v in desc[2].items()})
+        return obj
+    else:
+        return desc[1]
+
+
+def release(shms, unlink=True):
+    """
+    Close (and unlink) shared memory blocks
+
+    Parameters
+    ----------
+    shms : list
+        SharedMemory blocks
+    unlink : bool
+        set to also free the shared memory (only by the process that
+        created the blocks)
+    """
+    for shm in shms:
+        shm.close()
+        if unlink:
+            shm.unlink()
+    del shms[:]
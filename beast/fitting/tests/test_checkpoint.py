@@ -0,0 +1,29 @@
+import numpy as np
+
+from beast.fitting.checkpoint import FitCheckpoint
+
+
+def test_checkpoint_append_restore(tmpdir):
+    vals = np.arange(20.0)
+    pdfs = np.arange(60.0).reshape(20, 3)
+
+    checkpoint = FitCheckpoint(str(tmpdir.join("fit_checkpoint")))
+    assert not checkpoint.exists()
+    checkpoint.start()
+    checkpoint.append(0, 5, {"vals": vals[0:5], "pdfs": pdfs[0:5]})
+    checkpoint.append(5, 12, {"vals": vals[5:12], "pdfs": pdfs[5:12]})
+
+    # incomplete journal line from a run that died while writing
+    with open(checkpoint.journal_name, "a") as journal:
+        journal.write("chunk_12_20.npz 12")
+
+    assert checkpoint.exists()
+    rvals = np.zeros(20)
+    rpdfs = np.zeros((20, 3))
+    assert checkpoint.restore({"vals": rvals, "pdfs": rpdfs}) == 12
+    np.testing.assert_array_equal(rvals[:12], vals[:12])
+    np.testing.assert_array_equal(rpdfs[:12], pdfs[:12])
+    assert np.all(rvals[12:] == 0.0)
+
+    checkpoint.remove()
+    assert not checkpoint.exists()
@@ -0,0 +1,21 @@
+import numpy as np
+
+from beast.fitting.fit_metrics import percentile, percentile_block
+
+
+def test_percentile_block():
+    rng = np.random.RandomState(1234)
+    bin_vals = np.linspace(-1.0, 3.0, 25)
+    pdfs = rng.uniform(size=(10, 25))
+    # include zero weight bins
+    pdfs[pdfs < 0.4] = 0.0
+    p = [2.5, 16.0, 50.0, 84.0, 97.5]
+
+    block_vals = percentile_block(bin_vals, p, pdfs)
+    assert block_vals.shape == (10, 5)
+
+    # should be identical to the single object version
+    for k in range(10):
+        np.testing.assert_array_equal(
+            block_vals[k], percentile(bin_vals, p, weights=pdfs[k])
+        )
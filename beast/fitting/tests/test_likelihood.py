@@ -0,0 +1,95 @@
+import numpy as np
+
+from beast.fitting.fit_metrics.likelihood import (
+    N_logLikelihood_NM,
+    N_covar_logLikelihood,
+    N_logLikelihood_NM_block,
+    N_covar_logLikelihood_block,
+    PreparedLikelihood,
+)
+
+
+def _simple_models(n_models=200, n_filters=5, n_stars=6):
+    rng = np.random.RandomState(1234)
+    fluxmod = rng.uniform(1.0, 5.0, size=(n_models, n_filters)) * 1e-18
+    error = rng.uniform(0.05, 0.3, size=(n_models, n_filters)) * 1e-18
+    fluxes = fluxmod[rng.randint(0, n_models, n_stars)] + rng.normal(
+        0.0, 1e-19, size=(n_stars, n_filters)
+    )
+    return fluxes, fluxmod, error
+
+
+def test_block_likelihood():
+    fluxes, fluxmod, error = _simple_models()
+    ivar = 1.0 / error ** 2
+
+    block_lnp, block_chi2 = N_logLikelihood_NM_block(fluxes, fluxmod, ivar)
+
+    for k, flux in enumerate(fluxes):
+        lnp, chi2 = N_logLikelihood_NM(flux, fluxmod, ivar)
+        np.testing.assert_allclose(block_chi2[k], chi2, rtol=1e-8, atol=1e-8)
+        np.testing.assert_allclose(block_lnp[k], lnp, rtol=1e-10)
+
+
+def test_block_covar_likelihood():
+    fluxes, fluxmod, error = _simple_models()
+    n_models, n_filters = fluxmod.shape
+
+    # random positive definite covariance matrices
+    rng = np.random.RandomState(4321)
+    tmat = rng.normal(size=(n_models, n_filters, n_filters)) * error[:, :, None]
+    cov = np.einsum("mij,mkj->mik", tmat, tmat)
+    cov[:, range(n_filters), range(n_filters)] += error ** 2
+    icov = np.linalg.inv(cov)
+    indx1, indx2 = np.triu_indices(n_filters, k=1)
+    icov_diag = icov[:, range(n_filters), range(n_filters)]
+    two_icov_offdiag = 2.0 * icov[:, indx1, indx2]
+    q_norm = -0.5 * np.linalg.slogdet(cov)[1]
+
+    block_lnp, block_chi2 = N_covar_logLikelihood_block(
+        fluxes, fluxmod, q_norm, icov_diag, two_icov_offdiag
+    )
+
+    for k, flux in enumerate(fluxes):
+        lnp, chi2 = N_covar_logLikelihood(
+            flux, fluxmod, q_norm, icov_diag, two_icov_offdiag
+        )
+        np.testing.assert_allclose(block_chi2[k], chi2, rtol=1e-7, atol=1e-7)
+        np.testing.assert_allclose(block_lnp[k], lnp, rtol=1e-9)
+
+
+def test_prepared_likelihood():
+    fluxes, fluxmod, error = _simple_models()
+    ivar = 1.0 / error ** 2
+    n_models = len(fluxmod)
+
+    model_indxs = np.arange(0, n_models, 3)
+    lnprior = np.log(np.linspace(0.1, 1.0, len(model_indxs)))
+
+    likelihood = PreparedLikelihood(
+        fluxmod, ivar=ivar, lnprior=lnprior, model_indxs=model_indxs
+    )
+    block_lnp, block_chi2 = likelihood.block(fluxes)
+
+    for k, flux in enumerate(fluxes):
+        lnp, chi2 = N_logLikelihood_NM(flux, fluxmod, ivar)
+        plnp, pchi2 = likelihood(flux)
+        np.testing.assert_allclose(pchi2, chi2[model_indxs], rtol=1e-12)
+        np.testing.assert_allclose(plnp, lnp[model_indxs] + lnprior, rtol=1e-12)
+        np.testing.assert_allclose(block_lnp[k], plnp, rtol=1e-10)
+
+
+def test_prepared_likelihood_progressive():
+    fluxes, fluxmod, error = _simple_models()
+    ivar = 1.0 / error ** 2
+    lnprior = np.log(np.linspace(0.1, 1.0, len(fluxmod)))
+
+    likelihood = PreparedLikelihood(fluxmod, ivar=ivar, lnprior=lnprior)
+    for flux in fluxes:
+        lnp, chi2 = likelihood(flux)
+        (indxs,) = np.where(lnp - lnp.max() > -10.0)
+
+        pindxs, plnp, pchi2 = likelihood.progressive(flux, -10.0)
+        assert np.all(np.isin(indxs, pindxs))
+        np.testing.assert_allclose(plnp, lnp[pindxs], rtol=1e-12)
+        np.testing.assert_allclose(pchi2, chi2[pindxs], rtol=1e-12)
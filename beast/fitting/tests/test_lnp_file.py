@@ -0,0 +1,88 @@
+import numpy as np
+import tables
+
+from beast.fitting.lnp_file import (
+    create_lnp_file,
+    append_lnp,
+    read_lnp_file,
+    write_lnp_file,
+    select_lnp_stars,
+)
+from beast.tools.read_beast_data import read_lnp_data
+
+
+def _lnp_stars(star_indx, n_filters=3):
+    rng = np.random.RandomState(1234)
+    sizes = rng.randint(1, 10, len(star_indx))
+    n_vals = np.sum(sizes)
+    return {
+        "star_indx": np.array(star_indx),
+        "offsets": np.concatenate([[0], np.cumsum(sizes)]),
+        "idx": rng.randint(0, 1000, n_vals),
+        "lnp": rng.uniform(-10.0, 0.0, n_vals).astype(np.float32),
+        "chi2": rng.uniform(0.0, 20.0, n_vals).astype(np.float32),
+        "input": rng.uniform(size=(len(star_indx), n_filters)),
+    }
+
+
+def _check_same(lnp_data, exp_lnp_data):
+    assert set(lnp_data.keys()) == set(exp_lnp_data.keys())
+    for cname in exp_lnp_data.keys():
+        np.testing.assert_array_equal(lnp_data[cname], exp_lnp_data[cname])
+
+
+def test_lnp_file_append_read(tmpdir):
+    filename = str(tmpdir.join("lnp.hd5"))
+    lnp_data = _lnp_stars(np.arange(10))
+
+    create_lnp_file(filename, 3, grid_waves=np.arange(3.0))
+    append_lnp(filename, select_lnp_stars(lnp_data, np.arange(6)))
+    # stars already in the file are skipped
+    append_lnp(filename, select_lnp_stars(lnp_data, np.arange(4, 10)))
+
+    _check_same(read_lnp_file(filename), lnp_data)
+
+    # selection of stars
+    sel_data = select_lnp_stars(lnp_data, np.array([7, 2]))
+    np.testing.assert_array_equal(sel_data["star_indx"], [7, 2])
+    k = lnp_data["offsets"]
+    exp_lnp = np.concatenate(
+        [lnp_data["lnp"][k[7] : k[8]], lnp_data["lnp"][k[2] : k[3]]]
+    )
+    np.testing.assert_array_equal(sel_data["lnp"], exp_lnp)
+
+    filename2 = str(tmpdir.join("lnp2.hd5"))
+    write_lnp_file(filename2, sel_data)
+    _check_same(read_lnp_file(filename2), sel_data)
+
+
+def test_lnp_file_legacy(tmpdir):
+    lnp_data = _lnp_stars(np.arange(12))
+    k = lnp_data["offsets"]
+
+    # legacy layout, one group per star
+    legacy_filename = str(tmpdir.join("lnp_legacy.hd5"))
+    with tables.open_file(legacy_filename, "w") as outfile:
+        outfile.create_array(outfile.root, "grid_waves", np.arange(3.0))
+        for i in range(12):
+            star_group = outfile.create_group("/", "star_%d" % i)
+            outfile.create_array(star_group, "input", lnp_data["input"][i][:, None])
+            for cname in ["idx", "lnp", "chi2"]:
+                cvals = lnp_data[cname][k[i] : k[i + 1]]
+                outfile.create_array(star_group, cname, cvals)
+
+    filename = str(tmpdir.join("lnp.hd5"))
+    write_lnp_file(filename, lnp_data)
+
+    # legacy stars in the order of the groups in the file
+    legacy_lnp_data = read_lnp_file(legacy_filename)
+    _check_same(
+        select_lnp_stars(lnp_data, legacy_lnp_data["star_indx"]), legacy_lnp_data
+    )
+
+    legacy_ldata = read_lnp_data(legacy_filename)
+    ldata = read_lnp_data(filename)
+    for ckey in ["vals", "indxs"]:
+        np.testing.assert_array_equal(
+            ldata[ckey][:, legacy_lnp_data["star_indx"]], legacy_ldata[ckey]
+        )
@@ -0,0 +1,43 @@
+import numpy as np
+
+from beast.fitting.pdf1d import pdf1d
+from beast.fitting.pdf2d import pdf2d
+from beast.fitting.marginals import MarginalProjection
+from beast.fitting.fit_metrics import expectation
+
+
+def test_marginal_projection():
+    rng = np.random.RandomState(1234)
+    n_gridvals = 1000
+    gridvals_p1 = rng.uniform(1.0, 10.0, n_gridvals)
+    gridvals_p2 = rng.choice(np.linspace(0.0, 5.0, 11), n_gridvals)
+
+    pdf1d_objs = [pdf1d(gridvals_p1, 20, logspacing=True), pdf1d(gridvals_p2, 11)]
+    pdf2d_objs = [pdf2d(gridvals_p1, gridvals_p2, 20, 11, logspacing_p1=True)]
+    proj = MarginalProjection(
+        n_gridvals,
+        pdf1d_objs,
+        pdf2d_objs=pdf2d_objs,
+        exp_gridvals=[gridvals_p1, gridvals_p2],
+    )
+
+    n_objs = 3
+    gindxs = [
+        np.sort(rng.choice(n_gridvals, size=50 + 10 * k, replace=False))
+        for k in range(n_objs)
+    ]
+    weights = [rng.uniform(size=len(cindxs)) for cindxs in gindxs]
+
+    exp_vals, pdf1d_vals, pdf2d_vals = proj.gen_block(gindxs, weights)
+
+    for k in range(n_objs):
+        for i, cgridvals in enumerate([gridvals_p1, gridvals_p2]):
+            np.testing.assert_allclose(
+                exp_vals[k, i], expectation(cgridvals[gindxs[k]], weights=weights[k])
+            )
+            np.testing.assert_allclose(
+                pdf1d_vals[i][k], pdf1d_objs[i].gen1d(gindxs[k], weights[k])[1]
+            )
+        np.testing.assert_allclose(
+            pdf2d_vals[0][k], pdf2d_objs[0].gen2d(gindxs[k], weights[k])
+        )
@@ -0,0 +1,197 @@
+import numpy as np
+import h5py
+from astropy.table import Table as apTable
+
+from beast.external.eztables import Table
+from beast.physicsmodel.grid import SpectralGrid
+from beast.fitting import fit
+from beast.fitting.lnp_file import read_lnp_file
+from beast.fitting.modelchunks import ModelChunks
+
+filters = ["F1", "F2", "F3", "F4"]
+
+
+class _Obs(object):
+    """ minimal observation catalog """
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def getFilters(self):
+        return filters
+
+    def enumobs(self):
+        for k in range(len(self.data)):
+            yield k, self.data[k]
+
+
+def _make_files(tmpdir, n_models=600):
+    rng = np.random.RandomState(1234)
+    n_filters = len(filters)
+    Av = rng.choice(np.linspace(0.0, 2.0, 5), n_models)
+    M_ini = 10 ** rng.uniform(-0.5, 1.0, n_models)
+    seds = np.outer(M_ini ** 2, np.linspace(1.0, 2.0, n_filters)) * 10 ** (
+        -0.4 * np.outer(Av, np.linspace(1.2, 0.3, n_filters))
+    )
+    weight = rng.uniform(size=n_models) * (rng.uniform(size=n_models) > 0.05)
+    tab = Table(
+        dict(
+            Av=Av,
+            M_ini=M_ini,
+            weight=weight,
+            specgrid_indx=np.arange(n_models),
+        )
+    )
+    tab.header["FILTERS"] = " ".join(filters)
+    sedgrid_fname = str(tmpdir.join("seds.grid.hd5"))
+    g = SpectralGrid(
+        np.linspace(1000.0, 9000.0, n_filters), seds=seds, grid=tab, backend="memory"
+    )
+    g.writeHDF(sedgrid_fname)
+
+    noisemodel = {"error": 0.1 * seds + 0.01, "bias": 0.01 * seds}
+    noise_fname = str(tmpdir.join("noisemodel.grid.hd5"))
+    with h5py.File(noise_fname, "w") as nfile:
+        for ckey, cvals in noisemodel.items():
+            nfile[ckey] = cvals
+        nfile["completeness"] = np.ones(n_models)
+
+    pick = rng.choice(n_models, size=20)
+    obs = _Obs(
+        seds[pick]
+        + noisemodel["bias"][pick]
+        + rng.normal(size=(len(pick), n_filters)) * noisemodel["error"][pick]
+    )
+
+    return sedgrid_fname, noise_fname, noisemodel, obs
+
+
+def test_model_chunks_read(tmpdir):
+    sedgrid_fname, noise_fname, noisemodel, obs = _make_files(tmpdir)
+    g = SpectralGrid(sedgrid_fname, backend="memory")
+
+    model_chunks = ModelChunks(sedgrid_fname, noise_fname, chunk_size=250)
+    assert len(model_chunks) == len(g.seds)
+    assert model_chunks.filters == filters
+
+    all_chunks = list(model_chunks.chunks())
+    assert [chunk["start"] for chunk in all_chunks] == [0, 250, 500]
+    np.testing.assert_array_equal(
+        np.concatenate([chunk["seds"] for chunk in all_chunks]), g.seds
+    )
+    np.testing.assert_array_equal(
+        np.concatenate([chunk["bias"] for chunk in all_chunks]), noisemodel["bias"]
+    )
+    np.testing.assert_array_equal(
+        np.concatenate([chunk["grid"]["Av"] for chunk in all_chunks]), g["Av"]
+    )
+
+    grid_info = model_chunks.grid_info(["Av", "M_ini"])
+    assert grid_info["Av"]["num_unique"] == len(np.unique(g["Av"]))
+    assert grid_info["M_ini"]["min"] == g["M_ini"].min()
+    assert grid_info["M_ini"]["max"] == g["M_ini"].max()
+
+
+def test_fit_model_chunks(tmpdir):
+    sedgrid_fname, noise_fname, noisemodel, obs = _make_files(tmpdir)
+    g = SpectralGrid(sedgrid_fname, backend="memory")
+
+    # all the models at once and in chunks give the same results
+    outnames = {}
+    for name, sedgrid, obsmodel in [
+        ("memory", g, noisemodel),
+        ("chunks", ModelChunks(sedgrid_fname, noise_fname, chunk_size=150), None),
+    ]:
+        outnames[name] = {
+            "stats_outname": str(tmpdir.join(name + "_stats.fits")),
+            "pdf1d_outname": str(tmpdir.join(name + "_pdf1d.fits")),
+            "lnp_outname": str(tmpdir.join(name + "_lnp.hd5")),
+        }
+        fit.Q_all_memory(
+            {"Name": ["star_{0:d}".format(k) for k in range(len(obs))]},
+            obs,
+            sedgrid,
+            obsmodel,
+            ["Av", "M_ini"],
+            threshold=-10.0,
+            block_memory=1e5,
+            **outnames[name]
+        )
+
+    stats = apTable.read(outnames["memory"]["stats_outname"])
+    chunk_stats = apTable.read(outnames["chunks"]["stats_outname"])
+    for cname in stats.colnames:
+        if cname != "Name":
+            np.testing.assert_allclose(chunk_stats[cname], stats[cname], rtol=1e-10)
+
+    lnp_data = read_lnp_file(outnames["memory"]["lnp_outname"])
+    chunk_lnp_data = read_lnp_file(outnames["chunks"]["lnp_outname"])
+    np.testing.assert_array_equal(chunk_lnp_data["idx"], lnp_data["idx"])
+    np.testing.assert_array_equal(chunk_lnp_data["offsets"], lnp_data["offsets"])
+
+
+def test_fit_model_chunks_subgrids(tmpdir):
+    sedgrid_fname, noise_fname, noisemodel, obs = _make_files(tmpdir)
+    g = SpectralGrid(sedgrid_fname, backend="memory")
+
+    # the grid split in two subgrids
+    bounds = [0, 250, len(g.seds)]
+    sub_fnames = []
+    sub_noise_fnames = []
+    for k in range(len(bounds) - 1):
+        sub_indxs = slice(bounds[k], bounds[k + 1])
+        sub_tab = Table({cname: g[cname][sub_indxs] for cname in g.keys()})
+        sub_tab.header["FILTERS"] = " ".join(filters)
+        sub_fnames.append(str(tmpdir.join("seds_gridsub{0:d}.grid.hd5".format(k))))
+        SpectralGrid(
+            g.lamb, seds=g.seds[sub_indxs], grid=sub_tab, backend="memory"
+        ).writeHDF(sub_fnames[-1])
+
+        sub_noise_fnames.append(
+            str(tmpdir.join("noisemodel_gridsub{0:d}.grid.hd5".format(k)))
+        )
+        with h5py.File(sub_noise_fnames[-1], "w") as nfile:
+            for ckey, cvals in noisemodel.items():
+                nfile[ckey] = cvals[sub_indxs]
+            nfile["completeness"] = np.ones(bounds[k + 1] - bounds[k])
+
+    # the subgrids fit together give the results of the full grid
+    outnames = {}
+    for name, sedgrid, obsmodel in [
+        ("memory", g, noisemodel),
+        ("subgrids", ModelChunks(sub_fnames, sub_noise_fnames), None),
+    ]:
+        outnames[name] = {
+            "stats_outname": str(tmpdir.join(name + "_stats.fits")),
+            "lnp_outname": str(tmpdir.join(name + "_lnp.hd5")),
+        }
+        fit.Q_all_memory(
+            {"Name": ["star_{0:d}".format(k) for k in range(len(obs))]},
+            obs,
+            sedgrid,
+            obsmodel,
+            ["Av", "M_ini"],
+            threshold=-10.0,
+            block_memory=1e5,
+            **outnames[name]
+        )
+
+    stats = apTable.read(outnames["memory"]["stats_outname"])
+    sub_stats = apTable.read(outnames["subgrids"]["stats_outname"])
+    for cname in stats.colnames:
+        if cname != "Name":
+            np.testing.assert_allclose(sub_stats[cname], stats[cname], rtol=1e-10)
+
+    # the lnp file gives the model indices in the subgrids, as merge_lnp
+    lnp_data = read_lnp_file(outnames["memory"]["lnp_outname"])
+    sub_lnp_data = read_lnp_file(outnames["subgrids"]["lnp_outname"])
+    np.testing.assert_array_equal(sub_lnp_data["offsets"], lnp_data["offsets"])
+    assert set(np.unique(sub_lnp_data["subgrid"])) == {0, 1}
+    np.testing.assert_array_equal(
+        sub_lnp_data["idx"] + np.array(bounds)[sub_lnp_data["subgrid"]],
+        lnp_data["idx"],
+    )
+    np.testing.assert_allclose(sub_lnp_data["lnp"], lnp_data["lnp"], rtol=1e-6)
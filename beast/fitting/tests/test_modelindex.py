@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from beast.fitting.fit_metrics.likelihood import PreparedLikelihood
+from beast.fitting.modelindex import ModelFluxIndex
+
+
+@pytest.mark.parametrize("full_cov_mat", [False, True])
+def test_model_flux_index_candidates(full_cov_mat):
+    rng = np.random.RandomState(1234)
+    n_models, n_filters = 5000, 5
+    fluxmod = 10 ** rng.uniform(-1.0, 2.0, (n_models, n_filters))
+    err = 0.05 * fluxmod + 0.1
+    ivar = 1.0 / err ** 2
+    lnprior = np.log(rng.uniform(0.1, 1.0, n_models))
+    if full_cov_mat:
+        iu, ju = np.triu_indices(n_filters, k=1)
+        icov_offdiag = -0.1 * np.sqrt(ivar[:, iu] * ivar[:, ju])
+        likelihood = PreparedLikelihood(
+            fluxmod,
+            q_norm=rng.uniform(size=n_models),
+            icov_diag=ivar,
+            icov_offdiag=icov_offdiag,
+            lnprior=lnprior,
+        )
+    else:
+        likelihood = PreparedLikelihood(fluxmod, ivar=ivar, lnprior=lnprior)
+    index = ModelFluxIndex(likelihood, block_size=64)
+
+    for i in rng.choice(n_models, size=10, replace=False):
+        flux = fluxmod[i] + rng.normal(size=n_filters) * err[i]
+        cand_indxs = index.candidates(flux, -10.0)
+
+        # all the models passing the threshold are candidates
+        (lnp, chi2) = likelihood(flux)
+        (indxs,) = np.where(lnp - lnp.max() > -10.0)
+        assert np.all(np.isin(indxs, cand_indxs))
+        assert len(cand_indxs) < n_models
+
+        # same likelihood for the candidates
+        (cand_lnp, cand_chi2) = likelihood(flux, indxs=cand_indxs)
+        np.testing.assert_allclose(cand_lnp, lnp[cand_indxs], rtol=1e-12)
+        np.testing.assert_allclose(cand_chi2, chi2[cand_indxs], rtol=1e-12)
@@ -0,0 +1,34 @@
+import numpy as np
+
+from beast.fitting.pdf1d import pdf1d
+
+
+def test_pdf1d():
+    rng = np.random.RandomState(1234)
+    gridvals = rng.uniform(1.0, 10.0, 1000)
+    tpdf1d = pdf1d(gridvals, 20, logspacing=True, minval=1.5, maxval=9.0)
+
+    n_objs = 5
+    gindxs = [rng.choice(1000, size=100 + 10 * k, replace=False) for k in range(n_objs)]
+    weights = [rng.uniform(size=len(cindxs)) for cindxs in gindxs]
+
+    block_bins, block_vals = tpdf1d.gen1d_block(gindxs, weights)
+    assert block_vals.shape == (n_objs, 20)
+
+    for k in range(n_objs):
+        bin_vals, vals = tpdf1d.gen1d(gindxs[k], weights[k])
+
+        # direct computation from the bin edges
+        #   (grid values outside of the bins are not included)
+        cgridvals = gridvals[gindxs[k]]
+        exp_vals = np.zeros(20)
+        for i in range(20):
+            (bindxs,) = np.where(
+                (cgridvals >= tpdf1d.bin_edges[i])
+                & (cgridvals < tpdf1d.bin_edges[i + 1])
+            )
+            exp_vals[i] = np.sum(weights[k][bindxs])
+
+        np.testing.assert_allclose(vals, exp_vals)
+        np.testing.assert_allclose(block_vals[k], vals)
+        np.testing.assert_equal(bin_vals, block_bins)
@@ -0,0 +1,40 @@
+import numpy as np
+
+from beast.fitting.pdf2d import pdf2d
+
+
+def test_pdf2d():
+    rng = np.random.RandomState(1234)
+    gridvals_p1 = rng.uniform(1.0, 10.0, 1000)
+    gridvals_p2 = rng.choice(np.linspace(0.0, 5.0, 11), 1000)
+    tpdf2d = pdf2d(
+        gridvals_p1, gridvals_p2, 15, 11, logspacing_p1=True, minval_p1=1.5
+    )
+
+    n_objs = 4
+    gindxs = [rng.choice(1000, size=200 + 10 * k, replace=False) for k in range(n_objs)]
+    weights = [rng.uniform(size=len(cindxs)) for cindxs in gindxs]
+
+    block_vals = tpdf2d.gen2d_block(gindxs, weights)
+    assert block_vals.shape == (n_objs, 15, 11)
+
+    for k in range(n_objs):
+        vals = tpdf2d.gen2d(gindxs[k], weights[k])
+
+        # direct computation from the bin edges
+        #   (grid values outside of the bins are not included)
+        cp1 = gridvals_p1[gindxs[k]]
+        cp2 = gridvals_p2[gindxs[k]]
+        exp_vals = np.zeros((15, 11))
+        for i in range(15):
+            for j in range(11):
+                (bindxs,) = np.where(
+                    (cp1 >= tpdf2d.bin_edges_p1[i])
+                    & (cp1 < tpdf2d.bin_edges_p1[i + 1])
+                    & (cp2 >= tpdf2d.bin_edges_p2[j])
+                    & (cp2 < tpdf2d.bin_edges_p2[j + 1])
+                )
+                exp_vals[i, j] = np.sum(weights[k][bindxs])
+
+        np.testing.assert_allclose(vals, exp_vals)
+        np.testing.assert_allclose(block_vals[k], vals)
@@ -0,0 +1,52 @@
+import numpy as np
+from scipy import sparse
+
+from beast.fitting.sharedarrays import share, attach, release
+from beast.fitting.fit_metrics.likelihood import PreparedLikelihood
+
+
+def test_share_attach():
+    rng = np.random.RandomState(1234)
+    fluxmod = rng.uniform(1.0, 2.0, (100, 4))
+    ivar = rng.uniform(1.0, 2.0, (100, 4))
+    q_norm = rng.uniform(size=100)
+    value = {
+        "likelihood": PreparedLikelihood(fluxmod, ivar=ivar, q_norm=q_norm).prepare(
+            block=True, progressive=True
+        ),
+        "matrix": sparse.random(10, 20, density=0.2, format="csr", random_state=rng),
+        "arrays": [np.arange(5), np.ones((3, 2), order="F")],
+        "threshold": -10,
+    }
+
+    shms = []
+    attach_shms = []
+    try:
+        desc = share(value, shms)
+        shared = attach(desc, attach_shms)
+
+        assert shared["threshold"] == -10
+        assert shared["arrays"][1].flags.f_contiguous
+        for arr, sarr in zip(value["arrays"], shared["arrays"]):
+            np.testing.assert_array_equal(arr, sarr)
+        np.testing.assert_array_equal(
+            value["matrix"].toarray(), shared["matrix"].toarray()
+        )
+
+        flux = fluxmod[10] * 1.01
+        for x, y in zip(value["likelihood"](flux), shared["likelihood"](flux)):
+            np.testing.assert_array_equal(x, y)
+
+        # the prepared terms are shared, not computed again
+        assert shared["likelihood"]._block_terms is not None
+        assert shared["likelihood"]._filter_order is not None
+        fluxes = fluxmod[:5] * 1.01
+        for x, y in zip(
+            value["likelihood"].block(fluxes), shared["likelihood"].block(fluxes)
+        ):
+            np.testing.assert_array_equal(x, y)
+
+        del shared
+    finally:
+        release(attach_shms, unlink=False)
+        release(shms)
@@ -1,10 +1,121 @@
+import os
+import shutil
+
 import numpy as np
 import tables
 
 from beast.physicsmodel.grid import SpectralGrid
+from beast.physicsmodel.helpers.gridbackends import write_grid_indxs
 from beast.external.eztables import Table
+from beast.observationmodel.noisemodel.compact import CompactNoiseModel
+
+__all__ = ["trim_models", "trim_models_many"]
+
+
+def _noise_chunks(seds, noisemodel, chunk_size):
+    """
+    Model fluxes and noise model of chunks of models
+
+    Yields
+    ------
+    (start, stop, seds, bias, error) for each chunk
+    """
+    n_models = len(seds)
+    for start in range(0, n_models, chunk_size):
+        stop = min(start + chunk_size, n_models)
+        cseds = np.asarray(seds[start:stop])
+        yield (start, stop, cseds) + _chunk_noise(noisemodel, cseds, start, stop)
+
+
+def _chunk_noise(noisemodel, cseds, start, stop):
+    """ bias and error of a chunk of models """
+    if isinstance(noisemodel, CompactNoiseModel):
+        cnoise = noisemodel.evaluate(cseds)
+    else:
+        cnoise = {key: noisemodel[key][start:stop] for key in ["bias", "error"]}
+    return cnoise["bias"], cnoise["error"]
 
-__all__ = ["trim_models"]
+
+def _data_range(obsdata, inFlux=True):
+    """
+    Brightest and faintest fluxes in each band of the observations
+
+    Returns
+    -------
+    (min_data, max_data)
+    """
+    n_filters = len(obsdata.filters)
+    min_data = np.zeros(n_filters)
+    max_data = np.zeros(n_filters)
+    for k, filtername in enumerate(obsdata.filters):
+        sfiltname = obsdata.data.resolve_alias(filtername)
+        if inFlux:
+            min_data[k] = np.amin(obsdata.data[sfiltname] * obsdata.vega_flux[k])
+            max_data[k] = np.amax(obsdata.data[sfiltname] * obsdata.vega_flux[k])
+        else:
+            min_data[k] = np.amin(
+                10 ** (-0.4 * obsdata.data[sfiltname]) * obsdata.vega_flux[k]
+            )
+            max_data[k] = np.amax(
+                10 ** (-0.4 * obsdata.data[sfiltname]) * obsdata.vega_flux[k]
+            )
+    return min_data, max_data
+
+
+def _model_codes(cseds, cbias, cerror, min_data, max_data, sigma_fac, n_detected):
+    """
+    Trimming tests of a chunk of models packed as bits
+
+    Bit k is set if the model flux (with margin) is between the faintest
+    and brightest data in band k, bit n_filters if the model is detected
+    in enough bands.
+    """
+    n_filters = cseds.shape[1]
+    dtype = np.min_scalar_type(2 ** (n_filters + 1) - 1)
+
+    # Get upper and lower values for the models given the noise model
+    model_unc = np.fabs(cerror)
+    model_val = cseds + cbias
+    model_down = model_val - sigma_fac * model_unc
+    model_up = model_val + sigma_fac * model_unc
+    in_range = (model_up >= min_data) & (model_down <= max_data)
+
+    codes = np.zeros(len(cseds), dtype=dtype)
+    for k in range(n_filters):
+        codes |= in_range[:, k].astype(dtype) << k
+    detected = np.sum(cerror > 0, axis=1) >= n_detected
+    codes |= detected.astype(dtype) << n_filters
+    return codes
+
+
+def _select_models(codes, n_filters):
+    """
+    Indexes of the models kept given their trimming tests (see _model_codes)
+
+    Returns
+    -------
+    (indxs, n_ast_indxs)
+    """
+    indxs, = np.where(codes & (1 << n_filters))
+
+    if len(indxs) <= 0:
+        raise ValueError("no models are brighter than the minimum ASTs run")
+
+    n_ast_indxs = len(indxs)
+
+    # Find models with fluxes (with margin) between faintest and brightest data
+    #   (a band is skipped if no models are in the data range)
+    for k in range(n_filters):
+        print("working on filter # = ", k)
+
+        nindxs, = np.where(codes[indxs] & (1 << k))
+        if len(nindxs) > 0:
+            indxs = indxs[nindxs]
+
+    if len(indxs) == 0:
+        raise ValueError("no models that are within the data range")
+
+    return indxs, n_ast_indxs
 
 
 def trim_models(
@@ -17,6 +128,7 @@ def trim_models(
     n_detected=4,
     inFlux=True,
     trunchen=False,
+    chunk_size=100000,
 ):
     """
     For a given set of observations, there will be models that are so
@@ -31,6 +143,8 @@ def trim_models(
         model grid
     sedgrid_noisemodel : beast noisemodel instance
         noise model data
+        a CompactNoiseModel is evaluated on the model fluxes and copied
+        as the trimmed noise model
     obsdata : Observation object instance
         observation catalog
     sed_outname : str
@@ -49,28 +163,14 @@ def trim_models(
         if true data are in fluxes (default: True)
     trunchen : bool, optional
         if true use the trunchen noise model (default: False)
+    chunk_size : int, optional
+        number of models for which the noise model is used at once
     """
-    # Store the brigtest and faintest fluxes in each band (for data and asts)
-    n_filters = len(obsdata.filters)
-    min_data = np.zeros(n_filters)
-    max_data = np.zeros(n_filters)
-    min_models = np.zeros(n_filters)
-    max_models = np.zeros(n_filters)
-    for k, filtername in enumerate(obsdata.filters):
-        sfiltname = obsdata.data.resolve_alias(filtername)
-        if inFlux:
-            min_data[k] = np.amin(obsdata.data[sfiltname] * obsdata.vega_flux[k])
-            max_data[k] = np.amax(obsdata.data[sfiltname] * obsdata.vega_flux[k])
-        else:
-            min_data[k] = np.amin(
-                10 ** (-0.4 * obsdata.data[sfiltname]) * obsdata.vega_flux[k]
-            )
-            max_data[k] = np.amax(
-                10 ** (-0.4 * obsdata.data[sfiltname]) * obsdata.vega_flux[k]
-            )
+    compact_noise = isinstance(sedgrid_noisemodel, CompactNoiseModel)
 
-        min_models[k] = np.amin(sedgrid.seds[:, k])
-        max_models[k] = np.amax(sedgrid.seds[:, k])
+    # Store the brigtest and faintest fluxes in each band
+    n_filters = len(obsdata.filters)
+    min_data, max_data = _data_range(obsdata, inFlux=inFlux)
 
     # first remove all models that have any band with fluxes below the
     #    faintest ASTs run
@@ -81,41 +181,21 @@ def trim_models(
     #   that *none* were recovered and this implies
     #   that no model with these values would be recovered and thus the
     #   probability should always be zero
-    model_unc = sedgrid_noisemodel["error"]
-    above_ast = model_unc > 0
-    sum_above_ast = np.sum(above_ast, axis=1)
-    indxs, = np.where(sum_above_ast >= n_detected)
-
-    # cache the noisemodel values
-    model_bias = sedgrid_noisemodel["bias"]
-    model_unc = np.fabs(sedgrid_noisemodel["error"])
-    model_compl = sedgrid_noisemodel["completeness"]
-    if trunchen:
-        model_q_norm = sedgrid_noisemodel["q_norm"]
-        model_icov_diag = sedgrid_noisemodel["icov_diag"]
-        model_icov_offdiag = sedgrid_noisemodel["icov_offdiag"]
-
-    if len(indxs) <= 0:
-        raise ValueError("no models are brighter than the minimum ASTs run")
-
-    n_ast_indxs = len(indxs)
-
-    # Find models with fluxes (with margin) between faintest and brightest data
-    for k in range(n_filters):
-        print("working on filter # = ", k)
-
-        # Get upper and lower values for the models given the noise model
-        #  sigma_fac defaults to 3.
-        model_val = sedgrid.seds[indxs, k] + model_bias[indxs, k]
-        model_down = model_val - sigma_fac * model_unc[indxs, k]
-        model_up = model_val + sigma_fac * model_unc[indxs, k]
-
-        nindxs, = np.where((model_up >= min_data[k]) & (model_down <= max_data[k]))
-        if len(nindxs) > 0:
-            indxs = indxs[nindxs]
-
-    if len(indxs) == 0:
-        raise ValueError("no models that are within the data range")
+    # also find for each band the models with fluxes (with margin)
+    #   between faintest and brightest data
+    #   sigma_fac defaults to 3.
+    # the noise model is used one chunk of models at a time
+    codes = np.concatenate(
+        [
+            _model_codes(
+                cseds, cbias, cerror, min_data, max_data, sigma_fac, n_detected
+            )
+            for start, stop, cseds, cbias, cerror in _noise_chunks(
+                sedgrid.seds, sedgrid_noisemodel, chunk_size
+            )
+        ]
+    )
+    indxs, n_ast_indxs = _select_models(codes, n_filters)
 
     print("number of original models = ", len(sedgrid.seds[:, 0]))
     print("number of ast trimmed models = ", n_ast_indxs)
@@ -135,18 +215,142 @@ def trim_models(
     filternames = obsdata.filters
     g.grid.header["filters"] = " ".join(filternames)
 
-    # trimmed grid name
-    g.writeHDF(sed_outname)
-
     # save the trimmed noise model
+    #   a compact noise model does not depend on the models
     print("Writing trimmed noisemodel to disk into {0:s}".format(noisemodel_outname))
-    with tables.open_file(noisemodel_outname, "w") as outfile:
-        outfile.create_array(outfile.root, "bias", model_bias[indxs])
-        outfile.create_array(outfile.root, "error", model_unc[indxs])
-        outfile.create_array(outfile.root, "completeness", model_compl[indxs])
-        if trunchen:
-            outfile.create_array(outfile.root, "q_norm", model_q_norm[indxs])
-            outfile.create_array(outfile.root, "icov_diag", model_icov_diag[indxs])
+    if compact_noise:
+        shutil.copyfile(sedgrid_noisemodel.filename, noisemodel_outname)
+    else:
+        with tables.open_file(noisemodel_outname, "w") as outfile:
+            outfile.create_array(
+                outfile.root, "bias", sedgrid_noisemodel["bias"][indxs]
+            )
+            outfile.create_array(
+                outfile.root, "error", np.fabs(sedgrid_noisemodel["error"][indxs])
+            )
             outfile.create_array(
-                outfile.root, "icov_offdiag", model_icov_offdiag[indxs]
+                outfile.root,
+                "completeness",
+                sedgrid_noisemodel["completeness"][indxs],
             )
+            if trunchen:
+                for key in ["q_norm", "icov_diag", "icov_offdiag"]:
+                    outfile.create_array(
+                        outfile.root, key, sedgrid_noisemodel[key][indxs]
+                    )
+
+    # save the trimmed grid, with the statistics of its fluxes with bias
+    g.writeHDF(sed_outname, noisemodel=noisemodel_outname)
+
+
+def trim_models_many(
+    sedgrid,
+    sedgrid_noisemodels,
+    obsdatas,
+    indxs_outnames,
+    noise_fnames=None,
+    sigma_fac=3.0,
+    n_detected=4,
+    inFlux=True,
+    chunk_size=100000,
+):
+    """
+    Trim a model grid for many observation catalogs in one pass over the
+    grid and the noise models, writing index lists instead of grid copies
+
+    The models are kept with the same tests as trim_models. The noise
+    model of each chunk of models is read or evaluated once for all the
+    catalogs using it. For each catalog, only the indexes of the kept
+    models are written (see gridbackends.write_grid_indxs): the trimmed grid
+    is read with the 'indexed' backend (e.g.,
+    FileSEDGrid(indxs_outname, backend="indexed")) and the trimmed noise
+    model with get_noisemodelcat(noise_fname, indxs=...).
+
+    Parameters
+    ----------
+    sedgrid : str or grid.SEDgrid instance
+        model grid file (read from disk one chunk at a time) or model grid
+        read from a file
+    sedgrid_noisemodels : beast noisemodel instance or list
+        noise model data, or one per catalog (the same instance for the
+        catalogs sharing a noise model); an open h5py.File of a noise
+        model is read one chunk of models at a time
+    obsdatas : list of Observation object instances
+        observation catalogs
+    indxs_outnames : list of str
+        name of the output index file for each catalog
+    noise_fnames : str or list of str, optional
+        noise model file(s), stored with the indexes for reference
+    sigma_fac : float, optional
+        factor for trimming the upper and lower range of grid so that
+        the model range cuts off sigma_fac above and below the brightest
+        and faintest models, respectively (default: 3.)
+    n_detected : int, optional
+        minimum number of bands where ASTs yielded a detection for
+        a given model, if fewer detections than n_detected this model
+        gets eliminated (default: 4)
+    inFlux : bool, optional
+        if true data are in fluxes (default: True)
+    chunk_size : int, optional
+        number of models for which the noise model is used at once
+
+    Returns
+    -------
+    indxs_list : list of ndarray
+        indexes of the kept models for each catalog
+    """
+    if isinstance(sedgrid, str):
+        sedgrid = SpectralGrid(sedgrid, backend="hdf")
+    sedgrid_fname = sedgrid.fname
+    if not (isinstance(sedgrid_fname, str) and os.path.isfile(sedgrid_fname)):
+        raise ValueError("the model grid has to be read from a grid file")
+
+    n_cats = len(obsdatas)
+    if not isinstance(sedgrid_noisemodels, (list, tuple)):
+        sedgrid_noisemodels = [sedgrid_noisemodels] * n_cats
+    if (noise_fnames is None) or isinstance(noise_fnames, str):
+        noise_fnames = [noise_fnames] * n_cats
+    if not (len(sedgrid_noisemodels) == len(indxs_outnames) == n_cats):
+        raise ValueError("one noise model and output name are needed per catalog")
+
+    # catalogs sharing each noise model
+    noise_groups = {}
+    for i, cnoise in enumerate(sedgrid_noisemodels):
+        noise_groups.setdefault(id(cnoise), (cnoise, []))[1].append(i)
+
+    data_ranges = [_data_range(obsdata, inFlux=inFlux) for obsdata in obsdatas]
+    n_filters = len(obsdatas[0].filters)
+
+    # trimming tests of all the models for all the catalogs, in one pass
+    seds = sedgrid.seds
+    n_models = len(seds)
+    codes = [[] for i in range(n_cats)]
+    for start in range(0, n_models, chunk_size):
+        stop = min(start + chunk_size, n_models)
+        cseds = np.asarray(seds[start:stop])
+        for cnoise, cat_indxs in noise_groups.values():
+            cbias, cerror = _chunk_noise(cnoise, cseds, start, stop)
+            for i in cat_indxs:
+                codes[i].append(
+                    _model_codes(
+                        cseds, cbias, cerror, *data_ranges[i], sigma_fac, n_detected
+                    )
+                )
+
+    indxs_list = []
+    for i in range(n_cats):
+        print("working on catalog # = ", i)
+        indxs, n_ast_indxs = _select_models(np.concatenate(codes[i]), n_filters)
+        codes[i] = None
+
+        print("number of original models = ", n_models)
+        print("number of ast trimmed models = ", n_ast_indxs)
+        print("number of trimmed models = ", len(indxs))
+
+        print("Writing trimmed model indexes to disk into", indxs_outnames[i])
+        write_grid_indxs(
+            indxs_outnames[i], sedgrid_fname, indxs, noise_fname=noise_fnames[i]
+        )
+        indxs_list.append(indxs)
+
+    return indxs_list
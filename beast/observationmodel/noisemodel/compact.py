@@ -0,0 +1,282 @@
+"""
+Compact noise models evaluated on the model fluxes when needed
+
+The toothpick and splinter noise models are functions of the model fluxes
+only: the binned AST statistics (toothpick) or a fractional uncertainty
+(splinter). Instead of the (nmodels, nfilters) bias, error and completeness
+arrays, a compact noise model file stores these few values and the noise
+model is evaluated on the model fluxes a chunk of models at a time by the
+fitting and the trimming.
+
+Layout: the root of the HDF5 file has the attribute 'NOISEMODEL'
+('toothpick' or 'splinter').
+
+    toothpick: 'ast_fluxes', 'ast_bias', 'ast_sigma' and 'ast_compl'
+        (nfilters, nbins), the sorted bin fluxes padded with +inf and the
+        statistics padded with the last value, 'ast_nbins' (nfilters) and
+        'minmax_asts' (2, nfilters)
+    splinter: the attribute 'FRAC_UNC'
+
+and optionally 'abs_calib_2' (nfilters), the squares of the fractional
+absolute flux calibration uncertainties.
+"""
+import numpy as np
+import h5py
+import tables
+
+from beast.observationmodel.noisemodel.toothpick import _interp_filters
+
+__all__ = [
+    "CompactNoiseModel",
+    "is_compact_noisemodel",
+    "write_compact_toothpick",
+    "write_compact_splinter",
+    "abs_calib_2_from_matrix",
+    "remove_compact_filters",
+]
+
+
+def is_compact_noisemodel(filename):
+    """
+    True if the noise model file is a compact noise model
+
+    Parameters
+    ----------
+    filename: str
+        noise model file
+    """
+    with h5py.File(filename, "r") as nfile:
+        return "NOISEMODEL" in nfile.attrs
+
+
+def abs_calib_2_from_matrix(absflux_a_matrix):
+    """
+    Squares of the fractional absolute flux calibration uncertainties
+    (the off-diagonal terms are ignored)
+
+    Parameters
+    ----------
+    absflux_a_matrix: ndarray
+        absolute calibration a matrix or vector of fractional uncertainties
+
+    Returns
+    -------
+    abs_calib_2: ndarray or None
+    """
+    if absflux_a_matrix is None:
+        return None
+    if absflux_a_matrix.ndim == 1:
+        return absflux_a_matrix[:] ** 2
+    # assumes a cov matrix
+    return np.diag(absflux_a_matrix)
+
+
+def _write_compact(outname, kind, arrays, attrs={}, abs_calib_2=None):
+    """ write a compact noise model file """
+    with tables.open_file(outname, "w") as outfile:
+        outfile.root._v_attrs["NOISEMODEL"] = kind
+        for k, v in attrs.items():
+            outfile.root._v_attrs[k] = v
+        for k, v in arrays.items():
+            outfile.create_array(outfile.root, k, v)
+        if abs_calib_2 is not None:
+            outfile.create_array(outfile.root, "abs_calib_2", np.asarray(abs_calib_2))
+    return outname
+
+
+def write_compact_toothpick(outname, model, absflux_a_matrix=None):
+    """
+    Write the binned AST statistics of a toothpick noise model
+
+    Parameters
+    ----------
+    outname: str
+        path and filename into which save the noise model
+
+    model: toothpick.MultiFilterASTs
+        noise model with the AST statistics computed (see fit_bins)
+
+    absflux_a_matrix: ndarray
+        absolute calibration a matrix giving the fractional uncertainties
+        (only the diagonal terms are used)
+
+    Returns
+    -------
+    outname: str
+    """
+    knots, values = model._interp_knots()
+    return _write_compact(
+        outname,
+        "toothpick",
+        {
+            "ast_fluxes": knots,
+            "ast_bias": values[0],
+            "ast_sigma": values[1],
+            "ast_compl": values[2],
+            "ast_nbins": np.asarray(model._nasts, dtype=int),
+            "minmax_asts": model._minmax_asts,
+        },
+        abs_calib_2=abs_calib_2_from_matrix(absflux_a_matrix),
+    )
+
+
+def write_compact_splinter(outname, frac_unc, absflux_a_matrix=None):
+    """
+    Write a splinter noise model
+
+    Parameters
+    ----------
+    outname: str
+        path and filename into which save the noise model
+
+    frac_unc: float
+        fractional flux uncertainy
+
+    absflux_a_matrix: ndarray
+        absolute calibration a matrix giving the fractional uncertainties
+        (only the diagonal terms are used)
+
+    Returns
+    -------
+    outname: str
+    """
+    return _write_compact(
+        outname,
+        "splinter",
+        {},
+        attrs={"FRAC_UNC": float(frac_unc)},
+        abs_calib_2=abs_calib_2_from_matrix(absflux_a_matrix),
+    )
+
+
+def remove_compact_filters(filename, outname, rindxs):
+    """
+    Write a compact noise model without some of the filters
+
+    Parameters
+    ----------
+    filename: str
+        compact noise model file
+
+    outname: str
+        path and filename into which save the noise model
+
+    rindxs: list of int
+        indexes of the filters to remove
+
+    Returns
+    -------
+    outname: str
+    """
+    with h5py.File(filename, "r") as nfile:
+        kind = nfile.attrs["NOISEMODEL"]
+        kind = kind.decode() if isinstance(kind, bytes) else str(kind)
+        attrs = {k: nfile.attrs[k] for k in nfile.attrs.keys() if k != "NOISEMODEL"}
+        arrays = {k: np.array(nfile[k]) for k in nfile.keys()}
+
+    # the filters are the last axis of minmax_asts, the first of the others
+    for k, v in arrays.items():
+        arrays[k] = np.delete(v, rindxs, 1 if k == "minmax_asts" else 0)
+    abs_calib_2 = arrays.pop("abs_calib_2", None)
+    return _write_compact(outname, kind, arrays, attrs=attrs, abs_calib_2=abs_calib_2)
+
+
+class CompactNoiseModel(object):
+    """ Noise model stored as the few values it depends on
+
+    Gives the bias, error and completeness of models from their fluxes,
+    the same values as the noise model arrays written by
+    make_toothpick_noise_model and make_splinter_noise_model.
+    """
+
+    def __init__(self, filename, chunk_size=100000):
+        """
+        Parameters
+        ----------
+        filename: str
+            compact noise model file
+
+        chunk_size: int, optional
+            number of models evaluated at once
+        """
+        self.filename = filename
+        self.chunk_size = chunk_size
+        with h5py.File(filename, "r") as nfile:
+            kind = nfile.attrs["NOISEMODEL"]
+            self.kind = kind.decode() if isinstance(kind, bytes) else str(kind)
+            self.attrs = {k: nfile.attrs[k] for k in nfile.attrs.keys()}
+            self.arrays = {k: np.array(nfile[k]) for k in nfile.keys()}
+        if self.kind not in ["toothpick", "splinter"]:
+            raise ValueError(f"{self.kind} compact noise model not supported")
+        self.abs_calib_2 = self.arrays.get("abs_calib_2", None)
+
+    def keys(self):
+        """ names of the noise model arrays given by evaluate """
+        return ["bias", "error", "completeness"]
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __getitem__(self, key):
+        raise KeyError(
+            f"{key}: {self.filename} is a compact noise model, "
+            "use evaluate with the model fluxes"
+        )
+
+    def _evaluate(self, flux):
+        """ noise model of a chunk of models """
+        if self.kind == "toothpick":
+            values = np.stack(
+                [self.arrays["ast_bias"], self.arrays["ast_sigma"], self.arrays["ast_compl"]]
+            )
+            bias, sigma, compl = _interp_filters(
+                flux, self.arrays["ast_fluxes"], values, self.arrays["ast_nbins"]
+            )
+        else:
+            bias = np.zeros(flux.shape)
+            sigma = flux * self.attrs["FRAC_UNC"]
+            compl = np.ones(flux.shape)
+
+        # absolute flux calibration uncertainties
+        if self.abs_calib_2 is not None:
+            noise = np.sqrt(self.abs_calib_2 * flux ** 2 + sigma ** 2)
+        else:
+            noise = sigma
+
+        # models with fluxes below the faintest ASTs are tagged with
+        #   a negative error (as make_toothpick_noise_model does)
+        if self.kind == "toothpick":
+            noise[flux <= self.arrays["minmax_asts"][0, :]] *= -1.0
+
+        return {"bias": bias, "error": noise, "completeness": compl}
+
+    def evaluate(self, seds, start=0, stop=None):
+        """
+        Evaluate the noise model on model fluxes, a chunk at a time
+
+        Parameters
+        ----------
+        seds: ndarray or tables.Array
+            model fluxes (nmodels, nfilters)
+
+        start, stop: int, optional
+            range of models to evaluate
+
+        Returns
+        -------
+        ntable: dict
+            bias, error and completeness of the models (nmodels, nfilters)
+        """
+        if stop is None:
+            stop = len(seds)
+        n_models = stop - start
+        n_filters = seds.shape[1]
+        ntable = {
+            key: np.empty((n_models, n_filters), dtype=float) for key in self.keys()
+        }
+        for cstart in range(start, stop, self.chunk_size):
+            cstop = min(cstart + self.chunk_size, stop)
+            chunk = self._evaluate(np.asarray(seds[cstart:cstop], dtype=float))
+            for key, values in chunk.items():
+                ntable[key][cstart - start : cstop - start] = values
+        return ntable
@@ -10,16 +10,30 @@ more accurate results with smaller uncertainties on fit parameters
 can be achieved using the trunchen method.  The trunchen method
 requires significantly more complicated ASTs and many more of them.
 """
+import os
+
 import numpy as np
 import h5py
 import tables
 
 from beast.observationmodel.noisemodel import toothpick
+from beast.observationmodel.noisemodel.compact import (
+    CompactNoiseModel,
+    is_compact_noisemodel,
+    write_compact_toothpick,
+)
+from beast.physicsmodel.helpers.gridbackends import (
+    mmap_dirname,
+    save_mmap_array,
+    take_rows,
+)
 
 __all__ = [
     "Generic_ToothPick_Noisemodel",
     "make_toothpick_noise_model",
     "get_noisemodelcat",
+    "noisemodel_arrays",
+    "noisemodel_to_mmap",
 ]
 
 
@@ -46,6 +60,7 @@ def make_toothpick_noise_model(
     use_rate=True,
     vega_fname=None,
     absflux_a_matrix=None,
+    compact=False,
     **kwargs
 ):
     """ toothpick noise model assumes that every filter is independent with
@@ -70,6 +85,10 @@ def make_toothpick_noise_model(
         absolute calibration a matrix giving the fractional uncertainties
         including correlated terms (off diagonals)
 
+    compact: boolean
+        set to save the binned AST statistics instead of the noise model
+        of every model (see beast.observationmodel.noisemodel.compact)
+
     returns
     -------
     noisefile: str
@@ -90,6 +109,12 @@ def make_toothpick_noise_model(
     else:
         model.fit_bins(nbins=30, completeness_mag_cut=80)
 
+    if compact:
+        print("Writing to disk into {0:s}".format(outname))
+        return write_compact_toothpick(
+            outname, model, absflux_a_matrix=absflux_a_matrix
+        )
+
     # evaluate the noise model for all the models in sedgrid
     bias, sigma, compl = model(sedgrid)
 
@@ -124,7 +149,7 @@ def make_toothpick_noise_model(
     return outname
 
 
-def get_noisemodelcat(filename):
+def get_noisemodelcat(filename, mmap_mode=None, indxs=None):
     """
     returns the noise model
 
@@ -132,20 +157,52 @@ def get_noisemodelcat(filename):
     ----------
     filename: str
         file containing the outputs from OneD_ASTs_ModelGenerator
+    mmap_mode: str, optional
+        if set, memory map the arrays converted by noisemodel_to_mmap
+        with this numpy.load mode (e.g., 'r') instead of reading them
+    indxs: ndarray, optional
+        if set, only read the noise model of these models (e.g., the
+        indexes of a trimmed grid written by trim_grid.trim_models_many),
+        a compact noise model does not depend on the models
 
     Returns
     -------
-    ntable : dict
+    ntable : dict or CompactNoiseModel
         dictonary containing the elements of the noise model
+        or the compact noise model to evaluate on the model fluxes
     """
-    nfile = h5py.File(filename, 'r')
-
-    # create a dictonary of the elements
     ntable = {}
-    for ckey in nfile.keys():
-        ntable[ckey] = np.array(nfile[ckey])
+    if is_compact_noisemodel(filename):
+        return CompactNoiseModel(filename)
+    elif mmap_mode is not None:
+        dirname = mmap_dirname(filename)
+        if not os.path.isdir(dirname):
+            raise IOError(
+                f"no memory mapped noise model in {dirname}, "
+                "convert it with noisemodel_to_mmap"
+            )
+        for cfile in sorted(os.listdir(dirname)):
+            if cfile.endswith(".npy"):
+                ntable[cfile[:-4]] = np.load(
+                    os.path.join(dirname, cfile), mmap_mode=mmap_mode
+                )
+                if indxs is not None:
+                    ntable[cfile[:-4]] = ntable[cfile[:-4]][indxs]
+    else:
+        nfile = h5py.File(filename, 'r')
 
-    nfile.close()
+        # create a dictonary of the elements
+        for ckey in nfile.keys():
+            if indxs is None:
+                ntable[ckey] = np.array(nfile[ckey])
+            else:
+                ntable[ckey] = take_rows(
+                    lambda start, stop: nfile[ckey][start:stop],
+                    nfile[ckey].shape[0],
+                    np.asarray(indxs),
+                )
+
+        nfile.close()
 
     # check that at least the 3 basic elements are included
     expected_elements = ["error", "bias", "completeness"]
@@ -154,3 +211,55 @@ def get_noisemodelcat(filename):
             raise ValueError(f"{cexp} values not found in noisemodel")
 
     return ntable
+
+
+def noisemodel_arrays(ntable, seds):
+    """
+    returns the noise model arrays of the models
+
+    Parameters
+    ----------
+    ntable: dict or CompactNoiseModel
+        noise model given by get_noisemodelcat
+    seds: ndarray or tables.Array
+        model fluxes (nmodels, nfilters), used to evaluate a compact
+        noise model
+
+    Returns
+    -------
+    ntable : dict
+        dictonary containing the bias, error and completeness of the models
+    """
+    if isinstance(ntable, CompactNoiseModel):
+        return ntable.evaluate(seds)
+    return ntable
+
+
+def noisemodel_to_mmap(filename, overwrite=False):
+    """
+    Write the noise model arrays as .npy files to be memory mapped
+    (see get_noisemodelcat)
+
+    Parameters
+    ----------
+    filename: str
+        noise model file
+    overwrite: bool
+        if set, replace an existing conversion
+
+    Returns
+    -------
+    dirname: str
+        directory with one .npy file per element of the noise model
+    """
+    dirname = mmap_dirname(filename)
+    if os.path.isdir(dirname) and not overwrite:
+        raise IOError(f"{dirname} already exists, use overwrite=True")
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+
+    with h5py.File(filename, "r") as nfile:
+        for ckey in nfile.keys():
+            save_mmap_array(os.path.join(dirname, ckey + ".npy"), nfile[ckey])
+
+    return dirname
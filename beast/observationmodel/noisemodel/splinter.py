@@ -11,12 +11,13 @@ import numpy as np
 
 import tables
 
+from beast.observationmodel.noisemodel.compact import write_compact_splinter
 
 __all__ = ["make_splinter_noise_model"]
 
 
 def make_splinter_noise_model(
-    outname, sedgrid, frac_unc=0.10, absflux_a_matrix=None, **kwargs
+    outname, sedgrid, frac_unc=0.10, absflux_a_matrix=None, compact=False, **kwargs
 ):
     """
     Splinter noise model assumes that every filter is independent with
@@ -39,12 +40,21 @@ def make_splinter_noise_model(
         including correlated terms (off diagonals)
         for the splinter model, only the diagonal terms are used
 
+    compact: boolean
+        set to save frac_unc instead of the noise model of every model
+        (see beast.observationmodel.noisemodel.compact)
+
     returns
     -------
 
     noisefile: str
         noisemodel file name
     """
+    if compact:
+        print("Writting to disk into {0:s}".format(outname))
+        return write_compact_splinter(
+            outname, frac_unc, absflux_a_matrix=absflux_a_matrix
+        )
 
     n_models, n_filters = sedgrid.seds.shape
 
@@ -0,0 +1,68 @@
+import numpy as np
+
+from beast.external.eztables import Table
+from beast.observationmodel.noisemodel.compact import CompactNoiseModel
+from beast.observationmodel.noisemodel.generic_noisemodel import get_noisemodelcat
+from beast.observationmodel.noisemodel.splinter import make_splinter_noise_model
+from beast.physicsmodel.grid import SpectralGrid
+from beast.physicsmodel.helpers.gridstats import symlog_flux
+from beast.tools.subgridding_tools import reduce_grid_info
+
+
+def test_compact_splinter_noisemodel(tmpdir):
+
+    # make super simplified model SED grid
+    lamb = np.linspace(1000.0, 4000, 4)
+    seds = np.logspace(-4, -3, 4)[None, :] * np.linspace(1, 1.5, 5)[:, None]
+    modelsedgrid = SpectralGrid(lamb=lamb, seds=seds, grid=[1], backend="memory")
+    absflux_a_matrix = np.array([0.01, 0.02, 0.03, 0.04])
+
+    noise_fname = str(tmpdir.join("splinter_noisemodel.grid.hd5"))
+    make_splinter_noise_model(
+        noise_fname, modelsedgrid, frac_unc=0.1, absflux_a_matrix=absflux_a_matrix
+    )
+    compact_fname = str(tmpdir.join("splinter_compact_noisemodel.grid.hd5"))
+    make_splinter_noise_model(
+        compact_fname,
+        modelsedgrid,
+        frac_unc=0.1,
+        absflux_a_matrix=absflux_a_matrix,
+        compact=True,
+    )
+
+    ntable = get_noisemodelcat(noise_fname)
+    compact_noise = get_noisemodelcat(compact_fname)
+    assert isinstance(compact_noise, CompactNoiseModel)
+    assert set(compact_noise.keys()) == {"bias", "error", "completeness"}
+
+    # evaluated in chunks of 2 models
+    compact_noise.chunk_size = 2
+    compact_ntable = compact_noise.evaluate(seds)
+    for key in ["bias", "error", "completeness"]:
+        np.testing.assert_allclose(compact_ntable[key], ntable[key])
+
+    compact_ntable = compact_noise.evaluate(seds, start=1, stop=4)
+    np.testing.assert_allclose(compact_ntable["error"], ntable["error"][1:4])
+
+
+def test_compact_reduce_grid_info(tmpdir):
+    rng = np.random.RandomState(1234)
+    seds = 10 ** rng.uniform(-4, -3, size=(30, 3))
+    tab = Table(dict(Av=rng.uniform(size=30)))
+    tab.header["filters"] = "F1 F2 F3"
+    fname = str(tmpdir.join("seds.grid.hd5"))
+    SpectralGrid(
+        np.array([1000.0, 2000.0, 3000.0]), seds=seds, grid=tab, backend="memory"
+    ).writeHDF(fname)
+
+    compact_fname = str(tmpdir.join("splinter_compact_noisemodel.grid.hd5"))
+    make_splinter_noise_model(
+        compact_fname, SpectralGrid(fname, backend="memory"), compact=True
+    )
+
+    # no stored flux stats: the compact noise model is evaluated on the seds
+    info = reduce_grid_info([fname], [compact_fname])
+    flux = symlog_flux(seds, np.zeros(seds.shape))
+    for i, f in enumerate(["F1", "F2", "F3"]):
+        assert info["symlog" + f + "_wd_bias"]["min"] == flux[:, i].min()
+        assert info["symlog" + f + "_wd_bias"]["max"] == flux[:, i].max()
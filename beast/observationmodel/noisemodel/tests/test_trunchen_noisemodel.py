@@ -0,0 +1,73 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+from beast.observationmodel.noisemodel.trunchen import MultiFilterASTs, _ast_cov_groups
+
+
+def test_ast_cov_groups():
+    rng = np.random.RandomState(1234)
+    vega_flux = np.array([1e-9, 2e-9, 3e-9])
+    counts = [20, 4, 30, 8]
+    in_mags = np.repeat(rng.uniform(18.0, 25.0, size=(len(counts), 3)), counts, axis=0)
+    iflux = np.power(10.0, -0.4 * in_mags)
+    rates = iflux * rng.normal(1.0, 0.1, size=in_mags.shape)
+    vega_mags = np.full(in_mags.shape, 20.0)
+    # unrecovered ASTs: in the 1st model and all but 5 in the last one
+    vega_mags[:3] = 99.99
+    vega_mags[-3:] = 99.99
+    starts = np.cumsum([0] + counts[:-1])
+
+    good, covs, biases, corrs, ifluxes, compls = _ast_cov_groups(
+        (in_mags, rates, vega_mags, vega_flux, starts)
+    )
+    np.testing.assert_array_equal(good, [True, False, True, False])
+
+    for k in [0, 2]:
+        recovered = np.arange(starts[k], starts[k] + counts[k])
+        recovered = recovered[vega_mags[recovered, 0] < 90]
+        diffs = rates[recovered] * vega_flux - iflux[recovered] * vega_flux
+        np.testing.assert_allclose(biases[k], np.mean(diffs, axis=0), rtol=1e-5)
+        np.testing.assert_allclose(covs[k], np.cov(diffs.T), rtol=1e-4)
+        np.testing.assert_allclose(corrs[k], np.corrcoef(diffs.T), rtol=1e-4)
+        np.testing.assert_allclose(ifluxes[k], iflux[starts[k]] * vega_flux, rtol=1e-6)
+        assert compls[k] == np.float32(len(recovered) / counts[k])
+
+
+def test_eval_models():
+    rng = np.random.RandomState(1234)
+    n_asts, n_filters = 30, 3
+    # noise model set from random AST results without reading an AST file
+    model = MultiFilterASTs.__new__(MultiFilterASTs)
+    model._input_fluxes = rng.uniform(1e-18, 1e-16, size=(n_asts, n_filters))
+    a = rng.normal(size=(n_asts, n_filters, n_filters)) * 1e-18
+    model._cov_matrices = np.einsum("kij,klj->kil", a, a) + np.eye(n_filters) * 1e-37
+    model._biases = rng.normal(size=(n_asts, n_filters)) * 1e-18
+    model._completenesses = rng.uniform(size=n_asts)
+    model._kdtree = cKDTree(np.log10(model._input_fluxes))
+
+    flux = rng.uniform(1e-18, 1e-16, size=(7, n_filters))
+    results = model._eval_models(flux)
+
+    assert results["icov_offdiag"].shape == (len(flux), 3)
+
+    for i in range(len(flux)):
+        dist, indxs = model._kdtree.query(np.log10(flux[i]), 10)
+        weights = 1.0 / np.maximum(dist, 0.01)
+        cov = np.average(model._cov_matrices[indxs], axis=0, weights=weights)
+        icov = np.linalg.inv(cov)
+        np.testing.assert_allclose(results["cov_diag"][i], np.diagonal(cov))
+        np.testing.assert_allclose(results["icov_diag"][i], np.diagonal(icov))
+        np.testing.assert_allclose(
+            results["icov_offdiag"][i], [icov[0, 1], icov[0, 2], icov[1, 2]]
+        )
+        np.testing.assert_allclose(
+            results["bias"][i],
+            np.average(model._biases[indxs], axis=0, weights=weights),
+        )
+        np.testing.assert_allclose(
+            results["completeness"][i],
+            np.average(model._completenesses[indxs], weights=weights),
+        )
+        np.testing.assert_allclose(
+            results["q_norm"][i], -0.5 * np.linalg.slogdet(cov)[1]
+        )
@@ -12,6 +12,9 @@ The noise model is computed in equally spaced bins in log flux space to
 avoid injecting noise when the ASTs grossly oversample the model space.
 This is the case for single band ASTs - this is always the case for the
 BEAST toothpick noise model.
+
+The ASTs of each filter are sorted once by input flux, so that each bin is
+a contiguous segment of the sorted ASTs, found with a binary search.
 """
 import math
 
@@ -27,6 +30,49 @@ from beast.observationmodel.noisemodel.helpers import convert_dict_to_structured
 __all__ = ["MultiFilterASTs"]
 
 
+def _interp_filters(flux, knots, values, nknots):
+    """
+    Linear interpolation of several quantities for all the filters at once
+    (same as np.interp for each filter and quantity)
+
+    Parameters
+    ----------
+    flux: ndarray
+        fluxes of the models (n_models, n_filters)
+
+    knots: ndarray
+        sorted fluxes of the bins of each filter, padded with +inf
+        (n_filters, n_knots)
+
+    values: ndarray
+        quantities at the knots, padded with the last value
+        (n_quantities, n_filters, n_knots)
+
+    nknots: ndarray
+        number of knots of each filter (n_filters)
+
+    Returns
+    -------
+    interp_values: ndarray
+        quantities at the model fluxes (n_quantities, n_models, n_filters)
+    """
+    filter_indxs = np.arange(knots.shape[0])[None, :]
+    # index of the first knot above each flux
+    indxs = (flux[:, :, None] >= knots[None, :, :]).sum(axis=2)
+    lo = np.minimum(np.maximum(indxs - 1, 0), nknots[None, :] - 1)
+    hi = np.minimum(indxs, nknots[None, :] - 1)
+
+    x_lo = knots[filter_indxs, lo]
+    dx = knots[filter_indxs, hi] - x_lo
+    v_lo = values[:, filter_indxs, lo]
+    dv = values[:, filter_indxs, hi] - v_lo
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(dx > 0.0, dv / dx, 0.0)
+    interp_values = slope * (flux - x_lo)[None, :, :] + v_lo
+    interp_values[:, np.isnan(flux)] = np.nan
+    return interp_values
+
+
 class MultiFilterASTs(NoiseModel):
     """ A noise model for which input information of ASTs are
     provided as one single table
@@ -197,34 +243,43 @@ class MultiFilterASTs(NoiseModel):
         bin_max_vals = 10 ** bin_max_vals
         bin_ave_vals = 10 ** bin_ave_vals
 
-        for i in range(nbins):
-            bindxs, = np.where(
-                (flux_in >= bin_min_vals[i]) & (flux_in < bin_max_vals[i])
-            )
-            n_bindxs = len(bindxs)
-            if n_bindxs > 0:
-                bin_flux_in = flux_in[bindxs]
-                bin_flux_out = flux_out[bindxs]
-                # compute completeness
-                g_bindxs, = np.where(bin_flux_out != 0.0)
-                n_g_bindxs = len(g_bindxs)
-                completeness[i] = n_g_bindxs / float(n_bindxs)
-                if n_g_bindxs > min_per_bin:
-                    good_bins[i] = 1
-                    ave_flux_in[i] = np.mean(bin_flux_in)
-                    bin_bias_flux = bin_flux_out[g_bindxs] - bin_flux_in[g_bindxs]
-                    if compute_stddev:
-                        # compute sigma via mean/stddev
-                        ave_bias[i] = np.mean(bin_bias_flux)
-                        std_bias[i] = np.std(bin_bias_flux)
-                    else:
-                        # compute sigma via percentiles
-                        # ave = 50th; std = (84th-16th)/2
-                        flux_percent_out = np.percentile(
-                            bin_bias_flux, [16.0, 50.0, 84.0]
-                        )
-                        ave_bias[i] = flux_percent_out[1]
-                        std_bias[i] = (flux_percent_out[2] - flux_percent_out[0]) / 2.0
+        # sort the ASTs once by input flux: the ASTs of a bin are then a
+        #   contiguous segment, with the same bounds as
+        #   (flux_in >= bin_min_vals) & (flux_in < bin_max_vals)
+        sort_indxs = np.argsort(flux_in, kind="stable")
+        flux_in = flux_in[sort_indxs]
+        flux_out = flux_out[sort_indxs]
+        bin_starts = np.searchsorted(flux_in, bin_min_vals, side="left")
+        bin_stops = np.searchsorted(flux_in, bin_max_vals, side="left")
+
+        # number of recovered ASTs in each bin from the cumulative counts
+        recovered = flux_out != 0.0
+        n_recovered = np.concatenate([[0], np.cumsum(recovered)])
+        n_bindxs = np.maximum(bin_stops - bin_starts, 0)
+        n_g_bindxs = np.where(
+            n_bindxs > 0, n_recovered[bin_stops] - n_recovered[bin_starts], 0
+        )
+        completeness[n_bindxs > 0] = n_g_bindxs[n_bindxs > 0] / n_bindxs[
+            n_bindxs > 0
+        ].astype(float)
+        good_bins[n_g_bindxs > min_per_bin] = 1
+
+        for i in np.flatnonzero(good_bins):
+            bin_flux_in = flux_in[bin_starts[i] : bin_stops[i]]
+            bin_flux_out = flux_out[bin_starts[i] : bin_stops[i]]
+            g_bindxs = recovered[bin_starts[i] : bin_stops[i]]
+            ave_flux_in[i] = np.mean(bin_flux_in)
+            bin_bias_flux = bin_flux_out[g_bindxs] - bin_flux_in[g_bindxs]
+            if compute_stddev:
+                # compute sigma via mean/stddev
+                ave_bias[i] = np.mean(bin_bias_flux)
+                std_bias[i] = np.std(bin_bias_flux)
+            else:
+                # compute sigma via percentiles
+                # ave = 50th; std = (84th-16th)/2
+                flux_percent_out = np.percentile(bin_bias_flux, [16.0, 50.0, 84.0])
+                ave_bias[i] = flux_percent_out[1]
+                std_bias[i] = (flux_percent_out[2] - flux_percent_out[0]) / 2.0
 
         # only pass back the bins with non-zero results
         gindxs, = np.where(good_bins == 1)
@@ -302,10 +357,32 @@ class MultiFilterASTs(NoiseModel):
 
             del d
 
-    def interpolate(self, sedgrid, progress=True):
+    def _interp_knots(self):
+        """
+        Sorted bin fluxes of each filter (padded with +inf) and the bias,
+        sigma and completeness at these fluxes (padded with the last value)
+        for _interp_filters
+        """
+        M = len(self.filters)
+        K = max(int(np.max(self._nasts)), 1)
+        knots = np.full((M, K), np.inf)
+        values = np.empty((3, M, K), dtype=float)
+        for i in range(M):
+            ncurasts = self._nasts[i]
+            arg_sort = np.argsort(self._fluxes[0:ncurasts, i])
+            knots[i, :ncurasts] = self._fluxes[0:ncurasts, i][arg_sort]
+            for k, qvals in enumerate([self._biases, self._sigmas, self._compls]):
+                values[k, i, :ncurasts] = qvals[0:ncurasts, i][arg_sort]
+                values[k, i, ncurasts:] = values[k, i, max(ncurasts - 1, 0)]
+        return knots, values
+
+    def interpolate(self, sedgrid, progress=True, chunk_size=100000):
         """
         Interpolate the results of the ASTs on a model grid
 
+        All the filters and quantities are interpolated at once, a chunk of
+        models at a time.
+
         Parameters
         ----------
         sedgrid: beast.core.grid type
@@ -314,6 +391,9 @@ class MultiFilterASTs(NoiseModel):
         progress: bool, optional
             if set, display a progress bar
 
+        chunk_size: int, optional
+            number of models interpolated at once
+
         Returns
         -------
         bias: ndarray
@@ -338,25 +418,23 @@ class MultiFilterASTs(NoiseModel):
         sigma = np.empty((N, M), dtype=float)
         compl = np.empty((N, M), dtype=float)
 
+        knots, values = self._interp_knots()
+        nknots = np.asarray(self._nasts, dtype=int)
+
+        starts = list(range(0, N, chunk_size))
         if progress is True:
-            it = tqdm(list(range(M)), desc="Evaluating model")
+            it = tqdm(starts, desc="Evaluating model")
         else:
-            it = list(range(M))
-
-        for i in it:
-
-            ncurasts = self._nasts[i]
-            _fluxes = self._fluxes[0:ncurasts, i]
-            _biases = self._biases[0:ncurasts, i]
-            _sigmas = self._sigmas[0:ncurasts, i]
-            _compls = self._compls[0:ncurasts, i]
-
-            arg_sort = np.argsort(_fluxes)
-            _fluxes = _fluxes[arg_sort]
+            it = starts
 
-            bias[:, i] = np.interp(flux[:, i], _fluxes, _biases[arg_sort])
-            sigma[:, i] = np.interp(flux[:, i], _fluxes, _sigmas[arg_sort])
-            compl[:, i] = np.interp(flux[:, i], _fluxes, _compls[arg_sort])
+        for start in it:
+            stop = min(start + chunk_size, N)
+            interp_values = _interp_filters(
+                np.asarray(flux[start:stop], dtype=float), knots, values, nknots
+            )
+            bias[start:stop] = interp_values[0]
+            sigma[start:stop] = interp_values[1]
+            compl[start:stop] = interp_values[2]
 
         return (bias, sigma, compl)
 
@@ -1,8 +1,16 @@
 """
 Trunchen version of noisemodel
 Goal is to compute the full n-band covariance matrix for each model
+
+The ASTs of the same model are grouped by sorting the AST input magnitudes
+once, and the covariance matrices of a batch of models are computed at once
+from the stacked centered flux differences. The noise model is evaluated on
+the model grid a chunk of models at a time with stacked matrix operations.
 """
+from multiprocessing import Pool
+
 import numpy as np
+import tables
 
 from scipy.spatial import cKDTree
 from tqdm import tqdm
@@ -14,6 +22,97 @@ from beast.observationmodel.vega import Vega
 __all__ = ["MultiFilterASTs"]
 
 
+def _ast_cov_groups(args):
+    """
+    Covariance matrices, biases and completenesses of groups of ASTs
+
+    Parameters
+    ----------
+    args : tuple
+        (in_mags, rates, vega_mags, vega_flux, starts)
+
+        in_mags, rates, vega_mags : KxN dim numpy arrays
+            input magnitudes, output normalized vega fluxes and output vega
+            magnitudes of K ASTs in N bands, sorted by group
+        vega_flux : N dim numpy vector
+            vega fluxes of the bands
+        starts : G dim numpy vector
+            index of the first AST of each group
+
+    Returns
+    -------
+    (good, cov_mats, biases, corr_mats, ifluxes, compls)
+
+    good : G dim boolean numpy vector
+           groups with more than 5 ASTs recovered in at least 1 band
+    cov_mats : GxNxN dim numpy array
+               covariance matrices in flux units
+    biases : GxN dim numpy array
+             biases in each band
+    corr_mats : GxNxN dim numpy array
+                correlation matrices
+    ifluxes : GxN dim numpy array
+              input fluxes in each band
+    compls : G dim numpy vector
+             AST completeness of each group
+    """
+    in_mags, rates, vega_mags, vega_flux, starts = args
+    n_groups = len(starts)
+    n_filters = in_mags.shape[1]
+    counts = np.diff(np.append(starts, len(in_mags)))
+    group_indxs = np.repeat(np.arange(n_groups), counts)
+
+    # the source has to be recovered in at least 1 band
+    #   this replicates how the observed catalog is created
+    recovered = np.any(vega_mags < 90, axis=1)
+    n_recovered = np.bincount(group_indxs[recovered], minlength=n_groups)
+    good = (counts > 5) & (n_recovered > 5)
+
+    cov_mats = np.zeros((n_groups, n_filters, n_filters), dtype=np.float64)
+    corr_mats = np.zeros((n_groups, n_filters, n_filters), dtype=np.float32)
+    biases = np.zeros((n_groups, n_filters), dtype=np.float64)
+    ifluxes = np.zeros((n_groups, n_filters), dtype=np.float32)
+    compls = np.zeros((n_groups), dtype=np.float32)
+
+    ast_indxs, = np.where(recovered & good[group_indxs])
+    if len(ast_indxs) == 0:
+        return (good, cov_mats, biases, corr_mats, ifluxes, compls)
+    ast_groups = group_indxs[ast_indxs]
+    gindxs, seg_starts = np.unique(ast_groups, return_index=True)
+    n_indxs = n_recovered[gindxs]
+
+    # the input fluxes are from the first recovered AST of the model
+    ifluxes[gindxs] = (
+        np.power(10.0, -0.4 * in_mags[ast_indxs[seg_starts]]) * vega_flux
+    )
+    # difference vector between the input and output fluxes
+    #    note that the input fluxes are in magnitudes and the
+    #    output fluxes in normalized vega fluxes
+    diffs = (rates[ast_indxs] * vega_flux - ifluxes[ast_groups]).astype(np.float32)
+
+    # biases and covariance matrices around said biases
+    biases[gindxs] = np.add.reduceat(diffs, seg_starts, axis=0) / n_indxs[:, None]
+    cdiffs = diffs - biases[ast_groups]
+    cov_mats[gindxs] = (
+        np.add.reduceat(np.einsum("ki,kj->kij", cdiffs, cdiffs), seg_starts, axis=0)
+        / (n_indxs - 1)[:, None, None]
+    )
+
+    # correlation matrices
+    stddevs = np.sqrt(np.diagonal(cov_mats[gindxs], axis1=1, axis2=2))
+    norm = stddevs[:, :, None] * stddevs[:, None, :]
+    corr_mats[gindxs] = np.divide(
+        cov_mats[gindxs],
+        norm,
+        out=np.zeros_like(norm),
+        where=norm > 0,
+    )
+
+    compls[gindxs] = n_indxs / counts[gindxs].astype(float)
+
+    return (good, cov_mats, biases, corr_mats, ifluxes, compls)
+
+
 class MultiFilterASTs(NoiseModel):
     """ Implement a noise model where the ASTs are provided as a single table
 
@@ -54,6 +153,20 @@ class MultiFilterASTs(NoiseModel):
 
         self.vega_flux = vega_flux
 
+    def _ast_arrays(self, filters, indxs=None):
+        """
+        Input magnitudes, output normalized vega fluxes and output vega
+        magnitudes of the ASTs (KxN dim numpy arrays)
+        """
+        if indxs is None:
+            indxs = slice(None)
+        return tuple(
+            np.column_stack(
+                [np.asarray(self.data[cfilter + suffix])[indxs] for cfilter in filters]
+            )
+            for suffix in ["_IN", "_RATE", "_VEGA"]
+        )
+
     def _calc_ast_cov(self, indxs, filters, return_all=False):
         """
         The NxN-dimensional covariance matrix and N-dimensional bias vector are
@@ -92,79 +205,29 @@ class MultiFilterASTs(NoiseModel):
                 AST completeness for this model
         """
 
-        # set the asts for this star using the input index array
-        asts = self.data[indxs]
-
-        # now check that the source was recovered in at least 1 band
-        #   this replicates how the observed catalog is created
-        n_asts = len(asts)
-        gtindxs = np.full((n_asts), 1)
-        for k in range(n_asts):
-            cgood = 0
-            for cfilter in filters:
-                if asts[cfilter + "_VEGA"][k] < 90:
-                    cgood = cgood + 1
-            gtindxs[k] = cgood
-
-        indxs, = np.where(gtindxs > 0)
-        n_indxs = len(indxs)
-        if n_indxs <= 5:
+        in_mags, rates, vega_mags = self._ast_arrays(filters, indxs)
+        n_filters = len(filters)
+        vega_flux = np.asarray(self.vega_flux)[:n_filters]
+        results = _ast_cov_groups((in_mags, rates, vega_mags, vega_flux, [0]))
+        if not results[0][0]:
             return False
 
-        # completeness
-        compl = float(n_indxs) / float(n_asts)
-
-        # setup the variables for output
-        n_filters = len(filters)
-        ifluxes = np.empty((n_filters), dtype=np.float32)
-        diffs = np.empty((n_filters, n_indxs), dtype=np.float32)
-        biases = np.empty((n_filters), dtype=np.float32)
-        cov_matrix = np.full((n_filters, n_filters), 0.0, dtype=np.float32)
-
-        for ck, cfilter in enumerate(filters):
-            ifluxes[ck] = (
-                np.power(10.0, -0.4 * asts[cfilter + "_IN"][indxs[0]])
-                * self.vega_flux[ck]
-            )
-            # compute the difference vector between the input and output fluxes
-            #    note that the input fluxes are in magnitudes and the
-            #    output fluxes in normalized vega fluxes
-            diffs[ck, :] = (
-                asts[cfilter + "_RATE"][indxs] * self.vega_flux[ck] - ifluxes[ck]
-            )
-            # compute the bias and standard deviations around said bias
-            biases[ck] = np.mean(diffs[ck, :])
-
-        # compute the covariance matrix
-        for ck in range(n_filters):
-            for dk in range(ck, n_filters):
-                for ci in range(n_indxs):
-                    cov_matrix[ck, dk] += (diffs[ck, ci] - biases[ck]) * (
-                        diffs[dk, ci] - biases[dk]
-                    )
-                # fill in the symmetric terms
-                cov_matrix[dk, ck] = cov_matrix[ck, dk]
-
-        cov_matrix /= n_indxs - 1
+        cov_matrix = results[1][0]
+        biases = results[2][0].astype(np.float32)
+        corr_matrix = results[3][0]
+        ifluxes = results[4][0]
+        compl = float(results[5][0])
         stddevs = np.sqrt(np.diagonal(cov_matrix))
 
-        # compute the corrleation matrix
-        corr_matrix = np.array(cov_matrix)
-        for ck in range(n_filters):
-            for dk in range(ck, n_filters):
-                if stddevs[ck] * stddevs[dk] > 0:
-                    corr_matrix[ck, dk] /= stddevs[ck] * stddevs[dk]
-                else:
-                    corr_matrix[ck, dk] = 0.0
-                # fill in the symmetric terms
-                corr_matrix[dk, ck] = corr_matrix[ck, dk]
+        recovered = np.any(vega_mags < 90, axis=1)
+        diffs = (rates[recovered] * vega_flux - ifluxes).T.astype(np.float32)
 
         if return_all:
             return (cov_matrix, biases, stddevs, corr_matrix, diffs, ifluxes, compl)
         else:
             return (cov_matrix, biases, compl)
 
-    def _calc_all_ast_cov(self, filters, progress=True):
+    def _calc_all_ast_cov(self, filters, progress=True, nprocs=1, batch_size=1000):
         """
         The covariance matrices and biases are calculated for all the
         independent models in the AST file
@@ -178,6 +241,12 @@ class MultiFilterASTs(NoiseModel):
         progress: bool, optional
             if set, display a progress bar
 
+        nprocs: int, optional
+            number of processes computing batches of models in parallel
+
+        batch_size: int, optional
+            number of models computed at once
+
         Returns
         -------
         (cov_mats, biases, completenesses, corr_mats, ifluxes)
@@ -194,53 +263,68 @@ class MultiFilterASTs(NoiseModel):
                   K vectors of the input fluxes in each filter
         """
 
-        # find the stars by using unique values of the magnitude values
-        #   in filtername
+        # find the stars by grouping the ASTs with the same input magnitude
+        #   in filtername: sorted, the ASTs of a model are contiguous
         filtername = filters[-1] + "_IN"
-        uvals, ucounts = np.unique(self.data[filtername], return_counts=True)
-        n_models = len(uvals)
+        mags = np.asarray(self.data[filtername])
+        sort_indxs = np.argsort(mags, kind="stable")
+        mags = mags[sort_indxs]
+        starts = np.flatnonzero(np.concatenate([[True], mags[1:] != mags[:-1]]))
+        n_models = len(starts)
 
-        # setup the output
+        in_mags, rates, vega_mags = self._ast_arrays(filters, sort_indxs)
         n_filters = len(filters)
-        all_covs = np.empty((n_models, n_filters, n_filters), dtype=np.float64)
-        all_corrs = np.empty((n_models, n_filters, n_filters), dtype=np.float32)
-        all_biases = np.empty((n_models, n_filters), dtype=np.float64)
-        all_ifluxes = np.empty((n_models, n_filters), dtype=np.float32)
-        all_compls = np.empty((n_models), dtype=np.float32)
+        vega_flux = np.asarray(self.vega_flux)[:n_filters]
 
-        ast_minmax = np.empty((2, n_filters), dtype=np.float64)
-        ast_minmax[0, :] = 1e99
-        ast_minmax[1, :] = 1e-99
+        # batches of models, with the ASTs of these models
+        batch_starts = list(range(0, n_models, batch_size))
 
-        # loop over the unique set of models and
-        # calculate the covariance matrix using the ASTs for this model
-        good_asts = np.full((n_models), True)
-        if progress is True:
-            it = tqdm(list(range(n_models)), desc="Calculating AST covariance matrices")
-        else:
-            it = list(range(n_models))
-        for i in it:
-            # find all the ASTs for this model
-            indxs, = np.where(self.data[filtername] == uvals[i])
-            n_asts = len(indxs)
-
-            if n_asts > 5:
-                results = self._calc_ast_cov(indxs, filters, return_all=True)
-                if results:
-                    all_covs[i, :, :] = results[0]
-                    all_biases[i, :] = results[1]
-                    all_corrs[i, :, :] = results[3]
-                    all_ifluxes[i, :] = results[5]
-                    all_compls[i] = results[6]
-
-                    for k in range(n_filters):
-                        ast_minmax[0, k] = min(ast_minmax[0, k], all_ifluxes[i, k])
-                        ast_minmax[1, k] = max(ast_minmax[1, k], all_ifluxes[i, k])
+        def batch_args():
+            for bstart in batch_starts:
+                ast_start = starts[bstart]
+                if bstart + batch_size < n_models:
+                    ast_stop = starts[bstart + batch_size]
                 else:
-                    good_asts[i] = False
+                    ast_stop = len(mags)
+                yield (
+                    in_mags[ast_start:ast_stop],
+                    rates[ast_start:ast_stop],
+                    vega_mags[ast_start:ast_stop],
+                    vega_flux,
+                    starts[bstart : bstart + batch_size] - ast_start,
+                )
+
+        if nprocs > 1:
+            p = Pool(nprocs)
+            batch_results = p.imap(_ast_cov_groups, batch_args())
+        else:
+            batch_results = (_ast_cov_groups(a) for a in batch_args())
+        if progress is True:
+            batch_results = tqdm(
+                batch_results,
+                total=len(batch_starts),
+                desc="Calculating AST covariance matrices",
+            )
 
+        results = [np.concatenate(r, axis=0) for r in zip(*batch_results)]
+        if nprocs > 1:
+            p.close()
+            p.join()
+
+        good_asts, all_covs, all_biases, all_corrs, all_ifluxes, all_compls = results
         indxs, = np.where(good_asts)
 
+        ast_minmax = np.empty((2, n_filters), dtype=np.float64)
+        ast_minmax[0, :] = 1e99
+        ast_minmax[1, :] = 1e-99
+        if len(indxs) > 0:
+            ast_minmax[0, :] = np.minimum(
+                ast_minmax[0, :], np.min(all_ifluxes[indxs, :], axis=0)
+            )
+            ast_minmax[1, :] = np.maximum(
+                ast_minmax[1, :], np.max(all_ifluxes[indxs, :], axis=0)
+            )
+
         return (
             all_covs[indxs, :, :],
             all_biases[indxs, :],
@@ -250,7 +334,7 @@ class MultiFilterASTs(NoiseModel):
             ast_minmax,
         )
 
-    def process_asts(self, filters):
+    def process_asts(self, filters, nprocs=1):
         """
         Process all the AST results creating average biases and
         covariance matrices for each model SED.
@@ -260,11 +344,14 @@ class MultiFilterASTs(NoiseModel):
         ----------
         filters : filter names for the AST data
 
+        nprocs : int, optional
+            number of processes computing the covariance matrices
+
         Returns
         -------
         N/A.
         """
-        results = self._calc_all_ast_cov(filters)
+        results = self._calc_all_ast_cov(filters, nprocs=nprocs)
 
         self._cov_matrices = results[0]
         self._biases = results[1]
@@ -277,20 +364,117 @@ class MultiFilterASTs(NoiseModel):
         self._kdtree = cKDTree(np.log10(self._input_fluxes))
         print("...done")
 
-    def __call__(self, sedgrid, generic_absflux_a_matrix=None, progress=True):
+    def _eval_models(self, flux, absflux_cov=None, generic_absflux_a_matrix=None):
+        """
+        Evaluate the noise model for a chunk of models at once
+
+        Parameters
+        ----------
+        flux : KxN dim numpy array
+            model fluxes
+        absflux_cov : KxNxN dim numpy array, optional
+            model dependent absflux covariance matrices
+        generic_absflux_a_matrix : NxN dim numpy array, optional
+            model independent absflux a matrix
+
+        Returns
+        -------
+        dict with the bias, error, completeness, q_norm, icov_diag,
+        icov_offdiag, cov_diag and cov_offdiag of the models
+        """
+        n_filters = flux.shape[1]
+
+        # find the 10 nearest neighbors to the model SEDs
+        dist, indxs = self._kdtree.query(np.log10(flux), 10, workers=-1)
+
+        # check if the distance is very small, set to a reasonable value
+        dist = np.maximum(dist, 0.01)
+
+        # use the distances to generate weights for the sums
+        dist_weights = 1.0 / dist
+        dist_weights /= np.sum(dist_weights, axis=1)[:, None]
+
+        # compute the interpolated covariance matrices
+        cov_matrices = np.einsum(
+            "ik,iklm->ilm", dist_weights, self._cov_matrices[indxs, :, :]
+        )
+
+        # add in the absflux covariance matrices
+        if absflux_cov is not None:
+            cov_matrices += absflux_cov
+        elif generic_absflux_a_matrix is not None:
+            cov_matrices += (
+                generic_absflux_a_matrix[None, :, :]
+                * flux[:, :, None]
+                * flux[:, None, :]
+            )
+
+        # invert covariance matrices
+        inv_cov_matrices = np.linalg.inv(cov_matrices)
+
+        # save the log of the determinat for normalization
+        #   the ln(det) is calculated and saved as this is what will
+        #   be used in the actual calculation
+        #       norm = 1.0/sqrt(Q)
+        det_signs, log_dets = np.linalg.slogdet(cov_matrices)
+        if np.any(det_signs <= 0):
+            print("something bad happened")
+            print("determinant of covarinace matrix is zero or negative")
+            print("for {0:d} models".format(np.sum(det_signs <= 0)))
+
+        # save the diagnonal and packed version of non-diagonal terms
+        diag_indxs = np.arange(n_filters)
+        offdiag_indxs = np.triu_indices(n_filters, k=1)
+        cov_diag = cov_matrices[:, diag_indxs, diag_indxs]
+
+        return {
+            "bias": np.einsum("ik,ikl->il", dist_weights, self._biases[indxs, :]),
+            "error": np.sqrt(cov_diag),
+            "completeness": np.sum(
+                dist_weights * self._completenesses[indxs], axis=1
+            ),
+            "q_norm": -0.5 * log_dets,
+            "icov_diag": inv_cov_matrices[:, diag_indxs, diag_indxs],
+            "icov_offdiag": inv_cov_matrices[:, offdiag_indxs[0], offdiag_indxs[1]],
+            "cov_diag": cov_diag,
+            "cov_offdiag": cov_matrices[:, offdiag_indxs[0], offdiag_indxs[1]],
+        }
+
+    def __call__(
+        self,
+        sedgrid,
+        generic_absflux_a_matrix=None,
+        progress=True,
+        chunk_size=10000,
+        outname=None,
+    ):
         """
         Interpolate the results of the ASTs on the model grid
 
+        The models are evaluated a chunk at a time.
+
         Parameters
         ----------
         sedgrid: beast.core.grid type
             model grid to interpolate AST results on
 
-        Returns
-        -------
+        generic_absflux_a_matrix: ndarray, optional
+            model independent absflux a matrix
 
         progress: bool, optional
             if set, display a progress bar
+
+        chunk_size: int, optional
+            number of models evaluated at once
+
+        outname: str, optional
+            if set, write the noise model to this HDF5 file a chunk at a
+            time instead of returning it
+
+        Returns
+        -------
+        (biases, sigmas, compls, q_norm, icov_diag, icov_offdiag,
+        cov_diag, cov_offdiag) or outname if set
         """
         flux = sedgrid.seds
         if generic_absflux_a_matrix is not None:
@@ -305,7 +489,7 @@ class MultiFilterASTs(NoiseModel):
             model_absflux_cov = False
 
         n_models, n_filters = flux.shape
-        n_offdiag = ((n_filters ** 2) - n_filters) / 2
+        n_offdiag = ((n_filters ** 2) - n_filters) // 2
 
         if n_filters != len(self.filters):
             raise AttributeError(
@@ -313,110 +497,82 @@ class MultiFilterASTs(NoiseModel):
                 + "be defined with the same number of filters"
             )
 
-        biases = np.empty((n_models, n_filters), dtype=np.float64)
-        sigmas = np.empty((n_models, n_filters), dtype=np.float64)
-        cov_diag = np.empty((n_models, n_filters), dtype=np.float64)
-        cov_offdiag = np.empty((n_models, n_offdiag), dtype=np.float64)
-        icov_diag = np.empty((n_models, n_filters), dtype=np.float64)
-        icov_offdiag = np.empty((n_models, n_offdiag), dtype=np.float64)
-        q_norm = np.empty((n_models), dtype=np.float64)
-        compls = np.empty((n_models), dtype=float)
-
+        shapes = {
+            "bias": (n_filters,),
+            "error": (n_filters,),
+            "completeness": (),
+            "q_norm": (),
+            "icov_diag": (n_filters,),
+            "icov_offdiag": (n_offdiag,),
+            "cov_diag": (n_filters,),
+            "cov_offdiag": (n_offdiag,),
+        }
+        if outname is None:
+            results = {
+                key: np.empty((n_models,) + shape, dtype=np.float64)
+                for key, shape in shapes.items()
+            }
+        else:
+            outfile = tables.open_file(outname, "w")
+            results = {
+                key: outfile.create_earray(
+                    outfile.root,
+                    key,
+                    atom=tables.Float64Atom(),
+                    shape=(0,) + shape,
+                    expectedrows=n_models,
+                )
+                for key, shape in shapes.items()
+            }
+
+        # unpack off diagonal terms the same way they were packed
+        offdiag_indxs = np.triu_indices(n_filters, k=1)
+        diag_indxs = np.arange(n_filters)
+
+        starts = list(range(0, n_models, chunk_size))
         if progress is True:
-            it = tqdm(list(range(n_models)), desc="Evaluating model")
+            it = tqdm(starts, desc="Evaluating model")
         else:
-            it = list(range(n_models))
+            it = starts
 
-        for i in it:
+        for start in it:
+            stop = min(start + chunk_size, n_models)
             # AST results are in vega fluxes
-            cur_flux = flux[i, :]
-
-            # find the 10 nearest neighbors to the model SED
-            result = self._kdtree.query(np.log10(cur_flux), 10)
-
-            dist = result[0]
-            indxs = result[1]
-
-            # check if the distance is very small, set to a reasonable value
-            tindxs, = np.where(dist < 0.01)
-            if len(tindxs) > 0:
-                dist[tindxs] = 0.01
-
-            # compute the interpolated covariance matrix
-            #    use the distances to generate weights for the sum
-            dist_weights = 1.0 / dist
-            dist_weights /= np.sum(dist_weights)
+            cur_flux = np.asarray(flux[start:stop], dtype=np.float64)
 
-            cur_cov_matrix = np.average(
-                self._cov_matrices[indxs, :, :], axis=0, weights=dist_weights
-            )
-
-            # add in the absflux covariance matrix
-            #   unpack off diagonal terms the same way they were packed
+            absflux_cov = None
             if model_absflux_cov:
-                m = 0
-                cur_cov_matrix[n_filters - 1, n_filters - 1] += absflux_cov_diag[
-                    i, n_filters - 1
-                ]
-                for k in range(n_filters - 1):
-                    cur_cov_matrix[k, k] += absflux_cov_diag[i, k]
-                    for l in range(k + 1, n_filters):
-                        cur_cov_matrix[k, l] += absflux_cov_offdiag[i, m]
-                        cur_cov_matrix[l, k] += absflux_cov_offdiag[i, m]
-                        m += 1
-            elif generic_absflux_a_matrix is not None:
-                for k in range(n_filters):
-                    for l in range(n_filters):
-                        cur_cov_matrix[k, l] += (
-                            generic_absflux_a_matrix[k, l] * cur_flux[k] * cur_flux[l]
-                        )
-
-            # compute the interpolated biases
-            biases[i, :] = np.average(
-                self._biases[indxs, :], axis=0, weights=dist_weights
+                absflux_cov = np.zeros((stop - start, n_filters, n_filters))
+                absflux_cov[:, diag_indxs, diag_indxs] = absflux_cov_diag[start:stop]
+                cur_offdiag = absflux_cov_offdiag[start:stop]
+                absflux_cov[:, offdiag_indxs[0], offdiag_indxs[1]] = cur_offdiag
+                absflux_cov[:, offdiag_indxs[1], offdiag_indxs[0]] = cur_offdiag
+
+            chunk_results = self._eval_models(
+                cur_flux,
+                absflux_cov=absflux_cov,
+                generic_absflux_a_matrix=generic_absflux_a_matrix,
             )
-
-            # compute the interpolated completeness
-            compls[i] = np.average(self._completenesses[indxs], weights=dist_weights)
-
-            # save the straight uncertainties
-            sigmas[i, :] = np.sqrt(np.diagonal(cur_cov_matrix))
-
-            # invert covariance matrix
-            inv_cur_cov_matrix = np.linalg.inv(cur_cov_matrix)
-
-            # save the diagnonal and packed version of non-diagonal terms
-            m = 0
-            icov_diag[i, n_filters - 1] = inv_cur_cov_matrix[
-                n_filters - 1, n_filters - 1
+            for key, values in chunk_results.items():
+                if outname is None:
+                    results[key][start:stop] = values
+                else:
+                    results[key].append(values)
+
+        if outname is not None:
+            outfile.close()
+            return outname
+
+        return tuple(
+            results[key]
+            for key in [
+                "bias",
+                "error",
+                "completeness",
+                "q_norm",
+                "icov_diag",
+                "icov_offdiag",
+                "cov_diag",
+                "cov_offdiag",
             ]
-            cov_diag[i, n_filters - 1] = cur_cov_matrix[n_filters - 1, n_filters - 1]
-            for k in range(n_filters - 1):
-                icov_diag[i, k] = inv_cur_cov_matrix[k, k]
-                cov_diag[i, k] = cur_cov_matrix[k, k]
-                for l in range(k + 1, n_filters):
-                    icov_offdiag[i, m] = inv_cur_cov_matrix[k, l]
-                    cov_offdiag[i, m] = cur_cov_matrix[k, l]
-                    m += 1
-
-            # save the log of the determinat for normalization
-            #   the ln(det) is calculated and saved as this is what will
-            #   be used in the actual calculation
-            #       norm = 1.0/sqrt(Q)
-            det = np.linalg.slogdet(cur_cov_matrix)
-            if det[0] <= 0:
-                print("something bad happened")
-                print("determinant of covarinace matrix is zero or negative")
-                print(det)
-            q_norm[i] = -0.5 * det[1]
-
-        return (
-            biases,
-            sigmas,
-            compls,
-            q_norm,
-            icov_diag,
-            icov_offdiag,
-            cov_diag,
-            cov_offdiag,
         )
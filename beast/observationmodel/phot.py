@@ -8,13 +8,18 @@ This also include functions to keep libraries up to date
 
 .. note::
 
-    integrations are done using :func:`trapz`
+    integrations are done using :func:`trapz`, through a (n_lambda, n_filters)
+    matrix of quadrature weights (see :func:`filter_weights`) so that the
+    fluxes of many spectra are a single product with that matrix
     Why not Simpsons? Simpsons principle is to take sequence of 3 points to
     make a quadratic interpolation. Which in the end, when filters have sharp
     edges, the error due to this "interpolation" are extremely large in
     comparison to the uncertainties induced by trapeze integration.
 """
 import sys
+import hashlib
+from collections import OrderedDict
+
 import numpy
 
 import tables
@@ -29,12 +34,19 @@ __default_vega__ = __ROOT__ + "/vega.hd5"
 # object to 10parsecs -- abs mag.
 distc = 4.0 * numpy.pi * (3.0856775e19) ** 2
 
+# quadrature weights of the filter sets, per filter set and wavelengths
+_weights_cache = OrderedDict()
+_weights_cache_size = 16
+
 __all__ = [
     "Filter",
     "IntegrationFilter",
     "load_all_filters",
     "load_filters",
     "load_Integrationfilters",
+    "filter_weights",
+    "get_filter_weights",
+    "apply_filter_weights",
     "extractPhotometry",
     "extractSEDs",
     "STmag_to_flux",
@@ -362,6 +374,148 @@ def load_Integrationfilters(flist, interp=True, lamb=None):
     return filters
 
 
+def _trapz_weights(x):
+    """ weights w of the trapeze rule: trapz(y, x) = sum(w * y) """
+    w = numpy.zeros(len(x), dtype=float)
+    if len(x) > 1:
+        dx = 0.5 * numpy.diff(x)
+        w[:-1] += dx
+        w[1:] += dx
+    return w
+
+
+def _array_digest(a):
+    """ digest of the values of an array (for the cache keys) """
+    return hashlib.sha1(numpy.ascontiguousarray(a, dtype=float).tobytes()).hexdigest()
+
+
+def _cache_weights(key, value):
+    """ keep the weights of the last filter sets used """
+    _weights_cache[key] = value
+    while len(_weights_cache) > _weights_cache_size:
+        _weights_cache.popitem(last=False)
+    return value
+
+
+def filter_weights(lamb, flist, absFlux=True):
+    """ Quadrature weights of a set of filters
+
+    The integrated fluxes of spectra `spec` (n_spectra, n_lambda) are
+    `spec @ weights`, the weights including the transmission, wavelengths,
+    trapeze rule, normalization by the integral of lambda T and the
+    absolute flux conversion. The weights are cached per filter set and
+    wavelengths.
+
+    Parameters
+    ----------
+    lamb: ndarray[float, ndim=1]
+        wavelength of the spectra (the filters are defined on it)
+
+    flist: sequence(filter)
+        list of filter object instances
+
+    absflux: bool
+        return SEDs in absolute fluxes if set
+
+    Returns
+    -------
+    cls: ndarray[float, ndim=1]
+        filters central wavelength
+
+    weights: ndarray[float, ndim=2]
+        quadrature weights (n_lambda, n_filters)
+    """
+    lamb = numpy.asarray(lamb, dtype=float)
+    key = (
+        "filters",
+        _array_digest(lamb),
+        tuple((str(k.name), _array_digest(k.transmit), k.lT) for k in flist),
+        bool(absFlux),
+    )
+    if key in _weights_cache:
+        _weights_cache.move_to_end(key)
+        return _weights_cache[key]
+
+    weights = numpy.zeros((len(lamb), len(flist)), dtype=float)
+    cls = numpy.empty(len(flist), dtype=float)
+    for e, k in enumerate(flist):
+        xl = k.transmit > 0.0
+        w = lamb[xl] * k.transmit[xl] * _trapz_weights(lamb[xl]) / k.lT
+        # apply absolute flux conversion if requested
+        if absFlux:
+            w /= distc
+        weights[xl, e] = w
+        cls[e] = k.cl
+
+    return _cache_weights(key, (cls, weights))
+
+
+def get_filter_weights(names, lamb, absFlux=True, filterLib=None):
+    """ Quadrature weights of filters of the library (see filter_weights)
+
+    The filters are only read from the library the first time a filter set
+    is used with given wavelengths.
+
+    Parameters
+    ----------
+    names: list[str]
+        normalized names according to filtersLib
+
+    lamb: ndarray[float, ndim=1]
+        wavelength of the spectra
+
+    absflux: bool
+        return SEDs in absolute fluxes if set
+
+    filterLib: path
+        path to the filter library hd5 file
+
+    Returns
+    -------
+    cls: ndarray[float, ndim=1]
+        filters central wavelength
+
+    weights: ndarray[float, ndim=2]
+        quadrature weights (n_lambda, n_filters)
+    """
+    lamb = numpy.asarray(lamb, dtype=float)
+    key = ("names", _array_digest(lamb), tuple(names), filterLib, bool(absFlux))
+    if key in _weights_cache:
+        _weights_cache.move_to_end(key)
+        return _weights_cache[key]
+
+    flist = load_filters(names, interp=True, lamb=lamb, filterLib=filterLib)
+    return _cache_weights(key, filter_weights(lamb, flist, absFlux=absFlux))
+
+
+def apply_filter_weights(spec, weights):
+    """ Integrated fluxes of spectra through filters
+
+    Only the wavelengths within the filters are used.
+
+    Parameters
+    ----------
+    spec: ndarray[float, ndim=2]
+        spectra (n_spectra, n_lambda)
+
+    weights: ndarray[float, ndim=2]
+        quadrature weights (n_lambda, n_filters) from filter_weights
+
+    Returns
+    -------
+    seds: ndarray[float, ndim=2]
+        integrated seds (n_spectra, n_filters)
+    """
+    spec = numpy.atleast_2d(spec)
+    used = numpy.flatnonzero(numpy.any(weights != 0.0, axis=1))
+    if len(used) == 0:
+        return numpy.zeros((spec.shape[0], weights.shape[1]), dtype=float)
+    if used[-1] - used[0] + 1 == len(used):
+        # contiguous range of wavelengths: no copy of the spectra
+        used = slice(used[0], used[-1] + 1)
+    return numpy.dot(spec[:, used], weights[used])
+
+
 def extractPhotometry(lamb, spec, flist, absFlux=True):
     """Extract seds from a one single spectrum
 
@@ -387,18 +541,8 @@ def extractPhotometry(lamb, spec, flist, absFlux=True):
     seds: ndarray[float, ndim=1]
         integrated sed
     """
-    cls = numpy.empty(len(flist), dtype=float)
-    seds = numpy.empty(len(flist), dtype=float)
-    for e, k in enumerate(flist):
-        xl = k.transmit > 0.0
-        tmp = lamb[xl] * k.transmit[xl]
-        s0 = spec[:, xl]
-        # apply absolute flux conversion if requested
-        if absFlux:
-            s0 /= distc
-        a = trapz(tmp[None, :] * s0, lamb[xl], axis=1)
-        seds[e] = a / k.lT  # divide by integral (lambda T dlambda)
-        cls[e] = k.cl
+    cls, weights = filter_weights(lamb, flist, absFlux=absFlux)
+    seds = apply_filter_weights(spec, weights)[0]
 
     return cls, seds
 
@@ -428,19 +572,8 @@ def extractSEDs(g0, flist, absFlux=True):
     grid: Table
         SED grid properties table from g0 (g0.grid)
     """
-    lamb = g0.lamb
-    seds = numpy.empty((len(g0.grid), len(flist)), dtype=float)
-    cls = numpy.empty(len(flist), dtype=float)
-    for e, k in enumerate(flist):
-        xl = k.transmit > 0.0
-        tmp = lamb[xl] * k.transmit[xl]
-        s0 = g0.seds[:, xl]
-        # apply absolute flux conversion if requested
-        if absFlux:
-            s0 /= distc
-        a = trapz(tmp[None, :] * s0, lamb[xl], axis=1)
-        seds[:, e] = a / k.lT
-        cls[e] = k.cl
+    cls, weights = filter_weights(g0.lamb[:], flist, absFlux=absFlux)
+    seds = apply_filter_weights(g0.seds[:], weights)
 
     return cls, seds, g0.grid
 
@@ -0,0 +1,30 @@
+import numpy as np
+from scipy.integrate import trapz
+
+from beast.observationmodel import phot
+
+
+def test_filter_weights():
+    rng = np.random.RandomState(1234)
+    lamb = np.sort(rng.uniform(1000.0, 10000.0, size=300))
+    spec = rng.uniform(size=(20, len(lamb)))
+    flist = []
+    for i, (lmin, lmax) in enumerate([(2000.0, 3000.0), (2500.0, 6000.0)]):
+        in_band = (lamb > lmin) & (lamb < lmax)
+        transmit = np.where(in_band, rng.uniform(size=len(lamb)), 0.0)
+        flist.append(phot.Filter(lamb, transmit, name="F{0:d}".format(i)))
+
+    for absFlux in [True, False]:
+        cls, weights = phot.filter_weights(lamb, flist, absFlux=absFlux)
+        seds = phot.apply_filter_weights(spec, weights)
+        for e, k in enumerate(flist):
+            xl = k.transmit > 0.0
+            exp_seds = trapz(lamb[xl] * k.transmit[xl] * spec[:, xl], lamb[xl], axis=1)
+            exp_seds /= k.lT
+            if absFlux:
+                exp_seds /= phot.distc
+            np.testing.assert_allclose(seds[:, e], exp_seds, rtol=1e-12)
+            assert cls[e] == k.cl
+
+    # cached for the same filters and wavelengths
+    assert phot.filter_weights(lamb, flist)[1] is phot.filter_weights(lamb, flist)[1]
@@ -1,6 +1,8 @@
+import numpy as np
 from astropy.tests.helper import remote_data
 
 from beast.observationmodel.noisemodel import generic_noisemodel as noisemodel
+from beast.observationmodel.noisemodel.toothpick import _interp_filters
 from beast.observationmodel.noisemodel.absflux_covmat import hst_frac_matrix
 from beast.physicsmodel.grid import FileSEDGrid
 from beast.tests.helpers import download_rename, compare_hdf5
@@ -49,3 +51,27 @@ def test_toothpick_noisemodel():
 
     # compare the new to the cached version
     compare_hdf5(noise_fname_cache, noise_fname)
+
+
+def test_interp_filters():
+    rng = np.random.RandomState(1234)
+    nknots = np.array([5, 3, 1])
+    knots = np.full((3, 5), np.inf)
+    values = np.empty((2, 3, 5))
+    for i, n in enumerate(nknots):
+        knots[i, :n] = np.sort(rng.uniform(1.0, 10.0, size=n))
+        values[:, i, :n] = rng.uniform(size=(2, n))
+        values[:, i, n:] = values[:, i, n - 1 : n]
+
+    # models below, inside and above the knots
+    flux = rng.uniform(0.0, 11.0, size=(50, 3))
+    flux[0] = knots[:, 0]
+
+    interp_values = _interp_filters(flux, knots, values, nknots)
+    for k in range(2):
+        for i, n in enumerate(nknots):
+            np.testing.assert_allclose(
+                interp_values[k, :, i],
+                np.interp(flux[:, i], knots[i, :n], values[k, i, :n]),
+                rtol=1e-12,
+            )
@@ -21,6 +21,7 @@ from astropy import units
 from tqdm import tqdm
 
 from beast.physicsmodel.stars import stellib
+from beast.observationmodel import phot
 from beast.physicsmodel.grid import SpectralGrid
 from beast.physicsmodel.prior_weights_dust import PriorWeightsDust
 from beast.external.eztables import Table
@@ -142,6 +143,76 @@ def _make_dust_fA_valid_points_generator(it, min_Rv, max_Rv):
     return npts, pts
 
 
+def _dust_curves(extLaw, lamb, dust_pts, with_fA):
+    """
+    Extinction curves (transmission) of a block of dust points, from the
+    normalized curves of the law (memoized per R(V), f_A) scaled by A(V)
+
+    Parameters
+    ----------
+    extLaw: extinction.ExtinctionLaw
+        extinction law
+
+    lamb: ndarray
+        wavelengths of the spectra
+
+    dust_pts: sequence
+        (Av, Rv, f_A) or (Av, Rv) points
+
+    with_fA: bool
+        if the points include f_A
+
+    Returns
+    -------
+    curves: ndarray
+        exp(-A(lamb)) for each point (n_pts, n_lambda)
+    """
+    dust_pts = np.asarray(dust_pts, dtype=float)
+    f_A = dust_pts[:, 2] if with_fA else None
+    norm_curves = extLaw.curves(lamb, Rv=dust_pts[:, 1], f_A=f_A)
+    return np.exp(-1.0 * dust_pts[:, 0, None] * norm_curves)
+
+
+def _extinguished_seds(spectra, curves, weights):
+    """
+    Integrated fluxes of the spectra extinguished by each dust curve
+
+    The extinction curves are folded into the filter weights, so the fluxes
+    for all the dust points of the block are one product with the spectra.
+
+    Parameters
+    ----------
+    spectra: ndarray
+        spectra of the models (n_models, n_lambda)
+
+    curves: ndarray
+        extinction curves (n_pts, n_lambda)
+
+    weights: ndarray
+        quadrature weights of the filters (n_lambda, n_filters)
+
+    Returns
+    -------
+    seds: ndarray
+        fluxes (n_pts, n_models, n_filters)
+    """
+    n_pts = curves.shape[0]
+    n_lambda, n_filters = weights.shape
+    block_weights = curves.T[:, :, None] * weights[:, None, :]
+    seds = phot.apply_filter_weights(
+        spectra, block_weights.reshape(n_lambda, n_pts * n_filters)
+    )
+    return seds.reshape(-1, n_pts, n_filters).transpose(1, 0, 2)
+
+
+def _log_fluxes(seds):
+    """ log10 of the fluxes, -100 for fluxes <= 0 """
+    logseds = np.full(seds.shape, -100.0)
+    indxs = seds > 0
+    logseds[indxs] = np.log10(seds[indxs])
+    return logseds
+
+
 def apply_distance_grid(specgrid, distances, redshift=0):
     """
     Distances are applied to the spectral grid by copying the grid and
@@ -229,6 +300,8 @@ def make_extinguished_grid(
     add_spectral_properties_kwargs=None,
     absflux_cov=False,
     filterLib=None,
+    dust_block_size=10,
+    chunk_memory=None,
 ):
     """
     Extinguish spectra and extract an SEDGrid through given series of filters
@@ -274,6 +347,10 @@ def make_extinguished_grid(
         Note that this means len(spec_grid * chunksize)
         If default <= 0, all models will be returned at once.
 
+    chunk_memory: float, optional
+        memory budget in bytes of the arrays of a chunk (SEDs, grid
+        properties and covariances), sets chunksize if given
+
     filterLib:  str
         full filename to the filter library hd5 file
 
@@ -286,6 +363,10 @@ def make_extinguished_grid(
         set to calculate the absflux covariance matrices for each model
         (can be very slow!!!  But it is the right thing to do)
 
+    dust_block_size: int, optional (default=10)
+        number of dust points whose SEDs are computed in one product with
+        the spectra (memory of n_models x dust_block_size x n_filters)
+
     Returns
     -------
     g: grid.SpectralGrid
@@ -355,116 +436,146 @@ def make_extinguished_grid(
     N0 = len(g0.grid)
     N = N0 * npts
 
-    if chunksize <= 0:
+    # the spectra are read once and the filters are integrated through a
+    #   cached matrix of quadrature weights, in which the extinction curves
+    #   of a block of dust points are folded (no copy of the grid per point)
+    lamb = np.asarray(g0.lamb[:], dtype=float)
+    spectra = g0.seds[:]
+    n_filters = len(filter_names)
+    _lamb, weights = phot.get_filter_weights(filter_names, lamb, filterLib=filterLib)
+
+    # extra "spectral bands" (log fluxes in the grid table) done the same way
+    #   only the callables need the extinguished spectra
+    prop_names = []
+    prop_weights = []
+    callables = None
+    if add_spectral_properties_kwargs is not None:
+        nameformat = add_spectral_properties_kwargs.pop("nameformat", "{0:s}") + "_wd"
+        prop_filternames = add_spectral_properties_kwargs.get("filternames", None)
+        if prop_filternames is not None:
+            prop_names += ["log" + nameformat.format(fk) for fk in prop_filternames]
+            prop_weights.append(
+                phot.get_filter_weights(prop_filternames, lamb, filterLib=filterLib)[1]
+            )
+        prop_filters = add_spectral_properties_kwargs.get("filters", None)
+        if prop_filters is not None:
+            prop_names += ["log" + nameformat.format(fk.name) for fk in prop_filters]
+            flist = phot.load_Integrationfilters(prop_filters, interp=True, lamb=lamb)
+            prop_weights.append(phot.filter_weights(lamb, flist)[1])
+        callables = add_spectral_properties_kwargs.get("callables", None)
+    all_weights = np.hstack([weights] + prop_weights)
+
+    # number of dust points per chunk from the memory budget of the outputs
+    if chunk_memory is not None:
+        n_values = n_filters + len(prop_names) + len(g0.keys()) + 4
+        if absflux_cov:
+            n_values += n_filters + ((n_filters ** 2) - n_filters) // 2
+        chunksize = max(1, int(chunk_memory // (8 * N0 * n_values)))
+
+    if (chunksize <= 0) or (chunksize >= npts):
         print("Generating a final grid of {0:d} points".format(N))
+        chunksize = npts
     else:
         print(
-            "Generating a final grid of {0:d} points in {1:d}"
-            + " pieces".format(N, int(float(N0) / chunksize + 1.0))
+            "Generating a final grid of {0:d} points in {1:d} pieces".format(
+                N, int(np.ceil(float(npts) / chunksize))
+            )
         )
 
-    if chunksize <= 0:
-        chunksize = npts
-
-    if add_spectral_properties_kwargs is not None:
-        nameformat = add_spectral_properties_kwargs.pop("nameformat", "{0:s}") + "_wd"
-
     for chunk_pts in helpers.chunks(pts, chunksize):
         # iter over chunks of models
+        N_chunk = N0 * len(chunk_pts)
 
         # setup chunk outputs
-        cols = {"Av": np.empty(N, dtype=float), "Rv": np.empty(N, dtype=float)}
+        cols = {
+            "Av": np.empty(N_chunk, dtype=float),
+            "Rv": np.empty(N_chunk, dtype=float),
+        }
 
         if with_fA:
-            cols["Rv_A"] = np.empty(N, dtype=float)
-            cols["f_A"] = np.empty(N, dtype=float)
+            cols["Rv_A"] = np.empty(N_chunk, dtype=float)
+            cols["f_A"] = np.empty(N_chunk, dtype=float)
 
         keys = list(g0.keys())
         for key in keys:
-            cols[key] = np.empty(N, dtype=float)
+            cols[key] = np.empty(N_chunk, dtype=float)
+        for key in prop_names:
+            cols[key] = np.empty(N_chunk, dtype=float)
 
-        n_filters = len(filter_names)
-        _seds = np.empty((N, n_filters), dtype=float)
+        _seds = np.empty((N_chunk, n_filters), dtype=float)
         if absflux_cov:
-            n_offdiag = ((n_filters ** 2) - n_filters) / 2
-            _cov_diag = np.empty((N, n_filters), dtype=float)
-            _cov_offdiag = np.empty((N, n_offdiag), dtype=float)
-
-        for count, pt in enumerate(tqdm(chunk_pts, desc="SED grid")):
-
-            if with_fA:
-                Av, Rv, f_A = pt
-                dust_prior_weight = dustpriors.get_weight(Av, Rv, f_A)
-                Rv_MW = extLaw.get_Rv_A(Rv, f_A)
-                r = g0.applyExtinctionLaw(extLaw, Av=Av, Rv=Rv, f_A=f_A, inplace=False)
-                # add extra "spectral bands" if requested
-                if add_spectral_properties_kwargs is not None:
-                    r = add_spectral_properties(
-                        r,
-                        nameformat=nameformat,
-                        filterLib=filterLib,
-                        **add_spectral_properties_kwargs
-                    )
-                temp_results = r.getSEDs(filter_names, filterLib=filterLib)
+            n_offdiag = ((n_filters ** 2) - n_filters) // 2
+            _cov_diag = np.empty((N_chunk, n_filters), dtype=float)
+            _cov_offdiag = np.empty((N_chunk, n_offdiag), dtype=float)
+
+        for block_start in tqdm(
+            range(0, len(chunk_pts), dust_block_size), desc="SED grid"
+        ):
+            block_pts = chunk_pts[block_start : block_start + dust_block_size]
+            curves = _dust_curves(extLaw, lamb, block_pts, with_fA)
+            block_seds = _extinguished_seds(spectra, curves, all_weights)
+
+            for i, pt in enumerate(block_pts):
+                count = block_start + i
+                k1 = N0 * count
+                k2 = N0 * (count + 1)
+
                 # adding the dust parameters to the models
-                cols["Av"][N0 * count : N0 * (count + 1)] = Av
-                cols["Rv"][N0 * count : N0 * (count + 1)] = Rv
-                cols["f_A"][N0 * count : N0 * (count + 1)] = f_A
-                cols["Rv_A"][N0 * count : N0 * (count + 1)] = Rv_MW
-
-            else:
-                Av, Rv = pt
-                dust_prior_weight = dustpriors.get_weight(Av, Rv, 1.0)
-                r = g0.applyExtinctionLaw(extLaw, Av=Av, Rv=Rv, inplace=False)
-
-                if add_spectral_properties_kwargs is not None:
-                    r = add_spectral_properties(
-                        r,
-                        nameformat=nameformat,
-                        filterLib=filterLib,
-                        **add_spectral_properties_kwargs
+                if with_fA:
+                    Av, Rv, f_A = pt
+                    dust_prior_weight = dustpriors.get_weight(Av, Rv, f_A)
+                    cols["f_A"][k1:k2] = f_A
+                    cols["Rv_A"][k1:k2] = extLaw.get_Rv_A(Rv, f_A)
+                else:
+                    Av, Rv = pt
+                    dust_prior_weight = dustpriors.get_weight(Av, Rv, 1.0)
+                cols["Av"][k1:k2] = Av
+                cols["Rv"][k1:k2] = Rv
+
+                # assign the extinguished SEDs to the output object
+                _seds[k1:k2] = block_seds[i, :, :n_filters]
+                if len(prop_names) > 0:
+                    logseds = _log_fluxes(block_seds[i, :, n_filters:])
+                    for j, key in enumerate(prop_names):
+                        cols[key][k1:k2] = logseds[:, j]
+
+                if callables is not None:
+                    r = g0.applyExtinctionLaw(
+                        extLaw, inplace=False, **dict(zip(["Av", "Rv", "f_A"], pt))
                     )
-                temp_results = r.getSEDs(filter_names, filterLib=filterLib)
-                # adding the dust parameters to the models
-                cols["Av"][N0 * count : N0 * (count + 1)] = Av
-                cols["Rv"][N0 * count : N0 * (count + 1)] = Rv
-
-            # get new attributes if exist
-            for key in list(temp_results.grid.keys()):
-                if key not in keys:
-                    k1 = N0 * count
-                    k2 = N0 * (count + 1)
-                    cols.setdefault(key, np.empty(N, dtype=float))[
-                        k1:k2
-                    ] = temp_results.grid[key]
-
-            # compute the fractional absflux covariance matrices
-            if absflux_cov:
-                absflux_covmats = calc_absflux_cov_matrices(
-                    r, temp_results, filter_names
-                )
-                _cov_diag[N0 * count : N0 * (count + 1)] = absflux_covmats[0]
-                _cov_offdiag[N0 * count : N0 * (count + 1)] = absflux_covmats[1]
-
-            # assign the extinguished SEDs to the output object
-            _seds[N0 * count : N0 * (count + 1)] = temp_results.seds[:]
-
-            # copy the rest of the parameters
-            for key in keys:
-                cols[key][N0 * count : N0 * (count + 1)] = g0.grid[key]
-
-            # multiply existing prior weights by the dust prior weight
-            cols["weight"][N0 * count : N0 * (count + 1)] *= dust_prior_weight
-            cols["prior_weight"][N0 * count : N0 * (count + 1)] *= dust_prior_weight
-
-            if count == 0:
-                cols["lamb"] = temp_results.lamb[:]
-
-        _lamb = cols.pop("lamb")
-
-        # free the memory of temp_results
-        # del temp_results
-        # del tempgrid
+                    r = add_spectral_properties(r, callables=callables)
+                    # get new attributes if exist
+                    for key in list(r.grid.keys()):
+                        if (key not in keys) and (key not in prop_names):
+                            cols.setdefault(key, np.empty(N_chunk, dtype=float))[
+                                k1:k2
+                            ] = r.grid[key]
+
+                # compute the fractional absflux covariance matrices
+                #   from the spectra extinguished by the curve of the point
+                if absflux_cov:
+                    r = SpectralGrid(
+                        lamb, seds=spectra * curves[i], grid=g0.grid, backend="memory"
+                    )
+                    temp_results = SpectralGrid(
+                        _lamb,
+                        seds=block_seds[i, :, :n_filters],
+                        grid=r.grid,
+                        backend="memory",
+                    )
+                    absflux_covmats = calc_absflux_cov_matrices(
+                        r, temp_results, filter_names
+                    )
+                    _cov_diag[k1:k2] = absflux_covmats[0]
+                    _cov_offdiag[k1:k2] = absflux_covmats[1]
+
+                # copy the rest of the parameters
+                for key in keys:
+                    cols[key][k1:k2] = g0.grid[key]
+
+                # multiply existing prior weights by the dust prior weight
+                cols["weight"][k1:k2] *= dust_prior_weight
+                cols["prior_weight"][k1:k2] *= dust_prior_weight
 
         # Ship
         if absflux_cov:
@@ -1,6 +1,15 @@
 """
 Extinction Curves
+
+All the laws are linear in A(V): the normalized curves A(lambda)/A(V) only
+depend on the other parameters (R(V), f_A). `ExtinctionLaw.curves` gives
+them for arrays of parameters on a wavelength grid, memoized on the law,
+the parameters and the wavelengths, so that the curves for any A(V) are
+Av * curves without evaluating the law again.
 """
+import hashlib
+from collections import OrderedDict
+
 import numpy as np
 from scipy import interpolate, interp
 
@@ -24,6 +33,11 @@ __all__ = [
 
 libdir = __ROOT__
 
+# normalized curves A(lambda)/A(V) memoized on
+#   (law name, wavelengths digest, parameters)
+_curve_bank = OrderedDict()
+_curve_bank_size = 1000
+
 
 class ExtinctionLaw(object):
     """
@@ -38,6 +52,9 @@ class ExtinctionLaw(object):
        Name identifying the extinction law
     """
 
+    # parameters of the law (other than Av) the curves depend on
+    curve_params = ("Rv",)
+
     def __init__(self):
         self.name = "None"
 
@@ -47,6 +64,115 @@ class ExtinctionLaw(object):
         """
         raise NotImplementedError
 
+    def curves(self, lamb, Rv=None, f_A=None):
+        """
+        Normalized extinction curves A(lambda)/A(V) for arrays of parameters
+
+        A(lambda) = Av * curve, the curves are memoized on the law, the
+        parameters and the wavelengths. Parameters the law does not depend
+        on (see curve_params) are ignored, and the default of the law is
+        used for parameters set to None.
+
+        Parameters
+        ----------
+        lamb: ndarray(dtype=float)
+            wavelengths [in Angstroms] at which to evaluate the law.
+
+        Rv: float or ndarray(dtype=float)
+            R(V) values
+
+        f_A: float or ndarray(dtype=float)
+            mixture ratios (mixture laws only)
+
+        Returns
+        -------
+        curves: ndarray(dtype=float)
+            A(lambda)/A(V) for each set of parameters (n_curves, n_lambda)
+        """
+        _lamb = np.atleast_1d(units.Quantity(lamb, units.angstrom).value)
+        _lamb = _lamb.astype(float)
+        # one curve per set of parameters given, also for the parameters
+        #   the law does not depend on (the same curve is then repeated)
+        inputs = [
+            (pname, np.atleast_1d(np.asarray(pval, dtype=float)))
+            for pname, pval in [("Rv", Rv), ("f_A", f_A)]
+            if pval is not None
+        ]
+        if len(inputs) > 0:
+            n_curves = np.broadcast(*[pval for pname, pval in inputs]).size
+        else:
+            n_curves = 1
+        pnames = [pname for pname, pval in inputs if pname in self.curve_params]
+        pvals = [
+            np.broadcast_to(pval, (n_curves,))
+            for pname, pval in inputs
+            if pname in self.curve_params
+        ]
+
+        lamb_digest = hashlib.sha1(_lamb.tobytes()).hexdigest()
+        keys = [
+            (self.name, lamb_digest)
+            + tuple((pname, float(pval[i])) for pname, pval in zip(pnames, pvals))
+            for i in range(n_curves)
+        ]
+
+        # only the curves not in the bank are computed
+        found = {}
+        missing = OrderedDict()
+        for i, key in enumerate(keys):
+            if key in _curve_bank:
+                _curve_bank.move_to_end(key)
+                found[key] = _curve_bank[key]
+            elif key not in missing:
+                missing[key] = i
+        if len(missing) > 0:
+            indxs = list(missing.values())
+            new_curves = self._curves(
+                _lamb,
+                len(indxs),
+                **{pname: pval[indxs] for pname, pval in zip(pnames, pvals)}
+            )
+            for key, curve in zip(missing.keys(), new_curves):
+                found[key] = curve
+                _curve_bank[key] = curve
+            while len(_curve_bank) > _curve_bank_size:
+                _curve_bank.popitem(last=False)
+
+        return np.array([found[key] for key in keys])
+
+    def _curves(self, lamb, n_curves, **params):
+        """
+        Compute normalized curves (see curves), one set of parameters at a
+        time (to be vectorized by the laws when possible)
+
+        Parameters
+        ----------
+        lamb: ndarray(dtype=float)
+            wavelengths [in Angstroms]
+
+        n_curves: int
+            number of curves
+
+        **params: ndarray(dtype=float)
+            parameter values of the curves (n_curves)
+
+        Returns
+        -------
+        curves: ndarray(dtype=float)
+            A(lambda)/A(V) (n_curves, n_lambda)
+        """
+        return np.array(
+            [
+                self.function(
+                    lamb,
+                    Av=1.0,
+                    Alambda=True,
+                    **{pname: pval[i] for pname, pval in params.items()}
+                )
+                for i in range(n_curves)
+            ]
+        )
+
     def __call__(self, *args, **kwargs):
         return self.function(*args, **kwargs)
 
@@ -74,44 +200,20 @@ class Cardelli89(ExtinctionLaw):
         self.name = "Cardelli89"
         self.x_range = [0.3, 10.0]  # inverse microns
 
-    def function(self, lamb, Av=1.0, Rv=3.1, Alambda=True, **kwargs):
+    def _coefficients(self, x):
         """
-        Cardelli89 extinction Law
+        a(x) and b(x) coefficients of the law (Eq 2-5), A(lambda)/A(V) being
+        a + b / Rv
 
         Parameters
         ----------
-        lamb: float or ndarray(dtype=float)
-            wavelength [in Angstroms] at which to evaluate the law.
-
-        Av: float
-            desired A(V) (default: 1.0)
-
-        Rv: float
-            desired R(V) (default: 3.1)
-
-        Alambda: bool
-            if set returns +2.5*1./log(10.)*tau, tau otherwise
+        x: ndarray(dtype=float)
+            wavenumbers [in inverse microns]
 
         Returns
         -------
-        r: float or ndarray(dtype=float)
-            attenuation as a function of wavelength
-            depending on Alambda option +2.5*1./log(10.)*tau,  or tau
+        a, b: ndarray(dtype=float)
         """
-        # ensure the units are in angstrom
-        _lamb = units.Quantity(lamb, units.angstrom).value
-
-        if isinstance(_lamb, float) or isinstance(_lamb, np.float_):
-            _lamb = np.asarray([lamb])
-        else:
-            _lamb = lamb[:]
-
-        # convert to wavenumbers
-        x = 1.0e4 / _lamb
-
-        # check that the wavenumbers are within the defined range
-        _test_valid_x_range(x, self.x_range, self.name)
-
         # init variables
         a = np.zeros(np.size(x))
         b = np.zeros(np.size(x))
@@ -167,6 +269,57 @@ class Cardelli89(ExtinctionLaw):
         a[ind] = 0.0
         b[ind] = 0.0
 
+        return a, b
+
+    def _curves(self, lamb, n_curves, Rv=None):
+        """ normalized curves for arrays of Rv (see ExtinctionLaw.curves) """
+        if Rv is None:
+            Rv = np.full(n_curves, 3.1)
+        x = 1.0e4 / lamb
+        _test_valid_x_range(x, self.x_range, self.name)
+        a, b = self._coefficients(x)
+        return a[None, :] + b[None, :] / Rv[:, None]
+
+    def function(self, lamb, Av=1.0, Rv=3.1, Alambda=True, **kwargs):
+        """
+        Cardelli89 extinction Law
+
+        Parameters
+        ----------
+        lamb: float or ndarray(dtype=float)
+            wavelength [in Angstroms] at which to evaluate the law.
+
+        Av: float
+            desired A(V) (default: 1.0)
+
+        Rv: float
+            desired R(V) (default: 3.1)
+
+        Alambda: bool
+            if set returns +2.5*1./log(10.)*tau, tau otherwise
+
+        Returns
+        -------
+        r: float or ndarray(dtype=float)
+            attenuation as a function of wavelength
+            depending on Alambda option +2.5*1./log(10.)*tau,  or tau
+        """
+        # ensure the units are in angstrom
+        _lamb = units.Quantity(lamb, units.angstrom).value
+
+        if isinstance(_lamb, float) or isinstance(_lamb, np.float_):
+            _lamb = np.asarray([lamb])
+        else:
+            _lamb = lamb[:]
+
+        # convert to wavenumbers
+        x = 1.0e4 / _lamb
+
+        # check that the wavenumbers are within the defined range
+        _test_valid_x_range(x, self.x_range, self.name)
+
+        a, b = self._coefficients(x)
+
         # Return Extinction vector
         # Eq 1
         if Alambda:
@@ -359,6 +512,9 @@ class Gordon03_SMCBar(ExtinctionLaw):
         self.Rv = 2.74
         self.x_range = [0.3, 10.0]
 
+    # Rv is fixed
+    curve_params = ()
+
     def function(
         self, lamb, Av=1, Rv=2.74, Alambda=True, draine_extend=False, **kwargs
     ):
@@ -503,6 +659,27 @@ class Gordon16_RvFALaw(ExtinctionLaw):
             np.min([self.ALaw.x_range[1], self.BLaw.x_range[1]]),
         ]
 
+    curve_params = ("Rv", "f_A")
+
+    def _curves(self, lamb, n_curves, Rv=None, f_A=None):
+        """ normalized curves for arrays of Rv and f_A, from the curves of
+        the two components (see ExtinctionLaw.curves) """
+        if Rv is None:
+            Rv = np.full(n_curves, 3.1)
+        if f_A is None:
+            f_A = np.full(n_curves, 0.5)
+
+        # the A component only contributes for f_A > 0
+        k_A = np.zeros((n_curves, len(lamb)))
+        with_A = f_A > 0.0
+        if np.any(with_A):
+            k_A[with_A] = self.ALaw.curves(
+                lamb, Rv=self.get_Rv_A(Rv[with_A], f_A[with_A])
+            )
+        k_B = self.BLaw.curves(lamb)
+
+        return f_A[:, None] * k_A + (1.0 - f_A[:, None]) * k_B
+
     def function(self, lamb, Av=1, Rv=3.1, Alambda=True, f_A=0.5, **kwargs):
         """
         Gordon16_RvFALaw
@@ -654,6 +831,8 @@ class Generalized_DustExt(ExtinctionLaw):
             )
 
         self.x_range = self.extcurve_class.x_range
+        if not self.hasRvParam:
+            self.curve_params = ()
 
     def function(self, lamb, Av=1, Rv=3.1, Alambda=True, **kwargs):
         """
@@ -213,3 +213,30 @@ def test_extinction_dustextpkg_datacomp(curve, origExtLaw):
 
     lam = np.linspace(2.0e3, 1.0e4, 10)
     np.testing.assert_allclose(tlaw(lam), olaw(lam), rtol=1e-03)
+
+
+@pytest.mark.parametrize(
+    "extLaw",
+    [
+        extinction.Cardelli89(),
+        extinction.Fitzpatrick99(),
+        extinction.Gordon03_SMCBar(),
+        extinction.Gordon16_RvFALaw(),
+        extinction.Generalized_DustExt("F04"),
+    ],
+)
+def test_extinction_curves(extLaw):
+    lam = np.linspace(2.0e3, 1.0e4, 10)
+    Avs = np.array([0.5, 1.0, 2.0, 1.0])
+    Rvs = np.array([3.1, 4.0, 3.1, 5.0])
+    f_As = np.array([0.8, 0.5, 0.8, 1.0])
+
+    curves = extLaw.curves(lam, Rv=Rvs, f_A=f_As)
+    assert curves.shape == (len(Rvs), len(lam))
+    for Av, Rv, f_A, curve in zip(Avs, Rvs, f_As, curves):
+        np.testing.assert_allclose(
+            Av * curve, extLaw(lam, Av=Av, Rv=Rv, f_A=f_A), rtol=1e-10
+        )
+
+    # memoized curves
+    np.testing.assert_array_equal(extLaw.curves(lam, Rv=Rvs, f_A=f_As), curves)
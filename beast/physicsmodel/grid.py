@@ -25,7 +25,14 @@ from copy import deepcopy
 
 from beast.observationmodel import phot
 from beast.physicsmodel.dust import extinction
-from beast.physicsmodel.helpers.gridbackends import MemoryBackend, CacheBackend, HDFBackend, GridBackend
+from beast.physicsmodel.helpers.gridbackends import (
+    MemoryBackend,
+    CacheBackend,
+    HDFBackend,
+    MmapBackend,
+    IndexedBackend,
+    GridBackend,
+)
 from beast.physicsmodel.helpers.gridhelpers import pretty_size_print, isNestedInstance
 
 try:
@@ -66,6 +73,8 @@ def find_backend(txt):
         "memory": MemoryBackend,
         "cache": CacheBackend,
         "hdf": HDFBackend,
+        "mmap": MmapBackend,
+        "indexed": IndexedBackend,
         "generic": GridBackend,
     }
     return maps.get(txt.lower(), None)
@@ -105,6 +114,8 @@ class ModelGrid(object):
             'memory': MemoryBackend,
             'cache': CacheBackend,
             'hdf': HDFBackend,
+            'mmap': MmapBackend,
+            'indexed': IndexedBackend,
             'generic': GridBackend
         """
         backend = kwargs.pop("backend", None)
@@ -241,25 +252,28 @@ class SpectralGrid(ModelGrid):
         memgrid: MemoryGrid instance
             grid of SEDs
         """
+        # quadrature weights of the filters, cached per filter set and lamb
         if isinstance(filter_names[0], str):
-            flist = phot.load_filters(
-                filter_names, interp=True, lamb=self.lamb, filterLib=filterLib
+            lamb, weights = phot.get_filter_weights(
+                filter_names, self.lamb[:], absFlux=absFlux, filterLib=filterLib
             )
             _fnames = filter_names
         else:
             flist = phot.load_Integrationfilters(
                 filter_names, interp=True, lamb=self.lamb
             )
+            lamb, weights = phot.filter_weights(self.lamb[:], flist, absFlux=absFlux)
             _fnames = [fk.name for fk in filter_names]
         if extLaw is not None:
             if not inplace:
                 r = self.applyExtinctionLaw(extLaw, inplace=inplace, **kwargs)
-                lamb, seds, grid = phot.extractSEDs(r, flist, absFlux=absFlux)
             else:
                 self.applyExtinctionLaw(extLaw, inplace=inplace, **kwargs)
-                lamb, seds, grid = phot.extractSEDs(self, flist, absFlux=absFlux)
+                r = self
         else:
-            lamb, seds, grid = phot.extractSEDs(self, flist, absFlux=absFlux)
+            r = self
+        seds = phot.apply_filter_weights(r.seds[:], weights)
+        grid = r.grid
         memgrid = MemoryGrid(lamb, seds, grid)
         setattr(memgrid, "filters", _fnames)
         return memgrid
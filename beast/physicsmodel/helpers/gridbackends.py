@@ -28,6 +28,26 @@ HDFBackend:
     are allowed through any way offered by pytables, which becomes very handy
     for very low-memory tasks such as doing single star figures.
 
+Grid tables can be written in HDF files as one compound table (default) or
+as one dataset per column (`writeHDF(..., layout="columns")`, see
+gridcolumns), which HDFBackend and CacheBackend read one column at a time.
+
+GridWriter writes a grid on disk a chunk of models at a time, with only one
+chunk in memory.
+
+MmapBackend:
+    Memory maps an uncompressed copy of the grid (one .npy file per array in
+    a directory next to the HDF file, made with `grid_to_mmap`). Nothing is
+    read before it is used, and processes on the same machine using the same
+    grid share its pages through the OS page cache instead of each holding a
+    copy.
+
+IndexedBackend:
+    Models of a parent grid file given by their indexes, e.g., a trimmed grid
+    written as an index list (`write_grid_indxs`) instead of a copy of the
+    models. Only the listed models are read from the parent grid, at the
+    first query.
+
 All backends are able to write on disk into FITS and HDF format.
 
 TODO: add evalexpr into the HDFBackend grid
@@ -37,14 +57,41 @@ TODO: add readCoordinates into all backends
 
 TODO: check read(field=) exists into all backends.grid, give direct access
 """
+import os
 import sys
+import json
 import numpy
+import h5py
+import tables
 import astropy.io.fits as pyfits
 import copy
 
 from beast.external.eztables import Table
-from beast.physicsmodel.helpers.hdfstore import HDFStore
+from beast.physicsmodel.helpers.hdfstore import (
+    HDFStore,
+    convert_dict_to_structured_ndarray,
+)
 from beast.physicsmodel.helpers.gridhelpers import isNestedInstance, pretty_size_print
+from beast.physicsmodel.helpers.gridstats import (
+    has_stats,
+    column_stats,
+    merge_column_stats,
+    flux_stats,
+    read_grid_stats,
+    write_grid_stats,
+)
+from beast.physicsmodel.helpers.gridcolumns import (
+    HDFColumns,
+    is_column_layout,
+    open_grid_table,
+    read_grid_table,
+    grid_header,
+    write_grid_columns,
+)
+from beast.observationmodel.noisemodel.compact import (
+    CompactNoiseModel,
+    is_compact_noisemodel,
+)
 
 try:
     unicode = unicode
@@ -61,7 +108,23 @@ else:
     bytes = str
     basestring = (str, str)
 
-__all__ = ["GridBackend", "MemoryBackend", "CacheBackend", "HDFBackend"]
+__all__ = [
+    "GridBackend",
+    "MemoryBackend",
+    "CacheBackend",
+    "HDFBackend",
+    "MmapBackend",
+    "MmapTable",
+    "GridWriter",
+    "mmap_dirname",
+    "save_mmap_array",
+    "grid_to_mmap",
+    "IndexedBackend",
+    "write_grid_indxs",
+    "read_grid_indxs",
+    "is_grid_indxs",
+    "take_rows",
+]
 
 
 class GridBackend(object):
@@ -163,6 +226,156 @@ class GridBackend(object):
         self._header = b.header
         self._aliases = b._aliases
 
+    @property
+    def grid_stats(self):
+        """ statistics of the grid columns stored in the grid file (see
+        gridstats), empty if there are none """
+        if getattr(self, "_grid_stats", None) is None:
+            fname = self.fname
+            if isinstance(fname, basestring) and os.path.isdir(fname):
+                fname = None
+            self._grid_stats = read_grid_stats(fname)
+        return self._grid_stats
+
+    def _stats_before_write(self, fname, append):
+        """ stored statistics and number of models of a grid file before
+        writing into it """
+        if (not append) or (not os.path.isfile(fname)):
+            return {}, 0
+        with h5py.File(fname, "r") as hfile:
+            n_before = hfile["seds"].shape[0] if "seds" in hfile else 0
+        return read_grid_stats(fname), n_before
+
+    def _write_grid_stats(
+        self, fname, old_stats, n_before, noisemodel=None, cap_unique=1000
+    ):
+        """_write_grid_stats -- store the statistics of the grid columns
+
+        Parameters
+        ----------
+
+        fname: str
+            HDF grid file just written
+
+        old_stats: dict
+            statistics stored in the file before appending the grid
+
+        n_before: int
+            number of models in the file before appending the grid
+
+        noisemodel: str, dict or CompactNoiseModel, optional
+            noise model file or noise model (with 'bias') of the models,
+            to add the statistics of the symlog fluxes
+
+        cap_unique: int
+            only keep this number of unique values
+        """
+        grid_stats = {}
+        for name in self.grid.colnames:
+            if hasattr(self.grid, "read"):
+                try:
+                    values = self.grid.read(field=name)
+                except TypeError:
+                    values = self.grid[name]
+            else:
+                values = self.grid[name]
+            values = numpy.asarray(values)
+            if has_stats(values) and (len(values) > 0):
+                grid_stats[name] = column_stats(values, cap_unique=cap_unique)
+
+        noise_fname = ""
+        grid_header = getattr(self.grid, "header", {})
+        filters = self.filters or grid_header.get("filters", None)
+        filters = filters or grid_header.get("FILTERS", None)
+        if isinstance(filters, basestring):
+            filters = filters.split()
+        if (noisemodel is not None) and (filters is not None) and (len(self) > 0):
+            if isinstance(noisemodel, basestring):
+                noise_fname = noisemodel
+                if is_compact_noisemodel(noisemodel):
+                    noisemodel = CompactNoiseModel(noisemodel)
+            if isinstance(noisemodel, CompactNoiseModel):
+                bias = noisemodel.evaluate(self.seds)["bias"]
+            elif isinstance(noisemodel, basestring):
+                with h5py.File(noisemodel, "r") as nfile:
+                    bias = nfile["bias"][()]
+            else:
+                bias = noisemodel["bias"]
+            grid_stats.update(flux_stats(self.seds[:], bias, filters, cap_unique))
+
+        if n_before > 0:
+            # only the stats of all the models in the file can be kept
+            grid_stats = {
+                name: merge_column_stats(old_stats[name], cstats)
+                for name, cstats in grid_stats.items()
+                if (name in old_stats) and (old_stats[name]["nrows"] == n_before)
+            }
+        write_grid_stats(
+            fname,
+            grid_stats,
+            n_before + len(self),
+            noise_fname=noise_fname,
+            replace=(n_before == 0),
+        )
+
+    def _write_grid_table(
+        self, fname, append, layout="table", complevel=0, complib="zlib"
+    ):
+        """_write_grid_table -- write the grid table into a HDF grid file
+
+        Parameters
+        ----------
+
+        fname: str
+            HDF grid file (the seds are already written)
+
+        append: bool
+            if set, append the rows to an existing grid table
+
+        layout: str ('table' or 'columns')
+            write a compound table or one dataset per column (see
+            gridcolumns), when appending the layout of the file is kept
+
+        complevel: int
+            compression level of the columns (column layout only)
+
+        complib: str
+            compression library of the columns (column layout only)
+        """
+        if layout not in ["table", "columns"]:
+            raise ValueError("layout should be 'table' or 'columns'")
+        with HDFStore(fname, mode="a") as hd:
+            if append and ("/grid" in hd):
+                layout = "columns" if is_column_layout(hd["/grid"]) else "table"
+            if layout == "columns":
+                if isinstance(self.grid, Table):
+                    header = dict(self.grid.header.items())
+                    aliases = self.grid._aliases
+                else:
+                    header = self.header
+                    aliases = self._aliases
+                write_grid_columns(
+                    hd,
+                    self.grid if isinstance(self.grid, Table) else self.grid[:],
+                    header=header,
+                    aliases=aliases,
+                    append=append,
+                    complevel=complevel,
+                    complib=complib,
+                )
+            elif isinstance(self.grid, Table):
+                hd.close_source(force=True)
+                self.grid.write(fname, tablename="grid", append=True)
+            else:
+                hd.write(
+                    self.grid[:],
+                    group="/",
+                    tablename="grid",
+                    header=self.header,
+                    append=append,
+                )
+        hd.close_source(force=True)
+
     def copy(self):
         """ implement a copy method """
         g = GridBackend()
@@ -290,7 +503,7 @@ class MemoryBackend(GridBackend):
                     self.cov_offdiag = s["/covoffdiag"].read()
                 except Exception:
                     self.cov_offdiag = None
-            self.grid = Table(fname, tablename="/grid")
+            self.grid = read_grid_table(fname)
 
         self._header = self.grid.header
 
@@ -313,9 +526,22 @@ class MemoryBackend(GridBackend):
                     self.grid.header["FILTERS"] = " ".join(self.filters)
             self.grid.write(fname, append=True)
 
-    def writeHDF(self, fname, append=False, *args, **kwargs):
+    def writeHDF(
+        self,
+        fname,
+        append=False,
+        noisemodel=None,
+        cap_unique=1000,
+        layout="table",
+        complevel=0,
+        *args,
+        **kwargs
+    ):
         """write -- export to HDF file
 
+        The statistics of the grid columns are stored with the grid (see
+        gridstats).
+
         Parameters
         ----------
 
@@ -324,10 +550,25 @@ class MemoryBackend(GridBackend):
 
         append: bool, optional (default False)
             if set, it will append data to each Array or Table
+
+        noisemodel: str or dict, optional
+            noise model file or noise model of the grid, if set the
+            statistics of the symlog fluxes with bias are stored too
+
+        cap_unique: int, optional (default 1000)
+            max number of unique values kept in the statistics
+
+        layout: str, optional (default 'table')
+            'columns' to write the grid table as one dataset per column
+            (see gridcolumns), when appending the layout of the file is kept
+
+        complevel: int, optional (default 0)
+            compression level of the columns with the column layout
         """
         if (self.lamb is not None) & (self.seds is not None) & (self.grid is not None):
             if not isinstance(self.grid, Table):
                 raise TypeError("Only eztables.Table are supported so far")
+            old_stats, n_before = self._stats_before_write(fname, append)
             with HDFStore(fname, mode="a") as hd:
                 if not append:
                     hd["/seds"] = self.seds[:]
@@ -350,7 +591,12 @@ class MemoryBackend(GridBackend):
             if getattr(self, "filters", None) is not None:
                 if "FILTERS" not in list(self.grid.header.keys()):
                     self.grid.header["FILTERS"] = " ".join(self.filters)
-            self.grid.write(fname, tablename="grid", append=True)
+            # the nested contexts of HDFStore can leave the file open
+            hd.close_source(force=True)
+            self._write_grid_table(fname, append, layout=layout, complevel=complevel)
+            self._write_grid_stats(
+                fname, old_stats, n_before, noisemodel=noisemodel, cap_unique=cap_unique
+            )
 
     def copy(self):
         """ implement a copy method """
@@ -439,7 +685,17 @@ class CacheBackend(GridBackend):
                 self._grid = Table(self.fname)
 
             elif self._get_type(fname) == "hdf":
-                self._grid = Table(self.fname, tablename="/grid")
+                with HDFStore(self.fname, mode="r") as s:
+                    column_layout = is_column_layout(s["/grid"])
+                    if column_layout:
+                        header, aliases = grid_header(s["/grid"])
+                if column_layout:
+                    # columns are read when first used
+                    self._grid = MmapTable(
+                        HDFColumns(self.fname), header=header, aliases=aliases
+                    )
+                else:
+                    self._grid = Table(self.fname, tablename="/grid")
 
     def _load_filters(self, fname):
         """load_filters -- load only filters"""
@@ -534,6 +790,8 @@ class CacheBackend(GridBackend):
             filename (incl. path) to export to
         """
         if (self.lamb is not None) & (self.seds is not None) & (self.grid is not None):
+            if isinstance(self.grid, MmapTable):
+                self._grid = self.grid.to_table()
             if not isinstance(self.grid, Table):
                 raise TypeError("Only eztables.Table are supported so far")
             r = numpy.vstack([self.seds, self.lamb])
@@ -544,9 +802,22 @@ class CacheBackend(GridBackend):
                     self.grid.header["FILTERS"] = " ".join(self.filters)
             self.grid.write(fname, append=True)
 
-    def writeHDF(self, fname, append=False, *args, **kwargs):
+    def writeHDF(
+        self,
+        fname,
+        append=False,
+        noisemodel=None,
+        cap_unique=1000,
+        layout="table",
+        complevel=0,
+        *args,
+        **kwargs
+    ):
         """write -- export to HDF file
 
+        The statistics of the grid columns are stored with the grid (see
+        gridstats).
+
         Parameters
         ----------
 
@@ -555,10 +826,27 @@ class CacheBackend(GridBackend):
 
         append: bool, optional (default False)
             if set, it will append data to each Array or Table
+
+        noisemodel: str or dict, optional
+            noise model file or noise model of the grid, if set the
+            statistics of the symlog fluxes with bias are stored too
+
+        cap_unique: int, optional (default 1000)
+            max number of unique values kept in the statistics
+
+        layout: str, optional (default 'table')
+            'columns' to write the grid table as one dataset per column
+            (see gridcolumns), when appending the layout of the file is kept
+
+        complevel: int, optional (default 0)
+            compression level of the columns with the column layout
         """
         if (self.lamb is not None) & (self.seds is not None) & (self.grid is not None):
+            if isinstance(self.grid, MmapTable):
+                self._grid = self.grid.to_table()
             if not isinstance(self.grid, Table):
                 raise TypeError("Only eztables.Table are supported so far")
+            old_stats, n_before = self._stats_before_write(fname, append)
             with HDFStore(fname, mode="a") as hd:
                 if not append:
                     hd["/seds"] = self.seds[:]
@@ -573,7 +861,12 @@ class CacheBackend(GridBackend):
             if getattr(self, "filters", None) is not None:
                 if "FILTERS" not in list(self.grid.header.keys()):
                     self.grid.header["FILTERS"] = " ".join(self.filters)
-            self.grid.write(fname, tablename="grid", append=True)
+            # the nested contexts of HDFStore can leave the file open
+            hd.close_source(force=True)
+            self._write_grid_table(fname, append, layout=layout, complevel=complevel)
+            self._write_grid_stats(
+                fname, old_stats, n_before, noisemodel=noisemodel, cap_unique=cap_unique
+            )
 
     def copy(self):
         """ implement a copy method """
@@ -609,7 +902,7 @@ class HDFBackend(GridBackend):
         self.store = HDFStore(self.fname, mode="r")
         self.seds = self.store["/seds"]
         self.lamb = self.store["/lamb"]
-        self.grid = self.store["/grid"]
+        self.grid = open_grid_table(self.store)
         self._filters = None
         self._header = None
         self._aliases = {}
@@ -618,20 +911,8 @@ class HDFBackend(GridBackend):
     def header(self):
         if self._header is None:
             # update header & aliases
-            exclude = ["NROWS", "VERSION", "CLASS", "EXTNAME"]
-            header = {}
-            for k in self.grid.attrs._v_attrnames:
-                if (k not in exclude) & (k[:5] != "FIELD") & (k[:5] != "ALIAS"):
-                    header[k] = self.grid.attrs[k]
-                if k[:5] == "ALIAS":
-                    c0, c1 = self.grid.attrs[k].split("=")
-                    self._aliases[c0] = c1
-
-            empty_name = ["", "None", "Noname", None]
-            if (header["NAME"] in empty_name) & (
-                header.get("TITLE", None) not in empty_name
-            ):
-                header["NAME"] = header["TITLE"]
+            header, aliases = grid_header(self.grid)
+            self._aliases.update(aliases)
             self._header = header
         return self._header
 
@@ -648,14 +929,24 @@ class HDFBackend(GridBackend):
 
     def keys(self):
         """ return column names when possible """
-        if hasattr(self._grid, "coldescrs"):
-            return list(self._grid.coldescrs.keys())
-        else:
-            return []
+        return list(self.grid.colnames)
 
-    def writeHDF(self, fname, append=False, *args, **kwargs):
+    def writeHDF(
+        self,
+        fname,
+        append=False,
+        noisemodel=None,
+        cap_unique=1000,
+        layout="table",
+        complevel=0,
+        *args,
+        **kwargs
+    ):
         """write -- export to HDF file
 
+        The statistics of the grid columns are stored with the grid (see
+        gridstats).
+
         Parameters
         ---------
 
@@ -664,8 +955,23 @@ class HDFBackend(GridBackend):
 
         append: bool, optional (default False)
             if set, it will append data to each Array or Table
+
+        noisemodel: str or dict, optional
+            noise model file or noise model of the grid, if set the
+            statistics of the symlog fluxes with bias are stored too
+
+        cap_unique: int, optional (default 1000)
+            max number of unique values kept in the statistics
+
+        layout: str, optional (default 'table')
+            'columns' to write the grid table as one dataset per column
+            (see gridcolumns), when appending the layout of the file is kept
+
+        complevel: int, optional (default 0)
+            compression level of the columns with the column layout
         """
         if (self.lamb is not None) & (self.seds is not None) & (self.grid is not None):
+            old_stats, n_before = self._stats_before_write(fname, append)
             with HDFStore(fname, mode="a") as hd:
                 if not append:
                     hd["/seds"] = self.seds[:]
@@ -677,15 +983,690 @@ class HDFBackend(GridBackend):
                     except Exception:
                         hd["/seds"] = self.seds[:]
                         hd["/lamb"] = self.lamb[:]
-                hd.write(
-                    self.grid[:],
-                    group="/",
-                    tablename="grid",
-                    header=self.header,
-                    append=append,
-                )
+            # the nested contexts of HDFStore can leave the file open
+            hd.close_source(force=True)
+            self._write_grid_table(fname, append, layout=layout, complevel=complevel)
+            self._write_grid_stats(
+                fname, old_stats, n_before, noisemodel=noisemodel, cap_unique=cap_unique
+            )
 
     def copy(self):
         g = HDFBackend(self.fname)
         g._aliases = copy.deepcopy(self._aliases)
         return g
+
+
+class GridWriter(object):
+    """GridWriter -- write a grid into a HDF file a chunk of models at a time
+
+    The extendable arrays of the grid (seds, grid table, covariances) are
+    created on the first chunk with their chunk size set for the final
+    number of models, and each chunk is written at its offset so that only
+    one chunk is in memory. The statistics of the grid columns are
+    accumulated over the chunks and stored on close (see gridstats).
+
+    This class can be used as a context manager
+    """
+
+    def __init__(
+        self, fname, n_models=None, layout="table", complevel=0, cap_unique=1000
+    ):
+        """__init__
+
+        Parameters
+        ----------
+
+        fname: str
+            HDF file to write (replaced if it exists)
+
+        n_models: int, optional
+            expected number of models of the grid, to set the chunk size of
+            the arrays
+
+        layout: str ('table' or 'columns')
+            write the grid table as a compound table or one dataset per
+            column (see gridcolumns)
+
+        complevel: int
+            compression level of the columns with the column layout
+
+        cap_unique: int
+            max number of unique values kept in the statistics
+        """
+        if layout not in ["table", "columns"]:
+            raise ValueError("layout should be 'table' or 'columns'")
+        self.fname = fname
+        self.n_models = n_models
+        self.layout = layout
+        self.complevel = complevel
+        self.cap_unique = cap_unique
+        self.offset = 0
+        self.grid_stats = {}
+        self.store = HDFStore(fname, mode="w")
+        self.store.keep_open(True)
+        self.store.open_source()
+
+    def _create_array(self, name, values):
+        """ extendable array for the models of the grid """
+        values = numpy.asarray(values)
+        return self.store.create_earray(
+            "/",
+            name,
+            atom=tables.Atom.from_dtype(values.dtype),
+            shape=(0,) + values.shape[1:],
+            expectedrows=self.n_models or len(values),
+        )
+
+    def write(self, g):
+        """write -- write the next chunk of models
+
+        Parameters
+        ----------
+
+        g: grid.SpectralGrid or GridBackend
+            chunk of models (lamb, seds, grid and optionally cov_diag and
+            cov_offdiag)
+        """
+        hd = self.store
+        seds = numpy.asarray(g.seds[:])
+        n_chunk = len(seds)
+        arrays = [("seds", seds)]
+        for name, node in [("cov_diag", "covdiag"), ("cov_offdiag", "covoffdiag")]:
+            values = getattr(g, name, None)
+            if values is not None:
+                arrays.append((node, numpy.asarray(values[:])))
+
+        header = dict(g.grid.header.items())
+        filters = getattr(g, "filters", None)
+        if (filters is not None) and ("FILTERS" not in header):
+            header["FILTERS"] = " ".join(filters)
+        colnames = g.grid.colnames if hasattr(g.grid, "colnames") else g.keys()
+        columns = {name: numpy.asarray(g.grid[name]) for name in colnames}
+
+        if self.offset == 0:
+            hd.create_array("/", "lamb", obj=numpy.asarray(g.lamb[:]))
+            for name, values in arrays:
+                self._create_array(name, values)
+        for name, values in arrays:
+            hd.get_node("/" + name).append(values)
+
+        if self.layout == "columns":
+            write_grid_columns(
+                hd,
+                columns,
+                header=header if self.offset == 0 else {},
+                aliases=getattr(g.grid, "_aliases", {}),
+                append=(self.offset > 0),
+                complevel=self.complevel,
+                expectedrows=self.n_models,
+            )
+        else:
+            tab = convert_dict_to_structured_ndarray(columns)
+            if self.offset == 0:
+                t = hd.create_table(
+                    "/",
+                    "grid",
+                    description=tab.dtype,
+                    expectedrows=self.n_models or n_chunk,
+                )
+                for k, v in header.items():
+                    t.attrs[k] = v
+                if "TITLE" not in header:
+                    t.attrs["TITLE"] = "grid"
+                for i, (k, v) in enumerate(getattr(g.grid, "_aliases", {}).items()):
+                    t.attrs["ALIAS%d" % i] = "%s=%s" % (k, v)
+            t = hd.get_node("/grid")
+            t.append(tab.astype(t.description._v_dtype))
+        hd.flush()
+
+        for name, values in columns.items():
+            if has_stats(values) and (len(values) > 0):
+                cstats = column_stats(values, cap_unique=self.cap_unique)
+                if name in self.grid_stats:
+                    cstats = merge_column_stats(self.grid_stats[name], cstats)
+                self.grid_stats[name] = cstats
+        self.offset += n_chunk
+
+    def close(self):
+        """close -- close the file and store the statistics of the columns"""
+        if self.store.source is None:
+            return
+        self.store.close_source(force=True)
+        write_grid_stats(self.fname, self.grid_stats, self.offset, replace=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def mmap_dirname(fname):
+    """ directory of the memory-mappable copy of a grid or noise model file
+
+    Parameters
+    ----------
+    fname: str
+        grid or noise model file (e.g., 'project/project_seds.grid.hd5')
+
+    Returns
+    -------
+    dirname: str
+        'project/project_seds.grid_mmap'
+    """
+    return "{0}_mmap".format(os.path.splitext(fname)[0])
+
+
+def save_mmap_array(fname, data, chunk_size=100000):
+    """ copy an array into a .npy file, a chunk of rows at a time
+
+    Parameters
+    ----------
+    fname: str
+        .npy file to write
+    data: ndarray, pytables array or h5py dataset
+        array to copy (only `chunk_size` rows are read at once)
+    chunk_size: int
+        number of rows copied at once
+    """
+    out = numpy.lib.format.open_memmap(
+        fname, mode="w+", dtype=data.dtype, shape=data.shape
+    )
+    if len(data.shape) == 0:
+        out[()] = data[()]
+    else:
+        for start in range(0, data.shape[0], chunk_size):
+            stop = min(start + chunk_size, data.shape[0])
+            out[start:stop] = data[start:stop]
+    out.flush()
+    del out
+
+
+def _json_value(value):
+    """ header values as types json can write """
+    if isinstance(value, bytes):
+        return value.decode()
+    elif isinstance(value, (str, bool, int, float)) or (value is None):
+        return value
+    elif isinstance(value, numpy.ndarray):
+        return [_json_value(v) for v in value.tolist()]
+    elif isinstance(value, numpy.generic):
+        return _json_value(value.item())
+    elif isinstance(value, (list, tuple)):
+        return [_json_value(v) for v in value]
+    else:
+        return str(value)
+
+
+def grid_to_mmap(fname, overwrite=False, chunk_size=100000):
+    """ convert a HDF grid file into the layout read by MmapBackend
+
+    The seds, wavelengths, covariance arrays (if any) and each column of the
+    grid table are written uncompressed as .npy files in `mmap_dirname(fname)`,
+    with the header and aliases in 'header.json'.  The grid is copied a chunk
+    of models at a time.
+
+    Parameters
+    ----------
+    fname: str
+        HDF grid file
+    overwrite: bool
+        if set, replace an existing conversion
+    chunk_size: int
+        number of models copied at once
+
+    Returns
+    -------
+    dirname: str
+        directory with the converted grid
+    """
+    dirname = mmap_dirname(fname)
+    if os.path.isdir(dirname) and not overwrite:
+        raise IOError("{0} already exists, use overwrite=True".format(dirname))
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+
+    b = HDFBackend(fname)
+    try:
+        header = {k: _json_value(v) for k, v in b.header.items()}
+        colnames = list(b.grid.colnames)
+        save_mmap_array(os.path.join(dirname, "lamb.npy"), b.lamb, chunk_size)
+        save_mmap_array(os.path.join(dirname, "seds.npy"), b.seds, chunk_size)
+        for name, node in [("cov_diag", "/covdiag"), ("cov_offdiag", "/covoffdiag")]:
+            if node in b.store:
+                save_mmap_array(
+                    os.path.join(dirname, name + ".npy"), b.store[node], chunk_size
+                )
+        n_models = b.grid.nrows
+        for name in colnames:
+            coldtype = b.grid.coldtypes[name]
+            out = numpy.lib.format.open_memmap(
+                os.path.join(dirname, "grid_{0}.npy".format(name)),
+                mode="w+",
+                dtype=coldtype.base,
+                shape=(n_models,) + coldtype.shape,
+            )
+            for start in range(0, n_models, chunk_size):
+                stop = min(start + chunk_size, n_models)
+                out[start:stop] = b.grid.read(start, stop, field=name)
+            out.flush()
+            del out
+        aliases = dict(b._aliases)
+    finally:
+        b.store.close_source(force=True)
+
+    with open(os.path.join(dirname, "header.json"), "w") as f:
+        json.dump({"colnames": colnames, "header": header, "aliases": aliases}, f)
+
+    return dirname
+
+
+class MmapTable(object):
+    """ Grid table made of memory-mapped columns
+
+    Gives the part of the eztables.Table interface used with the grids
+    (column access by name, keys, colnames, header) without reading the
+    columns into memory. Also used by CacheBackend with the columns of a
+    grid file in the column layout read on first use (gridcolumns.HDFColumns).
+    """
+
+    def __init__(self, columns, header=None, aliases=None):
+        """
+        Parameters
+        ----------
+        columns: dict like
+            column name: 1D array (usually a numpy.memmap)
+        header: dict, optional
+            header of the table
+        aliases: dict, optional
+            alias: column name
+        """
+        self.columns = columns
+        self.header = dict(header) if header is not None else {}
+        self.aliases = dict(aliases) if aliases is not None else {}
+
+    @property
+    def colnames(self):
+        return list(self.columns.keys())
+
+    @property
+    def nrows(self):
+        return len(self.columns[self.colnames[0]]) if len(self.columns) > 0 else 0
+
+    def keys(self):
+        return self.colnames
+
+    def __len__(self):
+        return self.nrows
+
+    def __contains__(self, name):
+        return (name in self.columns) or (name in self.aliases)
+
+    def __getitem__(self, name):
+        return self.columns[self.aliases.get(name, name)]
+
+    def to_table(self):
+        """ eztables.Table copy in memory of the table """
+        t = Table(
+            {name: numpy.asarray(self.columns[name]) for name in self.colnames}
+        )
+        for k, v in self.header.items():
+            t.header[k] = v
+        for k, v in self.aliases.items():
+            t.set_alias(k, v)
+        return t
+
+
+class MmapBackend(GridBackend):
+    """MmapBackend -- grid memory mapped from disk
+
+    The arrays are numpy.memmap views of the files written by `grid_to_mmap`:
+    the data are read by the OS when used and cached in the page cache, which
+    is shared by all the processes mapping the same grid.
+    """
+
+    def __init__(self, fname, mmap_mode="r", *args, **kwargs):
+        """__init__
+
+        Parameters
+        ----------
+        fname: str
+            HDF grid file converted with `grid_to_mmap`, or the directory of
+            the converted grid
+        mmap_mode: str
+            mode of numpy.load ('r' read only, 'c' copy-on-write)
+        """
+        super(MmapBackend, self).__init__()
+
+        self.fname = fname
+        if os.path.isdir(fname):
+            self.dirname = fname
+        else:
+            self.dirname = mmap_dirname(fname)
+        if not os.path.isfile(os.path.join(self.dirname, "header.json")):
+            raise IOError(
+                "no memory mapped grid in {0}, convert {1} with grid_to_mmap".format(
+                    self.dirname, fname
+                )
+            )
+        self.mmap_mode = mmap_mode
+
+        with open(os.path.join(self.dirname, "header.json"), "r") as f:
+            info = json.load(f)
+
+        self.lamb = self._load("lamb")
+        self.seds = self._load("seds")
+        self.cov_diag = self._load("cov_diag")
+        self.cov_offdiag = self._load("cov_offdiag")
+        self._aliases = info["aliases"]
+        self.grid = MmapTable(
+            {name: self._load("grid_{0}".format(name)) for name in info["colnames"]},
+            header=info["header"],
+            aliases=self._aliases,
+        )
+        self._header = self.grid.header
+
+    def _load(self, name):
+        """ memory map one of the arrays, None if not in the grid """
+        fname = os.path.join(self.dirname, name + ".npy")
+        if os.path.isfile(fname):
+            return numpy.load(fname, mmap_mode=self.mmap_mode)
+
+    def __len__(self):
+        return len(self.seds)
+
+    @property
+    def filters(self):
+        """filters"""
+        r = self._header.get("filters", None) or self._header.get("FILTERS", None)
+        if r is not None:
+            r = r.split()
+        return r
+
+    def writeHDF(self, fname, append=False, *args, **kwargs):
+        """write -- export to HDF file
+
+        Parameters
+        ----------
+
+        fname: str
+            filename (incl. path) to export to
+
+        append: bool, optional (default False)
+            if set, it will append data to each Array or Table
+
+        **kwargs: passed to MemoryBackend.writeHDF
+        """
+        m = MemoryBackend(
+            self.lamb,
+            seds=self.seds,
+            grid=self.grid.to_table(),
+            cov_diag=self.cov_diag,
+            cov_offdiag=self.cov_offdiag,
+        )
+        m.writeHDF(fname, append=append, **kwargs)
+
+    def copy(self):
+        """ implement a copy method (maps the same files) """
+        g = MmapBackend(self.fname, mmap_mode=self.mmap_mode)
+        g._aliases = copy.deepcopy(self._aliases)
+        return g
+
+
+def write_grid_indxs(fname, parent_fname, indxs, noise_fname=None):
+    """write_grid_indxs -- write a grid as the indexes of models in a
+    parent grid (read with IndexedBackend)
+
+    Parameters
+    ----------
+
+    fname: str
+        HDF file to write
+
+    parent_fname: str
+        HDF grid file of the models
+
+    indxs: ndarray
+        indexes of the models in the parent grid
+
+    noise_fname: str, optional
+        noise model file of the parent grid, stored for reference
+    """
+    with tables.open_file(fname, "w") as tfile:
+        tfile.create_array(
+            tfile.root, "fullgrid_idx", numpy.asarray(indxs, dtype=numpy.int64)
+        )
+        tfile.root._v_attrs["LAYOUT"] = "indexes"
+        tfile.root._v_attrs["PARENT_GRID"] = os.path.abspath(parent_fname)
+        if noise_fname is not None:
+            tfile.root._v_attrs["PARENT_NOISEMODEL"] = os.path.abspath(noise_fname)
+
+
+def is_grid_indxs(fname):
+    """is_grid_indxs -- True if the file is a grid written by
+    write_grid_indxs
+
+    Parameters
+    ----------
+
+    fname: str
+        HDF file
+    """
+    if not tables.is_hdf5_file(fname):
+        return False
+    with tables.open_file(fname, "r") as tfile:
+        return getattr(tfile.root._v_attrs, "LAYOUT", None) == "indexes"
+
+
+def read_grid_indxs(fname):
+    """read_grid_indxs -- read a grid written by write_grid_indxs
+
+    Parameters
+    ----------
+
+    fname: str
+        HDF file with the indexes
+
+    Returns
+    -------
+
+    parent_fname: str
+        HDF grid file of the models
+
+    indxs: ndarray
+        indexes of the models in the parent grid
+
+    noise_fname: str or None
+        noise model file of the parent grid if stored
+    """
+    with tables.open_file(fname, "r") as tfile:
+        attrs = tfile.root._v_attrs
+        if getattr(attrs, "LAYOUT", None) != "indexes":
+            raise ValueError("{0} is not a grid of model indexes".format(fname))
+        indxs = tfile.root.fullgrid_idx.read()
+        parent_fname = attrs["PARENT_GRID"]
+        noise_fname = getattr(attrs, "PARENT_NOISEMODEL", None)
+    return parent_fname, indxs, noise_fname
+
+
+def take_rows(read, n_rows, indxs, chunk_size=100000):
+    """take_rows -- rows of an array or table on disk at the given indexes,
+    reading in order only the chunks of rows with indexes
+
+    Parameters
+    ----------
+
+    read: callable
+        read(start, stop) returns the rows from start to stop
+
+    n_rows: int
+        number of rows of the array or table
+
+    indxs: ndarray
+        indexes of the rows
+
+    chunk_size: int
+        number of rows read at once
+    """
+    order = numpy.argsort(indxs, kind="stable")
+    sindxs = indxs[order]
+    parts = [read(0, 0)]
+    for start in range(0, n_rows, chunk_size):
+        lo, hi = numpy.searchsorted(sindxs, [start, start + chunk_size])
+        if hi > lo:
+            rows = read(start, min(start + chunk_size, n_rows))
+            parts.append(rows[sindxs[lo:hi] - start])
+    rows = numpy.concatenate(parts)
+    out = numpy.empty_like(rows)
+    out[order] = rows
+    return out
+
+
+class IndexedBackend(GridBackend):
+    """IndexedBackend -- models of a parent grid given by their indexes
+
+    A trimmed grid is the parent grid file and the indexes of the kept
+    models (see write_grid_indxs) instead of a copy of the models. The seds
+    and grid properties of these models are read from the parent grid at the
+    first query, in one pass over the file. As in the grids written by
+    trim_grid.trim_models, the 'fullgrid_idx' column gives the index of each
+    model in the parent grid.
+    """
+
+    def __init__(self, fname, indxs=None, chunk_size=100000, *args, **kwargs):
+        """__init__
+
+        Parameters
+        ----------
+
+        fname: str
+            HDF file written by write_grid_indxs, or parent HDF grid file
+            if indxs is set
+
+        indxs: ndarray, optional
+            indexes of the models in the parent grid file fname
+
+        chunk_size: int, optional
+            number of models of the parent grid read at once
+        """
+        super(IndexedBackend, self).__init__()
+
+        self.fname = fname
+        if indxs is None:
+            self.parent_fname, indxs, self.noise_fname = read_grid_indxs(fname)
+        else:
+            self.parent_fname = fname
+            self.noise_fname = None
+        self.indxs = numpy.asarray(indxs, dtype=numpy.int64)
+        self.chunk_size = chunk_size
+
+        with HDFStore(self.parent_fname, mode="r") as hd:
+            self.lamb = hd["/lamb"].read()
+            self._header, self._aliases = grid_header(open_grid_table(hd))
+        self._seds = None
+        self._grid = None
+        self._cov = {}
+
+    def __len__(self):
+        return len(self.indxs)
+
+    def _take(self, node):
+        """ rows of the listed models of a node of the parent grid, None if
+        not in the file """
+        with HDFStore(self.parent_fname, mode="r") as hd:
+            if node not in hd:
+                return None
+            array = hd[node]
+            return take_rows(
+                lambda start, stop: array[start:stop],
+                array.shape[0],
+                self.indxs,
+                self.chunk_size,
+            )
+
+    @property
+    def seds(self):
+        if self._seds is None:
+            self._seds = self._take("/seds")
+        return self._seds
+
+    @property
+    def cov_diag(self):
+        if "cov_diag" not in self._cov:
+            self._cov["cov_diag"] = self._take("/covdiag")
+        return self._cov["cov_diag"]
+
+    @property
+    def cov_offdiag(self):
+        if "cov_offdiag" not in self._cov:
+            self._cov["cov_offdiag"] = self._take("/covoffdiag")
+        return self._cov["cov_offdiag"]
+
+    @property
+    def grid(self):
+        if self._grid is None:
+            with HDFStore(self.parent_fname, mode="r") as hd:
+                grid_table = open_grid_table(hd)
+                rows = take_rows(
+                    grid_table.read, grid_table.nrows, self.indxs, self.chunk_size
+                )
+            cols = {name: rows[name] for name in rows.dtype.names}
+            # index in the full grid, also when the parent grid is trimmed
+            if "fullgrid_idx" in cols:
+                cols["fullgrid_idx"] = cols["fullgrid_idx"].astype(int)
+            else:
+                cols["fullgrid_idx"] = self.indxs.astype(int)
+            self._grid = Table(cols)
+            for k, v in self._header.items():
+                self._grid.header[k] = v
+            for k, v in self._aliases.items():
+                self._grid.set_alias(k, v)
+        return self._grid
+
+    @property
+    def header(self):
+        return self._header
+
+    @property
+    def filters(self):
+        """filters"""
+        r = self._header.get("filters", None) or self._header.get("FILTERS", None)
+        if r is not None:
+            r = r.split()
+        return r
+
+    def keys(self):
+        """ returns the grid dimension names """
+        return list(self.grid.keys())
+
+    def writeHDF(self, fname, append=False, *args, **kwargs):
+        """write -- export the models to a HDF file
+
+        Parameters
+        ----------
+
+        fname: str
+            filename (incl. path) to export to
+
+        append: bool, optional (default False)
+            if set, it will append data to each Array or Table
+
+        **kwargs: passed to MemoryBackend.writeHDF
+        """
+        m = MemoryBackend(
+            self.lamb,
+            seds=self.seds,
+            grid=self.grid,
+            cov_diag=self.cov_diag,
+            cov_offdiag=self.cov_offdiag,
+        )
+        m.writeHDF(fname, append=append, **kwargs)
+
+    def copy(self):
+        """ implement a copy method (same models, read again) """
+        g = IndexedBackend(
+            self.parent_fname, indxs=self.indxs.copy(), chunk_size=self.chunk_size
+        )
+        g.fname = self.fname
+        g.noise_fname = self.noise_fname
+        return g
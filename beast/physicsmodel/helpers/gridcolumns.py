@@ -0,0 +1,434 @@
+"""
+Column-oriented layout of the grid table in the HDF grid files
+
+The grid properties are usually written as one compound-row table ('/grid'),
+so reading a single property reads all of them. In the column layout,
+'/grid' is a group with one chunked (and optionally compressed) extendable
+array per property, so a property is read without touching the others.
+
+Layout: the '/grid' group has the table header as attributes (as on the
+compound table), 'LAYOUT' = 'columns' and the names of the columns in order
+in 'COLNAMES'. Each column is an EArray named after the property, of shape
+(nmodels,) or (nmodels, n) for vector properties.
+
+Files with a compound table stay readable: `open_grid_table` and
+`read_grid_table` handle both layouts, and `grid_to_columns` converts a file.
+"""
+import os
+import shutil
+
+import numpy as np
+import tables
+
+from beast.external.eztables import Table
+
+__all__ = [
+    "ColumnTable",
+    "HDFColumns",
+    "is_column_layout",
+    "open_grid_table",
+    "read_grid_table",
+    "grid_header",
+    "write_grid_columns",
+    "grid_to_columns",
+]
+
+_layout = "columns"
+
+# attributes of the grid node that are not part of the grid header
+_exclude_attrs = ["NROWS", "VERSION", "CLASS", "EXTNAME", "LAYOUT", "COLNAMES"]
+
+
+def is_column_layout(node):
+    """
+    True if the grid node is a group of columns (not a compound table)
+
+    Parameters
+    ----------
+    node : tables.Node
+        '/grid' node of the grid file
+    """
+    return isinstance(node, tables.Group) and (
+        getattr(node._v_attrs, "LAYOUT", None) in [_layout, _layout.encode()]
+    )
+
+
+def _colnames(group):
+    """ names of the columns of a column grid group in order """
+    return [
+        name.decode() if isinstance(name, bytes) else str(name)
+        for name in group._v_attrs["COLNAMES"]
+    ]
+
+
+class ColumnTable(object):
+    """ Grid table stored as a group of columns
+
+    Gives the part of the tables.Table interface used with the grid tables
+    (read with start, stop and field, read_coordinates, colnames, coldtypes,
+    nrows, attrs and slicing) and reads only the columns asked for.
+    """
+
+    def __init__(self, group):
+        """
+        Parameters
+        ----------
+        group : tables.Group
+            '/grid' group of a grid file in the column layout
+        """
+        self.group = group
+        self.colnames = _colnames(group)
+
+    @property
+    def attrs(self):
+        return self.group._v_attrs
+
+    @property
+    def coldtypes(self):
+        return {
+            name: np.dtype((self.column(name).dtype, self.column(name).shape[1:]))
+            for name in self.colnames
+        }
+
+    @property
+    def dtype(self):
+        return np.dtype([(name, self.coldtypes[name]) for name in self.colnames])
+
+    @property
+    def nrows(self):
+        if len(self.colnames) == 0:
+            return 0
+        return self.column(self.colnames[0]).nrows
+
+    def __len__(self):
+        return self.nrows
+
+    def column(self, name):
+        """ EArray node of one column """
+        return self.group._f_get_child(name)
+
+    def _records(self, columns):
+        """ structured array from the columns """
+        n_rows = len(next(iter(columns.values()))) if columns else 0
+        out = np.empty(n_rows, dtype=self.dtype)
+        for name, values in columns.items():
+            out[name] = values
+        return out
+
+    def read(self, start=None, stop=None, step=None, field=None):
+        """ read the rows from start to stop, only the column field if set """
+        if field is not None:
+            return self.column(field).read(start, stop, step)
+        return self._records(
+            {name: self.column(name).read(start, stop, step) for name in self.colnames}
+        )
+
+    def read_coordinates(self, coords, field=None):
+        """ read the rows given their indexes, only the column field if set """
+        coords = np.asarray(coords)
+        if field is not None:
+            return self.column(field)[coords]
+        return self._records({name: self.column(name)[coords] for name in self.colnames})
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.column(key).read()
+        elif isinstance(key, slice):
+            return self.read(key.start, key.stop, key.step)
+        return self.read_coordinates(key)
+
+
+class HDFColumns(object):
+    """ Columns of a grid file read from disk on first access and cached
+
+    Mapping from the column names to the column values, used as the columns
+    of a MmapTable by CacheBackend so that only the properties used are read.
+    """
+
+    def __init__(self, fname):
+        """
+        Parameters
+        ----------
+        fname : str
+            HDF grid file in the column layout
+        """
+        self.fname = fname
+        self._cache = {}
+        with tables.open_file(fname, "r") as tfile:
+            self._colnames = _colnames(tfile.get_node("/grid"))
+
+    def keys(self):
+        return list(self._colnames)
+
+    def values(self):
+        return [self[name] for name in self._colnames]
+
+    def items(self):
+        return [(name, self[name]) for name in self._colnames]
+
+    def __iter__(self):
+        return iter(self._colnames)
+
+    def __len__(self):
+        return len(self._colnames)
+
+    def __contains__(self, name):
+        return name in self._colnames
+
+    def __getitem__(self, name):
+        if name not in self._colnames:
+            raise KeyError(name)
+        if name not in self._cache:
+            with tables.open_file(self.fname, "r") as tfile:
+                self._cache[name] = tfile.get_node("/grid/" + name).read()
+        return self._cache[name]
+
+    @property
+    def nbytes(self):
+        return sum(values.nbytes for values in self._cache.values())
+
+
+def open_grid_table(hd5, name="/grid"):
+    """
+    Grid table node of an open grid file, in either layout
+
+    Parameters
+    ----------
+    hd5 : tables.file.File or HDFStore
+        open grid file
+    name : str
+        path of the grid table
+
+    Returns
+    -------
+    grid_table : tables.Table or ColumnTable
+    """
+    node = hd5.get_node(name)
+    if is_column_layout(node):
+        return ColumnTable(node)
+    return node
+
+
+def grid_header(node):
+    """
+    Header and aliases of the grid table (as read by eztables)
+
+    Parameters
+    ----------
+    node : tables.Table, tables.Group or ColumnTable
+        grid table node
+
+    Returns
+    -------
+    header : dict
+    aliases : dict
+        {alias: column name}
+    """
+    attrs = node.attrs if hasattr(node, "attrs") else node._v_attrs
+    header = {}
+    aliases = {}
+    for k in attrs._v_attrnames:
+        if (k not in _exclude_attrs) & (k[:5] != "FIELD") & (k[:5] != "ALIAS"):
+            header[k] = attrs[k]
+        if k[:5] == "ALIAS":
+            c0, c1 = attrs[k].split("=")
+            aliases[c0] = c1
+
+    empty_name = ["", "None", "Noname", None]
+    if (header.get("NAME", None) in empty_name) & (
+        header.get("TITLE", None) not in empty_name
+    ):
+        header["NAME"] = header["TITLE"]
+    return header, aliases
+
+
+def read_grid_table(fname, tablename="/grid"):
+    """
+    Read the grid table of a grid file, in either layout
+
+    Parameters
+    ----------
+    fname : str
+        HDF grid file
+    tablename : str
+        path of the grid table
+
+    Returns
+    -------
+    tab : eztables.Table
+    """
+    with tables.open_file(fname, "r") as tfile:
+        node = tfile.get_node(tablename)
+        if not is_column_layout(node):
+            column_layout = False
+        else:
+            column_layout = True
+            ctable = ColumnTable(node)
+            tab = Table({name: ctable[name] for name in ctable.colnames})
+            header, aliases = grid_header(node)
+    if not column_layout:
+        return Table(fname, tablename=tablename)
+
+    for k, v in header.items():
+        tab.header[k] = v
+    for k, v in aliases.items():
+        tab.set_alias(k, v)
+    return tab
+
+
+def _table_columns(tab):
+    """ names and values of the columns of a structured array, dict or
+    eztables.Table """
+    if hasattr(tab, "dtype") and (tab.dtype.names is not None):
+        return [(name, tab[name]) for name in tab.dtype.names]
+    elif hasattr(tab, "colnames"):
+        return [(name, tab[name]) for name in tab.colnames]
+    return list(tab.items())
+
+
+def write_grid_columns(
+    hd5,
+    tab,
+    name="/grid",
+    header={},
+    aliases={},
+    append=False,
+    complevel=0,
+    complib="zlib",
+    chunk_rows=None,
+    expectedrows=None,
+):
+    """
+    Write the grid table as a group of columns
+
+    Parameters
+    ----------
+    hd5 : tables.file.File or HDFStore
+        grid file open for writing
+    tab : structured ndarray, dict or eztables.Table
+        grid properties
+    name : str
+        path of the group
+    header : dict
+        header of the table (stored as attributes of the group)
+    aliases : dict
+        {alias: column name}
+    append : bool
+        if set, add the rows at the end of the existing columns
+    complevel : int
+        compression level (0: no compression)
+    complib : str
+        compression library (see tables.Filters)
+    chunk_rows : int, optional
+        number of rows in a chunk (default: chosen by pytables from
+        expectedrows)
+    expectedrows : int, optional
+        expected number of rows in the end, to set the chunk size
+    """
+    columns = _table_columns(tab)
+    n_rows = len(columns[0][1]) if columns else 0
+
+    if append and (name in hd5):
+        group = hd5.get_node(name)
+        if not is_column_layout(group):
+            raise ValueError(
+                "cannot append columns to the compound grid table {0}".format(name)
+            )
+        for cname, values in columns:
+            group._f_get_child(cname).append(np.asarray(values))
+    else:
+        parent, gname = os.path.split(name)
+        group = hd5.create_group(parent, gname, createparents=True)
+        filters = tables.Filters(complevel=complevel, complib=complib)
+        for cname, values in columns:
+            values = np.asarray(values)
+            chunkshape = None
+            if chunk_rows is not None:
+                chunkshape = (chunk_rows,) + values.shape[1:]
+            carray = hd5.create_earray(
+                group,
+                cname,
+                atom=tables.Atom.from_dtype(values.dtype.base),
+                shape=(0,) + values.shape[1:],
+                filters=filters,
+                chunkshape=chunkshape,
+                expectedrows=expectedrows or max(n_rows, 1),
+            )
+            carray.append(values)
+        group._v_attrs["LAYOUT"] = _layout
+        group._v_attrs["COLNAMES"] = np.array([cname for cname, _ in columns], "S")
+        group._v_attrs["NAME"] = header.get("NAME", "grid")
+
+    for k, v in header.items():
+        # FILTERS is a reserved attribute of the groups (as for the tables)
+        if k == "FILTERS":
+            group._v_attrs["filters"] = v
+        else:
+            group._v_attrs[k] = v
+    for i, (k, v) in enumerate(aliases.items()):
+        group._v_attrs["ALIAS%d" % i] = "%s=%s" % (k, v)
+    if "TITLE" not in header:
+        group._v_attrs["TITLE"] = os.path.split(name)[1]
+    hd5.flush()
+
+
+def grid_to_columns(
+    fname, outname=None, complevel=0, complib="zlib", chunk_rows=None, chunk_size=100000
+):
+    """
+    Convert the compound grid table of a grid file to the column layout
+
+    The table is copied a chunk of models at a time. The seds, wavelengths
+    and any other node of the file are kept.
+
+    Parameters
+    ----------
+    fname : str
+        HDF grid file
+    outname : str, optional
+        file to write the converted grid to (default: convert in place)
+    complevel : int
+        compression level of the columns (0: no compression)
+    complib : str
+        compression library (see tables.Filters)
+    chunk_rows : int, optional
+        number of rows in a chunk of the columns
+    chunk_size : int
+        number of models copied at once
+
+    Returns
+    -------
+    outname : str
+        converted grid file
+    """
+    if outname is None:
+        outname = fname
+    elif outname != fname:
+        shutil.copyfile(fname, outname)
+
+    with tables.open_file(outname, "a") as tfile:
+        node = tfile.get_node("/grid")
+        if is_column_layout(node):
+            return outname
+        header, aliases = grid_header(node)
+        n_models = node.nrows
+        tmpname = "/grid_columns_tmp"
+        if tmpname in tfile:
+            tfile.remove_node(tmpname, recursive=True)
+        for start in range(0, max(n_models, 1), chunk_size):
+            write_grid_columns(
+                tfile,
+                node.read(start, min(start + chunk_size, n_models)),
+                name=tmpname,
+                header=dict({"TITLE": "grid"}, **header),
+                aliases=aliases,
+                append=(start > 0),
+                complevel=complevel,
+                complib=complib,
+                chunk_rows=chunk_rows,
+                expectedrows=n_models,
+            )
+        tfile.remove_node("/grid")
+        tfile.rename_node(tmpname, "grid")
+
+    return outname
@@ -0,0 +1,330 @@
+"""
+Statistics of the grid columns stored with the grid files
+
+For each column of the grid (and, if the noise model is known, for the
+symlog model fluxes including the noise model bias, 'symlog' + filter +
+'_wd_bias' as defined in fit.py), the min, max, number of unique values
+(capped), whether the values are sorted and the dtype are stored in the
+'grid_stats' group of the HDF grid file. They give the bins of the 1D/2D
+PDFs and the ranges across subgrids without reading the whole grid.
+
+Layout: one group per quantity in /grid_stats, with the stats as attributes
+and the (at most cap_unique) smallest unique values in its 'unique' dataset.
+"""
+import os
+import math
+
+import numpy as np
+import h5py
+import tables
+
+from beast.physicsmodel.helpers.gridcolumns import open_grid_table
+from beast.observationmodel.noisemodel.compact import (
+    CompactNoiseModel,
+    is_compact_noisemodel,
+)
+
+__all__ = [
+    "has_stats",
+    "column_stats",
+    "merge_column_stats",
+    "symlog_flux",
+    "flux_stats",
+    "read_grid_stats",
+    "write_grid_stats",
+    "add_grid_stats",
+]
+
+_stats_group = "grid_stats"
+
+# fluxes at or below this value are the -100 placeholders of missing fluxes
+_flux_min_valid = -99.99
+
+
+def has_stats(values):
+    """
+    True if statistics are computed for these values (numerical 1D columns)
+    """
+    return (values.ndim == 1) and (values.dtype.kind in "biuf")
+
+
+def column_stats(values, cap_unique=1000):
+    """
+    Statistics of the values of one quantity
+
+    Parameters
+    ----------
+    values : ndarray
+        values for all the models
+    cap_unique : int
+        only keep this number of unique values (the smallest ones)
+
+    Returns
+    -------
+    stats : dict
+        min, max, num_unique (number of unique values, at most cap_unique),
+        capped (if there are more unique values than cap_unique), unique
+        (the num_unique smallest unique values), sorted (if the values are
+        in increasing order), first, last (first and last values), dtype
+    """
+    values = np.asarray(values)
+    unique = np.unique(values)
+    return {
+        "min": unique[0],
+        "max": unique[-1],
+        "num_unique": min(len(unique), cap_unique),
+        "capped": len(unique) > cap_unique,
+        "unique": unique[:cap_unique],
+        "sorted": bool(np.all(values[1:] >= values[:-1])),
+        "first": values[0],
+        "last": values[-1],
+        "dtype": values.dtype.str,
+        "cap_unique": cap_unique,
+    }
+
+
+def merge_column_stats(stats1, stats2):
+    """
+    Statistics of the values of two sets of models, the models of stats2
+    coming after the ones of stats1
+
+    Parameters
+    ----------
+    stats1, stats2 : dict
+        statistics from column_stats
+
+    Returns
+    -------
+    stats : dict
+        statistics of all the models
+    """
+    cap_unique = min(stats1["cap_unique"], stats2["cap_unique"])
+    unique = np.union1d(stats1["unique"], stats2["unique"])
+    return {
+        "min": min(stats1["min"], stats2["min"]),
+        "max": max(stats1["max"], stats2["max"]),
+        "num_unique": min(len(unique), cap_unique),
+        "capped": stats1["capped"] or stats2["capped"] or len(unique) > cap_unique,
+        "unique": unique[:cap_unique],
+        "sorted": stats1["sorted"]
+        and stats2["sorted"]
+        and stats1["last"] <= stats2["first"],
+        "first": stats1["first"],
+        "last": stats2["last"],
+        "dtype": stats1["dtype"],
+        "cap_unique": cap_unique,
+    }
+
+
+def symlog_flux(seds, bias):
+    """
+    Symmetric log of the model fluxes including the noise model bias
+    (as used for the flux 1D PDFs in fit.py)
+
+    Parameters
+    ----------
+    seds : ndarray
+        model fluxes (nmodels, nfilters)
+    bias : ndarray
+        noise model bias (nmodels, nfilters)
+
+    Returns
+    -------
+    full_model_flux : ndarray
+        symlog fluxes (nmodels, nfilters)
+    """
+    model_seds_with_bias = np.asarray(seds) + np.asarray(bias)
+    return (
+        np.sign(model_seds_with_bias)
+        * np.log1p(np.abs(model_seds_with_bias * math.log(10)))
+        / math.log(10)
+    )
+
+
+def flux_stats(seds, bias, filters, cap_unique=1000):
+    """
+    Statistics of the symlog model fluxes including the noise model bias
+
+    The min excludes the -100 placeholder fluxes (as in
+    beast.tools.subgridding_tools.subgrid_info).
+
+    Parameters
+    ----------
+    seds : ndarray
+        model fluxes (nmodels, nfilters)
+    bias : ndarray
+        noise model bias (nmodels, nfilters)
+    filters : list of str
+        names of the filters
+    cap_unique : int
+        only keep this number of unique values
+
+    Returns
+    -------
+    stats : dict
+        {'symlog' + filter + '_wd_bias': column_stats}
+    """
+    full_model_flux = symlog_flux(seds, bias)
+    stats = {}
+    for i, cfilter in enumerate(filters):
+        f_fluxes = full_model_flux[:, i]
+        cstats = column_stats(f_fluxes, cap_unique=cap_unique)
+        good_fluxes = f_fluxes[f_fluxes > _flux_min_valid]
+        if len(good_fluxes) > 0:
+            cstats["min"] = good_fluxes.min()
+        stats["symlog" + cfilter + "_wd_bias"] = cstats
+    return stats
+
+
+def read_grid_stats(fname):
+    """
+    Read the statistics stored in a grid file
+
+    Parameters
+    ----------
+    fname : str
+        HDF grid file
+
+    Returns
+    -------
+    grid_stats : dict
+        {name of quantity: stats as given by column_stats}, with the number
+        of models in 'nrows' and the noise model file used for the flux
+        stats in 'noise_fname' in each stats dict. Empty if the file has no
+        stored statistics.
+    """
+    grid_stats = {}
+    if (not isinstance(fname, str)) or (not os.path.isfile(fname)):
+        return grid_stats
+    try:
+        hfile = h5py.File(fname, "r")
+    except OSError:
+        return grid_stats
+    with hfile:
+        if _stats_group not in hfile:
+            return grid_stats
+        group = hfile[_stats_group]
+        for qname in group.keys():
+            cstats = dict(group[qname].attrs.items())
+            for ckey in ["capped", "sorted"]:
+                cstats[ckey] = bool(cstats[ckey])
+            for ckey in ["num_unique", "cap_unique", "nrows"]:
+                cstats[ckey] = int(cstats[ckey])
+            cstats["unique"] = group[qname]["unique"][()]
+            grid_stats[qname] = cstats
+    return grid_stats
+
+
+def write_grid_stats(fname, grid_stats, nrows, noise_fname="", replace=False):
+    """
+    Store statistics in a grid file (replaces the stored stats of the same
+    quantities)
+
+    Parameters
+    ----------
+    fname : str
+        HDF grid file
+    grid_stats : dict
+        {name of quantity: stats as given by column_stats}
+    nrows : int
+        number of models in the grid
+    noise_fname : str
+        noise model file used for the flux stats (only the file name is
+        stored, without the path)
+    replace : bool
+        if set, remove all the stats stored before
+    """
+    with h5py.File(fname, "a") as hfile:
+        if replace and (_stats_group in hfile):
+            del hfile[_stats_group]
+        group = hfile.require_group(_stats_group)
+        for qname, cstats in grid_stats.items():
+            if qname in group:
+                del group[qname]
+            qgroup = group.create_group(qname)
+            qgroup.create_dataset("unique", data=cstats["unique"])
+            for ckey, cval in cstats.items():
+                if ckey in ["capped", "sorted"]:
+                    # as int, pytables warns about the HDF5 bool attributes
+                    qgroup.attrs[ckey] = int(cval)
+                elif ckey not in ["unique", "nrows", "noise_fname"]:
+                    qgroup.attrs[ckey] = cval
+            qgroup.attrs["nrows"] = nrows
+            if "_bias" in qname:
+                qgroup.attrs["noise_fname"] = os.path.basename(noise_fname)
+
+
+def add_grid_stats(fname, noise_fname=None, cap_unique=1000, chunk_size=100000):
+    """
+    Compute and store the statistics of an existing grid file, a chunk of
+    models at a time (e.g., for grids written before the statistics were
+    stored, or to add the flux statistics once the noise model is known)
+
+    Parameters
+    ----------
+    fname : str
+        HDF grid file
+    noise_fname : str, optional
+        noise model file of the grid, to add the stats of the symlog fluxes
+    cap_unique : int
+        only keep this number of unique values
+    chunk_size : int
+        number of models read at once
+
+    Returns
+    -------
+    grid_stats : dict
+        {name of quantity: stats as given by column_stats}
+    """
+    with h5py.File(fname, "r") as hfile:
+        n_models = hfile["seds"].shape[0]
+
+    grid_stats = {}
+    with tables.open_file(fname, "r") as tfile:
+        grid_table = open_grid_table(tfile)
+        for start in range(0, n_models, chunk_size):
+            chunk = grid_table.read(start, start + chunk_size)
+            for qname in chunk.dtype.names:
+                if not has_stats(chunk[qname]):
+                    continue
+                cstats = column_stats(chunk[qname], cap_unique=cap_unique)
+                if qname in grid_stats:
+                    cstats = merge_column_stats(grid_stats[qname], cstats)
+                grid_stats[qname] = cstats
+
+        if noise_fname is not None:
+            attrnames = grid_table.attrs._v_attrnames
+            filters = grid_table.attrs[
+                "filters" if "filters" in attrnames else "FILTERS"
+            ]
+            if isinstance(filters, bytes):
+                filters = filters.decode()
+            filters = filters.split()
+            seds = tfile.get_node("/seds")
+            flux_grid_stats = {}
+            if is_compact_noisemodel(noise_fname):
+                compact_noise = CompactNoiseModel(noise_fname, chunk_size=chunk_size)
+                nfile = None
+            else:
+                nfile = h5py.File(noise_fname, "r")
+            try:
+                for start in range(0, n_models, chunk_size):
+                    stop = min(start + chunk_size, n_models)
+                    cseds = seds[start:stop]
+                    if nfile is None:
+                        cbias = compact_noise.evaluate(cseds)["bias"]
+                    else:
+                        cbias = nfile["bias"][start:stop]
+                    for qname, cstats in flux_stats(
+                        cseds, cbias, filters, cap_unique
+                    ).items():
+                        if qname in flux_grid_stats:
+                            cstats = merge_column_stats(flux_grid_stats[qname], cstats)
+                        flux_grid_stats[qname] = cstats
+            finally:
+                if nfile is not None:
+                    nfile.close()
+            grid_stats.update(flux_grid_stats)
+
+    write_grid_stats(fname, grid_stats, n_models, noise_fname=noise_fname or "")
+    return grid_stats
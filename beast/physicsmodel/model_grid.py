@@ -8,6 +8,7 @@ from beast.physicsmodel import creategrid
 from beast.physicsmodel.stars import isochrone, stellib
 from beast.physicsmodel.stars.isochrone import ezIsoch
 from beast.physicsmodel.dust import extinction
+from beast.physicsmodel.helpers.gridbackends import GridWriter
 from beast.physicsmodel.grid_and_prior_weights import compute_distance_age_mass_metallicity_weights
 
 __all__ = [
@@ -327,6 +328,8 @@ def make_extinguished_sed_grid(
     verbose=True,
     seds_fname=None,
     filterLib=None,
+    chunksize=0,
+    chunk_memory=None,
     **kwargs
 ):
 
@@ -380,6 +383,13 @@ def make_extinguished_sed_grid(
     filterLib:  str
         full filename to the filter library hd5 file
 
+    chunksize: int, optional (default=0)
+        number of dust points computed and written to disk at once
+        (all at once if <= 0)
+
+    chunk_memory: float, optional
+        memory budget in bytes of a chunk, sets chunksize if given
+
     Returns
     -------
     fname: str
@@ -415,7 +425,10 @@ def make_extinguished_sed_grid(
                 add_spectral_properties_kwargs=add_spectral_properties_kwargs,
                 absflux_cov=absflux_cov,
                 filterLib=filterLib,
+                chunksize=chunksize,
+                chunk_memory=chunk_memory,
             )
+            n_models = len(specgrid.grid) * len(avs) * len(rvs) * len(fAs)
         else:
             g = creategrid.make_extinguished_grid(
                 specgrid,
@@ -427,14 +440,21 @@ def make_extinguished_sed_grid(
                 rv_prior_model=rv_prior_model,
                 add_spectral_properties_kwargs=add_spectral_properties_kwargs,
                 absflux_cov=absflux_cov,
+                filterLib=filterLib,
+                chunksize=chunksize,
+                chunk_memory=chunk_memory,
             )
+            n_models = len(specgrid.grid) * len(avs) * len(rvs)
 
-        # write to disk
+        # write to disk, one chunk at a time
+        #   (n_models is an upper limit with f_A, used to size the chunks
+        #   of the arrays in the file)
         if hasattr(g, "writeHDF"):
             g.writeHDF(seds_fname)
         else:
-            for gk in g:
-                gk.writeHDF(seds_fname, append=True)
+            with GridWriter(seds_fname, n_models=n_models) as writer:
+                for gk in g:
+                    writer.write(gk)
 
     g = grid.FileSEDGrid(seds_fname, backend="hdf")
 
@@ -0,0 +1,72 @@
+import numpy as np
+import h5py
+
+from beast.external.eztables import Table
+from beast.physicsmodel.grid import SpectralGrid
+from beast.physicsmodel.helpers.gridcolumns import grid_to_columns
+from beast.tools.read_beast_data import read_sed_data
+
+
+def _write_grid(fname, n_models=50, **kwargs):
+    rng = np.random.RandomState(1234)
+    seds = rng.uniform(size=(n_models, 3))
+    tab = Table(dict(Av=rng.uniform(size=n_models), M_ini=rng.uniform(size=n_models)))
+    tab.header["filters"] = "F1 F2 F3"
+    SpectralGrid(
+        np.array([1000.0, 2000.0, 3000.0]), seds=seds, grid=tab, backend="memory"
+    ).writeHDF(fname, **kwargs)
+    return seds, tab
+
+
+def _check_grid(fname, seds, tab):
+    for backend in ["memory", "cache", "hdf"]:
+        g = SpectralGrid(fname, backend=backend)
+        np.testing.assert_array_equal(g.seds[:], seds)
+        np.testing.assert_array_equal(g["Av"], tab["Av"])
+        np.testing.assert_array_equal(g["M_ini"], tab["M_ini"])
+        assert g.filters == ["F1", "F2", "F3"]
+        assert set(g.keys()) == {"Av", "M_ini"}
+
+    sed_data = read_sed_data(fname, param_list=["Av", "seds", "filters"])
+    np.testing.assert_array_equal(sed_data["Av"], tab["Av"])
+    np.testing.assert_array_equal(sed_data["seds"], seds)
+    assert sed_data["filters"] == ["F1", "F2", "F3"]
+
+
+def test_grid_columns(tmpdir):
+    fname = str(tmpdir.join("seds.grid.hd5"))
+    seds, tab = _write_grid(fname, layout="columns", complevel=4)
+    with h5py.File(fname, "r") as hfile:
+        assert isinstance(hfile["grid"], h5py.Group)
+    _check_grid(fname, seds, tab)
+
+    # append keeps the layout
+    g = SpectralGrid(fname, backend="memory")
+    g.writeHDF(fname, append=True)
+    g2 = SpectralGrid(fname, backend="hdf")
+    assert len(g2.grid) == 2 * len(tab)
+    np.testing.assert_array_equal(g2["Av"], np.concatenate([tab["Av"], tab["Av"]]))
+
+
+def test_grid_to_columns(tmpdir):
+    fname = str(tmpdir.join("seds.grid.hd5"))
+    seds, tab = _write_grid(fname)
+    fname2 = str(tmpdir.join("seds_columns.grid.hd5"))
+    grid_to_columns(fname, outname=fname2, chunk_size=7)
+    with h5py.File(fname2, "r") as hfile:
+        assert isinstance(hfile["grid"], h5py.Group)
+    _check_grid(fname2, seds, tab)
+
+    # the compound table is still readable
+    _check_grid(fname, seds, tab)
+
+
+def test_grid_from_file_to_columns(tmpdir):
+    # a grid read from disk has FILTERS in its header
+    fname = str(tmpdir.join("seds.grid.hd5"))
+    seds, tab = _write_grid(fname)
+    fname2 = str(tmpdir.join("seds_columns.grid.hd5"))
+    SpectralGrid(fname, backend="memory").writeHDF(fname2, layout="columns")
+    with h5py.File(fname2, "r") as hfile:
+        assert isinstance(hfile["grid"], h5py.Group)
+    _check_grid(fname2, seds, tab)
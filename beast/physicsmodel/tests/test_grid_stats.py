@@ -0,0 +1,85 @@
+import numpy as np
+import h5py
+
+from beast.external.eztables import Table
+from beast.physicsmodel.grid import SpectralGrid
+from beast.physicsmodel.helpers.gridstats import (
+    read_grid_stats,
+    add_grid_stats,
+    symlog_flux,
+)
+from beast.fitting.fit import setup_param_bins
+from beast.tools.subgridding_tools import subgrid_info, reduce_grid_info
+
+
+def _make_grid(n_models, rng):
+    seds = rng.uniform(size=(n_models, 2))
+    tab = Table(
+        dict(
+            Av=rng.choice([0.0, 0.5, 1.0], n_models),
+            M_ini=np.sort(rng.uniform(size=n_models)),
+        )
+    )
+    tab.header["filters"] = "F1 F2"
+    g = SpectralGrid(np.array([1.0, 2.0]), seds=seds, grid=tab, backend="memory")
+    return g
+
+
+def test_grid_stats(tmpdir):
+    rng = np.random.RandomState(1234)
+    g1 = _make_grid(40, rng)
+    g2 = _make_grid(30, rng)
+    bias = 0.1 * rng.uniform(size=(70, 2))
+
+    fname = str(tmpdir.join("seds.grid.hd5"))
+    g1.writeHDF(fname, noisemodel={"bias": bias[:40]}, cap_unique=20)
+    g2.writeHDF(fname, append=True, noisemodel={"bias": bias[40:]}, cap_unique=20)
+
+    Av = np.concatenate([g1["Av"], g2["Av"]])
+    M_ini = np.concatenate([g1["M_ini"], g2["M_ini"]])
+    grid_stats = read_grid_stats(fname)
+    assert grid_stats["Av"]["num_unique"] == 3
+    assert grid_stats["Av"]["max"] == Av.max()
+    # booleans stored as int (pytables warns about HDF5 bool attributes)
+    with h5py.File(fname, "r") as hfile:
+        assert hfile["grid_stats/Av"].attrs["capped"].dtype.kind == "i"
+    assert not grid_stats["Av"]["capped"]
+    assert grid_stats["Av"]["nrows"] == 70
+    assert grid_stats["M_ini"]["min"] == M_ini.min()
+    assert grid_stats["M_ini"]["max"] == M_ini.max()
+    assert grid_stats["M_ini"]["capped"]
+    assert grid_stats["M_ini"]["num_unique"] == 20
+    np.testing.assert_array_equal(grid_stats["M_ini"]["unique"], np.sort(M_ini)[:20])
+    # each grid is sorted, not the two together
+    assert not grid_stats["M_ini"]["sorted"]
+    flux = symlog_flux(np.concatenate([g1.seds, g2.seds]), bias)
+    assert grid_stats["symlogF2_wd_bias"]["max"] == flux[:, 1].max()
+
+    # same stats computed from the file
+    noise_fname = str(tmpdir.join("noisemodel.grid.hd5"))
+    with h5py.File(noise_fname, "w") as nfile:
+        nfile["bias"] = bias
+    add_grid_stats(fname, noise_fname=noise_fname, cap_unique=20, chunk_size=25)
+    file_stats = read_grid_stats(fname)
+    for qname in grid_stats:
+        for ckey in ["min", "max", "num_unique", "capped", "sorted"]:
+            assert file_stats[qname][ckey] == grid_stats[qname][ckey]
+    assert file_stats["symlogF1_wd_bias"]["noise_fname"] == "noisemodel.grid.hd5"
+
+    # number of bins from the stored stats
+    g = SpectralGrid(fname, backend="cache")
+    _, nbins, _, _, _ = setup_param_bins("Av", 50, g, None, ["F1", "F2"], None)
+    assert nbins == 3
+
+    # stored stats give the same info as the values
+    info = subgrid_info(fname, noise_fname, cap_unique=10)
+    exp_info = {}
+    for q in ["Av", "M_ini"]:
+        exp_info[q] = {"min": g[q].min(), "max": g[q].max(), "nu": len(np.unique(g[q]))}
+    for q in exp_info:
+        assert info[q]["min"] == exp_info[q]["min"]
+        assert info[q]["max"] == exp_info[q]["max"]
+    red_info = reduce_grid_info([fname], [noise_fname], cap_unique=10)
+    assert red_info["Av"]["num_unique"] == 3
+    assert red_info["M_ini"]["num_unique"] >= 10
+    assert red_info["symlogF1_wd_bias"]["min"] == flux[:, 0].min()
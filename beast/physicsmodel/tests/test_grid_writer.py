@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from beast.external.eztables import Table
+from beast.physicsmodel.grid import SpectralGrid
+from beast.physicsmodel.helpers.gridbackends import GridWriter
+from beast.physicsmodel.helpers.gridstats import read_grid_stats
+
+
+@pytest.mark.parametrize("layout", ["table", "columns"])
+def test_grid_writer(tmpdir, layout):
+    rng = np.random.RandomState(1234)
+    lamb = np.array([1000.0, 2000.0, 3000.0])
+    chunks = []
+    for n_models in [20, 13]:
+        tab = Table(
+            dict(Av=rng.uniform(size=n_models), M_ini=rng.uniform(size=n_models))
+        )
+        tab.header["filters"] = "F1 F2 F3"
+        chunks.append(
+            SpectralGrid(
+                lamb, seds=rng.uniform(size=(n_models, 3)), grid=tab, backend="memory"
+            )
+        )
+
+    fname = str(tmpdir.join("seds.grid.hd5"))
+    with GridWriter(fname, n_models=33, layout=layout) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+    g = SpectralGrid(fname, backend="memory")
+    np.testing.assert_array_equal(g.lamb, lamb)
+    np.testing.assert_array_equal(g.seds, np.concatenate([c.seds for c in chunks]))
+    exp_Av = np.concatenate([c.grid["Av"] for c in chunks])
+    np.testing.assert_array_equal(g["Av"], exp_Av)
+    assert g.filters == ["F1", "F2", "F3"]
+
+    grid_stats = read_grid_stats(fname)
+    assert grid_stats["Av"]["nrows"] == 33
+    assert grid_stats["Av"]["max"] == exp_Av.max()
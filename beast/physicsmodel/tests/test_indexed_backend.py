@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from beast.external.eztables import Table
+from beast.physicsmodel.grid import SpectralGrid
+from beast.physicsmodel.helpers.gridbackends import (
+    write_grid_indxs,
+    is_grid_indxs,
+    take_rows,
+)
+
+
+def test_take_rows():
+    rng = np.random.RandomState(1234)
+    values = rng.uniform(size=(53, 2))
+    indxs = rng.choice(53, size=20, replace=False)
+    rows = take_rows(lambda start, stop: values[start:stop], 53, indxs, chunk_size=7)
+    np.testing.assert_array_equal(rows, values[indxs])
+
+
+@pytest.mark.parametrize("layout", ["table", "columns"])
+def test_indexed_backend(tmpdir, layout):
+    rng = np.random.RandomState(1234)
+    n_models = 50
+    seds = rng.uniform(size=(n_models, 3))
+    tab = Table(dict(Av=rng.uniform(size=n_models), M_ini=rng.uniform(size=n_models)))
+    tab.header["filters"] = "F1 F2 F3"
+    fname = str(tmpdir.join("seds.grid.hd5"))
+    SpectralGrid(
+        np.array([1000.0, 2000.0, 3000.0]), seds=seds, grid=tab, backend="memory"
+    ).writeHDF(fname, layout=layout)
+
+    indxs = np.array([41, 3, 17, 18, 0, 49])
+    iname = str(tmpdir.join("seds_trim.grid.hd5"))
+    write_grid_indxs(iname, fname, indxs)
+    assert is_grid_indxs(iname)
+    assert not is_grid_indxs(fname)
+
+    g = SpectralGrid(iname, backend="indexed")
+    assert len(g.grid) == len(indxs)
+    np.testing.assert_array_equal(g.seds, seds[indxs])
+    np.testing.assert_array_equal(g["Av"], tab["Av"][indxs])
+    np.testing.assert_array_equal(g["fullgrid_idx"], indxs)
+    assert g.filters == ["F1", "F2", "F3"]
+
+    # written out as a trimmed grid copy
+    tname = str(tmpdir.join("seds_trim_copy.grid.hd5"))
+    g.writeHDF(tname)
+    g2 = SpectralGrid(tname, backend="memory")
+    np.testing.assert_array_equal(g2.seds, seds[indxs])
+    np.testing.assert_array_equal(g2["M_ini"], tab["M_ini"][indxs])
@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+import tables
+
+from beast.external.eztables import Table
+from beast.observationmodel import phot
+from beast.physicsmodel.grid import SpectralGrid
+from beast.physicsmodel.dust import extinction
+from beast.physicsmodel.creategrid import (
+    make_extinguished_grid,
+    add_spectral_properties,
+)
+
+filter_names = ["F1", "F2", "F3"]
+
+
+def _box_transmit(lamb, lmin, lmax):
+    return np.where((lamb >= lmin) & (lamb <= lmax), 1.0, 0.0)
+
+
+def _make_filterlib(fname):
+    """ small filter library with top-hat filters """
+    flamb = np.linspace(1000.0, 30000.0, 2901)
+    with tables.open_file(fname, "w") as ftab:
+        ftab.create_group("/", "filters")
+        for fk, (lmin, lmax) in zip(
+            filter_names, [(2000.0, 3500.0), (4000.0, 6000.0), (8000.0, 15000.0)]
+        ):
+            ftab.create_table(
+                "/filters",
+                fk,
+                np.rec.fromarrays(
+                    [flamb, _box_transmit(flamb, lmin, lmax)],
+                    names="WAVELENGTH,THROUGHPUT",
+                ),
+            )
+
+
+def _make_specgrid(n_models=4):
+    """ spectral grid of blackbodies """
+    lamb = np.linspace(1200.0, 25000.0, 800)
+    temps = np.linspace(4000.0, 20000.0, n_models)
+    spectra = 1.0 / (
+        lamb[None, :] ** 5 * (np.exp(1.4388e8 / (lamb[None, :] * temps[:, None])) - 1.0)
+    )
+    tab = Table(
+        dict(
+            logT=np.log10(temps),
+            weight=np.linspace(1.0, 2.0, n_models),
+            prior_weight=np.linspace(2.0, 1.0, n_models),
+        )
+    )
+    return SpectralGrid(lamb, seds=spectra * 1e20, grid=tab, backend="memory")
+
+
+@pytest.mark.parametrize("with_props", [False, True])
+@pytest.mark.parametrize(
+    "extLaw, fAs",
+    [
+        (extinction.Cardelli89(), None),
+        (extinction.Gordon16_RvFALaw(), [0.0, 0.5, 1.0]),
+    ],
+)
+def test_make_extinguished_grid(tmpdir, extLaw, fAs, with_props):
+    filterLib = str(tmpdir.join("filters.hd5"))
+    _make_filterlib(filterLib)
+    g0 = _make_specgrid()
+    avs = [0.0, 0.5, 2.0]
+    rvs = [2.5, 3.1, 5.0]
+
+    # extra bands through filters of the library and in memory filters
+    prop_filters = [
+        phot.Filter(g0.lamb, _box_transmit(g0.lamb, 1500.0, 2500.0), name="UV"),
+        phot.Filter(g0.lamb, _box_transmit(g0.lamb, 3000.0, 9000.0), name="OPT"),
+    ]
+    if with_props:
+        add_spectral_properties_kwargs = dict(
+            filternames=filter_names[:2], filters=prop_filters
+        )
+    else:
+        add_spectral_properties_kwargs = None
+
+    # dust points in blocks spread over several chunks
+    gs = list(
+        make_extinguished_grid(
+            g0,
+            filter_names,
+            extLaw,
+            avs,
+            rvs,
+            fAs=fAs,
+            chunksize=4,
+            add_spectral_properties_kwargs=add_spectral_properties_kwargs,
+            filterLib=filterLib,
+            dust_block_size=3,
+        )
+    )
+    seds = np.concatenate([g.seds for g in gs])
+    cols = {cname: np.concatenate([g[cname] for g in gs]) for cname in gs[0].keys()}
+
+    # same as extinguishing the spectra of each dust point in turn
+    n_models = len(g0.grid)
+    n_pts = len(seds) // n_models
+    for k in range(n_pts):
+        k1 = n_models * k
+        k2 = n_models * (k + 1)
+        pt = dict(Av=cols["Av"][k1], Rv=cols["Rv"][k1])
+        if fAs is not None:
+            pt["f_A"] = cols["f_A"][k1]
+        r = g0.applyExtinctionLaw(extLaw, inplace=False, **pt)
+        np.testing.assert_allclose(
+            seds[k1:k2],
+            r.getSEDs(filter_names, filterLib=filterLib).seds,
+            rtol=1e-10,
+        )
+        np.testing.assert_allclose(cols["logT"][k1:k2], g0["logT"])
+        if with_props:
+            r = add_spectral_properties(
+                r,
+                filternames=filter_names[:2],
+                filters=prop_filters,
+                nameformat="{0:s}_wd",
+                filterLib=filterLib,
+            )
+            for cname in ["logF1_wd", "logF2_wd", "logUV_wd", "logOPT_wd"]:
+                np.testing.assert_allclose(cols[cname][k1:k2], r[cname], rtol=1e-10)
+        else:
+            assert "logF1_wd" not in cols
+
+    # all the dust points are in the grid
+    if fAs is None:
+        assert n_pts == len(avs) * len(rvs)
+    else:
+        assert n_pts <= len(avs) * len(rvs) * len(fAs)
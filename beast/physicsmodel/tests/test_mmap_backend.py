@@ -0,0 +1,64 @@
+import numpy as np
+import h5py
+
+from beast.external.eztables import Table
+from beast.physicsmodel.grid import SpectralGrid
+from beast.physicsmodel.helpers.gridbackends import grid_to_mmap, _json_value
+from beast.observationmodel.noisemodel.generic_noisemodel import (
+    get_noisemodelcat,
+    noisemodel_to_mmap,
+)
+
+
+def test_mmap_backend(tmpdir):
+    n_models = 50
+    rng = np.random.RandomState(1234)
+    seds = rng.uniform(size=(n_models, 3))
+    tab = Table(dict(Av=rng.uniform(size=n_models), M_ini=rng.uniform(size=n_models)))
+    tab.header["FILTERS"] = "F1 F2 F3"
+    fname = str(tmpdir.join("seds.grid.hd5"))
+    SpectralGrid(
+        np.array([1000.0, 2000.0, 3000.0]), seds=seds, grid=tab, backend="memory"
+    ).writeHDF(fname)
+
+    grid_to_mmap(fname, chunk_size=7)
+    g = SpectralGrid(fname, backend="mmap")
+    assert isinstance(g.seds, np.memmap)
+    assert isinstance(g["Av"], np.memmap)
+    np.testing.assert_array_equal(g.seds, seds)
+    np.testing.assert_array_equal(g["M_ini"], tab["M_ini"])
+    assert g.filters == ["F1", "F2", "F3"]
+    assert set(g.keys()) == {"Av", "M_ini"}
+    assert len(g._backend) == n_models
+
+    # back to a HDF grid
+    fname2 = str(tmpdir.join("seds2.grid.hd5"))
+    g.writeHDF(fname2)
+    g2 = SpectralGrid(fname2, backend="memory")
+    np.testing.assert_array_equal(g2.seds, seds)
+    np.testing.assert_array_equal(g2["Av"], tab["Av"])
+    assert g2.filters == ["F1", "F2", "F3"]
+
+    # noise model
+    noise_fname = str(tmpdir.join("noisemodel.grid.hd5"))
+    with h5py.File(noise_fname, "w") as nfile:
+        nfile["error"] = 0.1 * seds
+        nfile["bias"] = 0.01 * seds
+        nfile["completeness"] = np.ones(n_models)
+    noisemodel_to_mmap(noise_fname)
+    ntable = get_noisemodelcat(noise_fname, mmap_mode="r")
+    exp_ntable = get_noisemodelcat(noise_fname)
+    assert set(ntable.keys()) == set(exp_ntable.keys())
+    for ckey in exp_ntable.keys():
+        assert isinstance(ntable[ckey], np.memmap)
+        np.testing.assert_array_equal(ntable[ckey], exp_ntable[ckey])
+
+
+def test_json_value():
+    # json native values are kept, numpy values converted
+    for value in ["F1 F2", 3, 2.5, True, None]:
+        assert _json_value(value) == value
+        assert type(_json_value(value)) is type(value)
+    assert _json_value(b"F1") == "F1"
+    assert type(_json_value(np.int64(3))) is int
+    assert _json_value(np.array([1.0, 2.0])) == [1.0, 2.0]
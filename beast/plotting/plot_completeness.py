@@ -63,11 +63,13 @@ def plot_completeness(
 
 
         # read in the noise model
-        noisegrid = noisemodel.get_noisemodelcat(str(noise_model))
+        noisegrid = noisemodel.noisemodel_arrays(
+            noisemodel.get_noisemodelcat(str(noise_model)), modelsedgrid.seds
+        )
         # get the completeness
         model_compl = noisegrid["completeness"]
-        # close the file to save memory
-        noisegrid.close()
+        # free the noise model to save memory
+        del noisegrid
 
         # put it all into a table
         table_dict = {x:modelsedgrid[x] for x in param_list}
@@ -62,7 +62,9 @@ def plot_noisemodel(
         print("* reading " + nfile)
 
         # read in the values
-        noisemodel_vals = noisemodel.get_noisemodelcat(nfile)
+        noisemodel_vals = noisemodel.noisemodel_arrays(
+            noisemodel.get_noisemodelcat(nfile), sed_grid
+        )
 
         # extract error and bias
         noise_err = noisemodel_vals["error"]
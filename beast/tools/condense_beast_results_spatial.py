@@ -9,7 +9,6 @@
 import os
 import glob
 
-import h5py
 from tqdm import tqdm
 
 import argparse
@@ -18,6 +17,8 @@ import numpy as np
 from astropy.io import fits
 from astropy.table import Table, Column, vstack
 
+from beast.fitting.lnp_file import read_lnp_file, write_lnp_file
+
 
 def condense_files(bricknum=None, filedir=None):
     """
@@ -172,32 +173,30 @@ def condense_lnp_files(bname, cur_dir, out_dir):
     # get all the files
     lnp_files = glob.glob(cur_dir + "*_lnp.hd5")
 
-    # open the condensed hd5 file for writing
-    #   remove it if it already exisits (h5py does not overwrite)
+    # condensed hd5 file
     clfile = out_dir + "/" + bname + "_lnp.hd5"
-    try:
-        os.remove(clfile)
-    except OSError:
-        pass
-
-    cond_lnp_file = h5py.File(clfile)
-
-    # loop over the small lnp files and copy to main lnp file
-    k = 0
-    for cur_lnp in lnp_files:
-        cur_lnpfile = h5py.File(cur_lnp, "r")
-
-        # loop over all the stars (groups)
-        for sname in cur_lnpfile.keys():
-            star_group = cond_lnp_file.create_group("star_%d" % k)
-            for cp_name, cp_value in cur_lnpfile[sname].items():
-                star_group.create_dataset(cp_name, data=cp_value.value)
-
-            k += 1
-
-        cur_lnpfile.close()
 
-    cond_lnp_file.close()
+    # read the small lnp files (columnar or legacy layout)
+    lnp_data_list = [read_lnp_file(cur_lnp) for cur_lnp in lnp_files]
+
+    # concatenate all the stars, numbering them in order
+    cond_lnp = {}
+    n_vals = 0
+    offsets = [np.zeros(1, dtype=np.int64)]
+    for lnp_data in lnp_data_list:
+        offsets.append(lnp_data["offsets"][1:] + n_vals)
+        n_vals += lnp_data["offsets"][-1]
+    cond_lnp["offsets"] = np.concatenate(offsets)
+    cond_lnp["star_indx"] = np.arange(len(cond_lnp["offsets"]) - 1)
+    if len(lnp_data_list) > 0:
+        for cname in lnp_data_list[0].keys():
+            if cname not in ["star_indx", "offsets"]:
+                cond_lnp[cname] = np.concatenate(
+                    [lnp_data[cname] for lnp_data in lnp_data_list]
+                )
+
+    # write the condensed file (overwrites an existing file)
+    write_lnp_file(clfile, cond_lnp)
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -6,6 +6,8 @@ import numpy as np
 import h5py
 from tqdm import tqdm
 
+from beast.fitting.lnp_file import read_lnp_file
+
 
 __all__ = ["read_lnp_data", "read_noise_data", "read_sed_data", "get_lnp_grid_vals"]
 
@@ -14,6 +16,9 @@ def read_lnp_data(filename, nstars=None, shift_lnp=True):
     """
     Read in the sparse lnp for all the stars in the hdf5 file
 
+    Both the columnar and legacy (one group per star) layouts are read
+    (see beast.fitting.lnp_file).
+
     Parameters
     ----------
     filename : string
@@ -32,35 +37,35 @@ def read_lnp_data(filename, nstars=None, shift_lnp=True):
        contains arrays of the lnp values and indices to the BEAST model grid
     """
 
-    with h5py.File(filename, "r") as lnp_hdf:
-
-        # get keyword names for the stars (as opposed to filter info)
-        star_key_list = [sname for sname in lnp_hdf.keys() if "star" in sname]
-        tot_stars = len(star_key_list)
-
-        if nstars is not None:
-            if tot_stars != nstars:
-                raise ValueError(
-                    "Error: number of stars not equal between nstars image and lnp file"
-                )
-
-        # initialize arrays
-        # - find the lengths of the sparse likelihoods
-        lnp_sizes = [lnp_hdf[sname]["lnp"][()].shape[0] for sname in star_key_list]
-        # - set arrays to the maximum size
-        lnp_vals = np.full((np.max(lnp_sizes), tot_stars), -np.inf)
-        lnp_indxs = np.full((np.max(lnp_sizes), tot_stars), np.nan)
-
-        # loop over all the stars (groups)
-        for k, sname in enumerate(star_key_list):
-            lnp_vals[: lnp_sizes[k], k] = lnp_hdf[sname]["lnp"][()]
-            lnp_indxs[: lnp_sizes[k], k] = np.array(lnp_hdf[sname]["idx"][()])
-
-        if shift_lnp:
-            # shift the log(likelihood) values to have a max of 0.0
-            #  ok if the same shift is applied to all stars in a pixel
-            #  avoids numerical issues later when we go to intergrate probs
-            lnp_vals -= np.max(lnp_vals)
+    # bulk read of all the stars (in the order of the file)
+    lnp_file = read_lnp_file(filename)
+    offsets = lnp_file["offsets"]
+    tot_stars = len(offsets) - 1
+
+    if nstars is not None:
+        if tot_stars != nstars:
+            raise ValueError(
+                "Error: number of stars not equal between nstars image and lnp file"
+            )
+
+    # initialize arrays
+    # - find the lengths of the sparse likelihoods
+    lnp_sizes = np.diff(offsets)
+    # - set arrays to the maximum size
+    lnp_vals = np.full((np.max(lnp_sizes), tot_stars), -np.inf)
+    lnp_indxs = np.full((np.max(lnp_sizes), tot_stars), np.nan)
+
+    # scatter the concatenated values of all the stars
+    star_pos = np.repeat(np.arange(tot_stars), lnp_sizes)
+    lnp_pos = np.arange(offsets[-1]) - np.repeat(offsets[:-1], lnp_sizes)
+    lnp_vals[lnp_pos, star_pos] = lnp_file["lnp"]
+    lnp_indxs[lnp_pos, star_pos] = lnp_file["idx"]
+
+    if shift_lnp:
+        # shift the log(likelihood) values to have a max of 0.0
+        #  ok if the same shift is applied to all stars in a pixel
+        #  avoids numerical issues later when we go to intergrate probs
+        lnp_vals -= np.max(lnp_vals)
 
     return {"vals": lnp_vals, "indxs": lnp_indxs}
 
@@ -140,8 +145,17 @@ def read_sed_data(
     # open files for reading
     with h5py.File(filename, "r") as sed_hdf:
 
+        # grid table as one dataset per column or as a compound table
+        column_layout = isinstance(sed_hdf["grid"], h5py.Group)
+
         # get the possible list of parameters
-        grid_param_list = list(sed_hdf["grid"][()].dtype.names)
+        if column_layout:
+            grid_param_list = [
+                name.decode() if isinstance(name, bytes) else str(name)
+                for name in sed_hdf["grid"].attrs["COLNAMES"]
+            ]
+        else:
+            grid_param_list = list(sed_hdf["grid"].dtype.names)
         # return that if the user is so inclined
         if return_params:
             return grid_param_list + ["seds", "lamb", "filters"]
@@ -152,12 +166,18 @@ def read_sed_data(
         for param in tqdm(param_list, desc="reading sed data"):
             # grid parameter
             if param in grid_param_list:
-                sed_data[param] = sed_hdf["grid"][param]
+                if column_layout:
+                    sed_data[param] = sed_hdf["grid"][param][()]
+                else:
+                    sed_data[param] = sed_hdf["grid"][param]
             # wavelengths of the filters -or- SED photometry values
             elif (param == "lamb") or (param == "seds"):
                 sed_data[param] = sed_hdf[param][()]
             elif param == "filters":
-                sed_data[param] = sed_hdf["grid"].attrs["filters"].decode().split(" ")
+                filters = sed_hdf["grid"].attrs["filters"]
+                if isinstance(filters, bytes):
+                    filters = filters.decode()
+                sed_data[param] = filters.split(" ")
             else:
                 raise ValueError("parameter {0} not found in SED grid".format(param))
 
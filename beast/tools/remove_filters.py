@@ -10,6 +10,10 @@ import tables
 
 from beast.physicsmodel.grid import FileSEDGrid, SpectralGrid
 import beast.observationmodel.noisemodel.generic_noisemodel as noisemodel
+from beast.observationmodel.noisemodel.compact import (
+    is_compact_noisemodel,
+    remove_compact_filters,
+)
 
 
 def remove_filters_from_files(
@@ -198,19 +202,23 @@ def remove_filters_from_files(
 
     # if obsgrid set, process the observation model
     if obsgrid is not None:
-        obsgrid = noisemodel.get_noisemodelcat(obsgrid)
-        with tables.open_file("{}_noisemodel.grid.hd5".format(outbase), "w") as outfile:
-            outfile.create_array(
-                outfile.root, "bias", np.delete(obsgrid["bias"], rindxs, 1)
-            )
-            outfile.create_array(
-                outfile.root, "error", np.delete(obsgrid["error"], rindxs, 1)
-            )
-            outfile.create_array(
-                outfile.root,
-                "completeness",
-                np.delete(obsgrid["completeness"], rindxs, 1),
-            )
+        outname = "{}_noisemodel.grid.hd5".format(outbase)
+        if is_compact_noisemodel(obsgrid):
+            remove_compact_filters(obsgrid, outname, rindxs)
+        else:
+            obsgrid = noisemodel.get_noisemodelcat(obsgrid)
+            with tables.open_file(outname, "w") as outfile:
+                outfile.create_array(
+                    outfile.root, "bias", np.delete(obsgrid["bias"], rindxs, 1)
+                )
+                outfile.create_array(
+                    outfile.root, "error", np.delete(obsgrid["error"], rindxs, 1)
+                )
+                outfile.create_array(
+                    outfile.root,
+                    "completeness",
+                    np.delete(obsgrid["completeness"], rindxs, 1),
+                )
 
 
 if __name__ == "__main__":  # pragma: no cover
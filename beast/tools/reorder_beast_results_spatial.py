@@ -15,7 +15,6 @@ import os
 import glob
 import math
 
-import h5py
 from tqdm import trange, tqdm
 
 import argparse
@@ -25,6 +24,8 @@ from astropy import wcs
 from astropy.io import fits
 from astropy.table import Table
 
+from beast.fitting.lnp_file import read_lnp_file, write_lnp_file, select_lnp_stars
+
 
 def reorder_beast_results_spatial(
     bricknum=None,
@@ -118,8 +119,11 @@ def reorder_beast_results_spatial(
             cur_pdf1d_vals.append(hdulist[k + 1].data)
         hdulist.close()
 
-        # open the lnp file for reading
-        cur_lnpfile = h5py.File(cur_file.replace("_stats.fits", "_lnp.hd5"), "r")
+        # read the lnp file (all the stars at once)
+        cur_lnp = read_lnp_file(cur_file.replace("_stats.fits", "_lnp.hd5"))
+        # position in the lnp data of each star in the catalog
+        cur_lnp_pos = np.full(np.max(cur_lnp["star_indx"]) + 1, -1)
+        cur_lnp_pos[cur_lnp["star_indx"]] = np.arange(len(cur_lnp["star_indx"]))
 
         # get the source density and subregion tag
         # allows for unique filenames for the spatial regions for output
@@ -182,19 +186,12 @@ def reorder_beast_results_spatial(
             # write the nD sparse likelihood info
             reg_lnp_file = reg_filebase + "_lnp.hd5"
 
-            # open the file (overwrites an existing file)
-            reg_lnpfile = h5py.File(reg_lnp_file, "w")
-
-            for i, k in enumerate(indxs):
-                star_group = reg_lnpfile.create_group("star_%d" % i)
-
-                # transfer the information
-                for cp_name, cp_value in cur_lnpfile["star_%d" % k].items():
-                    star_group.create_dataset(cp_name, data=cp_value.value)
-
-            reg_lnpfile.close()
+            # stars of the region, numbered in order
+            reg_lnp = select_lnp_stars(cur_lnp, cur_lnp_pos[indxs])
+            reg_lnp["star_indx"] = np.arange(len(indxs))
 
-        cur_lnpfile.close()
+            # write the file (overwrites an existing file)
+            write_lnp_file(reg_lnp_file, reg_lnp)
 
         # Now, write out the WCS info and number of stars per pixel to file
         #   do every subregion file to have an on-the-fly check
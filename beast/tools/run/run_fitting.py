@@ -7,7 +7,9 @@ import pickle
 
 # BEAST imports
 from beast.fitting import fit
+from beast.fitting.modelchunks import ModelChunks
 from beast.physicsmodel.grid import FileSEDGrid
+from beast.physicsmodel.helpers.gridbackends import is_grid_indxs
 import beast.observationmodel.noisemodel.generic_noisemodel as noisemodel
 from beast.tools import verify_params
 from beast.tools.run.helper_functions import parallel_wrapper
@@ -27,6 +29,8 @@ def run_fitting(
     choose_subgrid=None,
     pdf2d_param_list=['Av', 'Rv', 'f_A', 'M_ini', 'logA', 'Z', 'distance'],
     resume=False,
+    merge_subgrids=False,
+    block_memory=1e9,
 ):
     """
     Run the fitting.  If nsubs > 1, this will find existing subgrids.
@@ -64,8 +68,22 @@ def run_fitting(
     resume : boolean (default=False)
         choose whether to resume existing run or start over
 
+    merge_subgrids : boolean (default=False)
+        If True and nsubs > 1, fit all the subgrids of each SD+sub in one
+        job: each block of stars is fit to the subgrids in turn, merging
+        the posteriors in memory, and the merged stats, 1D/2D PDFs and lnp
+        files are written directly (no subgrid merging in merge_files).
+        Cannot be used with choose_subgrid.
+
+    block_memory : float (default=1e9)
+        With merge_subgrids, memory budget (in bytes) setting the number of
+        stars fit at once to each subgrid
+
     """
 
+    if merge_subgrids and (choose_subgrid is not None):
+        raise ValueError("choose_subgrid cannot be used with merge_subgrids")
+
     # before doing ANYTHING, force datamodel to re-import (otherwise, any
     # changes within this python session will not be loaded!)
     importlib.reload(datamodel)
@@ -189,9 +207,52 @@ def run_fitting(
             for i in range(n_files)
         ]
 
-    # run the fitting (via parallel wrapper)
+    # fit all the subgrids of each SD+sub at once
+    #   the subgrid files of an SD+sub are consecutive in the file lists
+    if (nsubs > 1) and merge_subgrids:
+
+        group_list = []
+        for i in range(n_files):
+            if use_sd or (choose_sd_sub is not None):
+                group = sd_sub_info[i]
+            else:
+                group = None
+            if (len(group_list) == 0) or (group != group_list[-1][0]):
+                group_list.append((group, []))
+            group_list[-1][1].append(i)
+
+        input_list = []
+        for group, ind in group_list:
+            # same names as the files merged by merge_files
+            if group is None:
+                out_filebase = "{0}/{0}".format(datamodel.project)
+            else:
+                out_filebase = "{0}/bin{1}_sub{2}/{0}_bin{1}_sub{2}".format(
+                    datamodel.project, group[0], group[1]
+                )
+            input_list.append(
+                (
+                    photometry_files[ind[0]],
+                    [modelsedgrid_trim_files[j] for j in ind],
+                    [noise_trim_files[j] for j in ind],
+                    out_filebase + "_stats.fits",
+                    out_filebase + "_pdf1d.fits",
+                    None if pdf2d_param_list is None else out_filebase + "_pdf2d.fits",
+                    pdf2d_param_list,
+                    out_filebase + "_lnp.fits",
+                    gridpickle_files[ind[0]],
+                    resume,
+                    block_memory,
+                )
+            )
+
+        parallel_wrapper(fit_subgrids, input_list, nprocs=nprocs)
+
+    else:
+
+        # run the fitting (via parallel wrapper)
 
-    parallel_wrapper(fit_submodel, input_list, nprocs=nprocs)
+        parallel_wrapper(fit_submodel, input_list, nprocs=nprocs)
 
     # see how long it took!
     new_time = time.clock()
@@ -267,8 +328,16 @@ def fit_submodel(
         subgrid_run = False
 
     # load the SED grid and noise model
-    modelsedgrid = FileSEDGrid(modelsedgrid_file)
-    noisemodel_vals = noisemodel.get_noisemodelcat(noise_file)
+    if is_grid_indxs(modelsedgrid_file):
+        # trimmed grid written as the indexes of the models in the full grid
+        #   (trim_grid.trim_models_many)
+        modelsedgrid = FileSEDGrid(modelsedgrid_file, backend="indexed")
+        noisemodel_vals = noisemodel.get_noisemodelcat(
+            modelsedgrid.noise_fname or noise_file, indxs=modelsedgrid.indxs
+        )
+    else:
+        modelsedgrid = FileSEDGrid(modelsedgrid_file)
+        noisemodel_vals = noisemodel.get_noisemodelcat(noise_file)
 
     if subgrid_run:
         fit.summary_table_memory(
@@ -310,6 +379,99 @@ def fit_submodel(
         print("Done fitting on grid " + modelsedgrid_file)
 
 
+def fit_subgrids(
+    photometry_file,
+    modelsedgrid_files,
+    noise_files,
+    stats_file,
+    pdf_file,
+    pdf2d_file,
+    pdf2d_param_list,
+    lnp_file,
+    grid_info_file,
+    resume=False,
+    block_memory=1e9,
+):
+    """
+    Code to run the SED fitting on all the subgrids at once
+
+    For each block of stars, the subgrids are read and fit in turn, and the
+    sparse posteriors are merged in memory, giving the same results as a
+    fit to the full grid.  The model indexes in the stats file are indexes
+    in the concatenated subgrids, while the lnp file gives the index of the
+    model in its subgrid and the subgrid number (subgrid column, position
+    in modelsedgrid_files), as for the lnp files merged by
+    subgridding_tools.merge_lnp.
+
+    Parameters
+    ----------
+    photometry_file : string
+        path+name of the photometry file
+
+    modelsedgrid_files : list of strings
+        path+name of the physics model subgrid files
+
+    noise_files : list of strings
+        path+name of the noise model file of each subgrid
+
+    stats_file : string
+        path+name of the file to contain stats output
+
+    pdf_file : string
+        path+name of the file to contain 1D PDF output
+
+    pdf2d_file : string
+        path+name of the file to contain 2D PDF output (or None)
+
+    pdf2d_param_list: list of strings or None
+        parameters for which to make 2D PDFs (or None)
+
+    lnp_file : string
+        path+name of the file to contain log likelihood output
+
+    grid_info_file : string
+        path+name for pickle file that contains dictionary with the
+        min/max/n_unique over all the subgrids
+
+    resume : boolean (default=False)
+        choose whether to resume existing run or start over
+
+    block_memory : float (default=1e9)
+        memory budget (in bytes) setting the number of stars fit at once
+        to each subgrid
+
+    """
+
+    # read in the photometry catalog
+    obsdata = datamodel.get_obscat(photometry_file, datamodel.filters)
+
+    print("loading grid_info_dict from " + grid_info_file)
+    with open(grid_info_file, "rb") as p:
+        grid_info_dict = pickle.loads(p.read())
+
+    # the subgrids and their noise models are read one at a time
+    model_chunks = ModelChunks(modelsedgrid_files, noise_files)
+
+    fit.summary_table_memory(
+        obsdata,
+        None,
+        model_chunks,
+        resume=resume,
+        threshold=-10.0,
+        save_every_npts=100,
+        lnp_npts=500,
+        stats_outname=stats_file,
+        pdf1d_outname=pdf_file,
+        pdf2d_outname=pdf2d_file,
+        pdf2d_param_list=pdf2d_param_list,
+        grid_info_dict=grid_info_dict,
+        lnp_outname=lnp_file,
+        surveyname=datamodel.surveyname,
+        block_memory=block_memory,
+    )
+    print("Done fitting on {0:d} subgrids".format(len(modelsedgrid_files)))
+
+
 if __name__ == "__main__":  # pragma: no cover
     # commandline parser
     parser = argparse.ArgumentParser()
@@ -351,6 +513,17 @@ if __name__ == "__main__":  # pragma: no cover
     parser.add_argument(
         "-r", "--resume", help="resume a fitting run", action="store_true"
     )
+    parser.add_argument(
+        "--merge_subgrids",
+        help="fit all the subgrids at once, merging the results in memory",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--block_memory",
+        type=float,
+        default=1e9,
+        help="memory (bytes) for the stars fit at once with --merge_subgrids",
+    )
 
     args = parser.parse_args()
 
@@ -365,4 +538,6 @@ if __name__ == "__main__":  # pragma: no cover
         choose_subgrid=args.choose_subgrid,
         pdf2d_param_list=args.pdf2d_param_list,
         resume=args.resume,
+        merge_subgrids=args.merge_subgrids,
+        block_memory=args.block_memory,
     )
@@ -13,7 +13,13 @@ import numpy as np
 
 
 def setup_batch_beast_trim(
-    project, datafile, num_subtrim=5, nice=None, seds_fname=None, prefix=None
+    project,
+    datafile,
+    num_subtrim=5,
+    nice=None,
+    seds_fname=None,
+    prefix=None,
+    indexes=False,
 ):
     """
     Sets up batch files for submission to the 'at' queue on
@@ -43,6 +49,11 @@ def setup_batch_beast_trim(
         Set this to a string (such as 'source activate astroconda') to prepend
         to each batch file (use '\n's to make multiple lines)
 
+    indexes : boolean (default=False)
+        set to trim the grid for all the catalogs of a batch job in one
+        pass, writing the indexes of the trimmed models instead of copies
+        of the grid and noise model
+
     """
 
     if seds_fname is None:
@@ -80,6 +91,7 @@ def setup_batch_beast_trim(
         num_subtrim=num_subtrim,
         nice=nice,
         prefix=prefix,
+        indexes=indexes,
     )
 
 
@@ -93,6 +105,7 @@ def generic_batch_trim(
     num_subtrim=5,
     nice=None,
     prefix=None,
+    indexes=False,
 ):
     """
     Sets up batch files for submission to the 'at' queue on
@@ -135,6 +148,11 @@ def generic_batch_trim(
         Set this to a string (such as 'source activate astroconda') to prepend
         to each batch file (use '\n's to make multiple lines)
 
+    indexes : boolean (default=False)
+        set to trim the grid for all the catalogs of a batch job in one
+        pass, writing the indexes of the trimmed models instead of copies
+        of the grid and noise model
+
     """
 
     # check that everything is the same length that needs to be
@@ -190,6 +208,7 @@ def generic_batch_trim(
             nice_str
             + "python -m beast.tools.trim_many_via_obsdata "
             + trimfile
+            + (" --indexes" if indexes else "")
             + " > "
             + log_path
             + file_prefix
@@ -242,6 +261,11 @@ if __name__ == "__main__":  # pragma: no cover
         type=str,
         help="Set this to a string to prepend to each batch file",
     )
+    parser.add_argument(
+        "--indexes",
+        help="write the indexes of the trimmed models instead of grid copies",
+        action="store_true",
+    )
 
     args = parser.parse_args()
 
@@ -252,4 +276,5 @@ if __name__ == "__main__":  # pragma: no cover
         nice=args.nice,
         seds_fname=args.seds_fname,
         prefix=args.prefix,
+        indexes=args.indexes,
     )
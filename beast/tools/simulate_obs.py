@@ -69,7 +69,9 @@ def simulate_obs(
         modelsedgrid = FileSEDGrid(str(physgrid))
 
         # read in the noise model - includes bias, unc, and completeness
-        noisegrid = noisemodel.get_noisemodelcat(str(noise_model))
+        noisegrid = noisemodel.noisemodel_arrays(
+            noisemodel.get_noisemodelcat(str(noise_model)), modelsedgrid.seds
+        )
 
         # generate the table
         simtable = gen_SimObs_from_sedgrid(
@@ -2,19 +2,20 @@ import math
 import os
 import re
 from multiprocessing import Pool
-from collections import defaultdict
-import tables
 
 import numpy as np
 from astropy.io import fits
 from astropy.table import Table
 
-from beast.observationmodel.noisemodel.generic_noisemodel import get_noisemodelcat
+from beast.observationmodel.noisemodel.generic_noisemodel import (
+    get_noisemodelcat,
+    noisemodel_arrays,
+)
 from beast.physicsmodel import grid
 from beast.external import eztables
 from beast.fitting.fit import save_pdf1d
 from beast.fitting.fit_metrics import percentile
-from beast.tools import read_beast_data
+from beast.fitting.lnp_file import read_lnp_file, write_lnp_file, select_lnp_stars
 
 
 def uniform_slices(num_points, num_slices):
@@ -117,10 +118,14 @@ def merge_grids(seds_fname, sub_names):
         print("{} already exists".format(seds_fname))
 
 
-def subgrid_info(grid_fname, noise_fname=None):
+def subgrid_info(grid_fname, noise_fname=None, cap_unique=1000):
     """
     Generates a list of mins and maxes of all the quantities in the given grid
 
+    The statistics stored with the grid file are used when available (see
+    beast.physicsmodel.helpers.gridstats), the grid is read only for the
+    quantities without them.
+
     Parameters
     ----------
     grid_fname: string
@@ -132,6 +137,10 @@ def subgrid_info(grid_fname, noise_fname=None):
         fluxes are added too, under the name 'log'+filter+'_wd_bias'
         (needs to conform to the name used in fit.py).
 
+    cap_unique: int
+        stored statistics are only used if they keep at least this number
+        of unique values
+
     Returns
     -------
     info_dict: dictionary
@@ -141,48 +150,78 @@ def subgrid_info(grid_fname, noise_fname=None):
     # Use the HDFStore (pytables) backend
     sedgrid = grid.FileSEDGrid(grid_fname, backend="hdf")
     seds = sedgrid.seds
+    n_models = len(seds)
+
+    stored_stats = sedgrid.grid_stats
+    if noise_fname is not None:
+        noise_basename = os.path.basename(noise_fname)
+    else:
+        noise_basename = None
+
+    def _stored(q):
+        """ stored statistics of q if they can be used """
+        qstats = stored_stats.get(q, None)
+        if (
+            (qstats is None)
+            or (qstats["nrows"] != n_models)
+            or (qstats["capped"] and qstats["cap_unique"] < cap_unique)
+        ):
+            return None
+        if ("_bias" in q) and (qstats.get("noise_fname", None) != noise_basename):
+            return None
+        return {"min": qstats["min"], "max": qstats["max"], "unique": qstats["unique"]}
 
     info_dict = {}
 
     qnames = sedgrid.keys()
     for q in qnames:
-        qvals = sedgrid[q]
-        qmin = np.amin(qvals)
-        qmax = np.amax(qvals)
-        qunique = np.unique(qvals)
-        info_dict[q] = {}
-        info_dict[q]["min"] = qmin
-        info_dict[q]["max"] = qmax
-        info_dict[q]["unique"] = qunique
-
-    if noise_fname is not None:
-        noisemodel = get_noisemodelcat(noise_fname)
-
-        # The following is also in fit.py, so we're kind of doing double
-        # work here, but it's necessary if we want to know the proper
-        # ranges for these values.
-        full_model_flux = seds[:] + noisemodel["bias"]
-        logtempseds = np.array(full_model_flux)
-        full_model_flux = (
-            np.sign(logtempseds)
-            * np.log1p(np.abs(logtempseds * math.log(10)))
-            / math.log(10)
-        )
-
-        filters = sedgrid.filters
-        for i, f in enumerate(filters):
-            f_fluxes = full_model_flux[:, i]
-            # Be sure to cut out the -100's in the calculation of the minimum
-            qmin = np.amin(f_fluxes[f_fluxes > -99.99])
-            qmax = np.amax(f_fluxes)
+        info_dict[q] = _stored(q)
+        if info_dict[q] is None:
+            qvals = sedgrid[q]
+            qmin = np.amin(qvals)
+            qmax = np.amax(qvals)
             qunique = np.unique(qvals)
-
-            q = "symlog" + f + "_wd_bias"
             info_dict[q] = {}
             info_dict[q]["min"] = qmin
             info_dict[q]["max"] = qmax
             info_dict[q]["unique"] = qunique
 
+    if noise_fname is not None:
+        filters = sedgrid.filters
+        flux_qnames = ["symlog" + f + "_wd_bias" for f in filters]
+        for q in flux_qnames:
+            info_dict[q] = _stored(q)
+
+        if any(info_dict[q] is None for q in flux_qnames):
+            # a compact noise model is evaluated on the model fluxes
+            noisemodel = noisemodel_arrays(get_noisemodelcat(noise_fname), seds)
+
+            # The following is also in fit.py, so we're kind of doing double
+            # work here, but it's necessary if we want to know the proper
+            # ranges for these values.
+            full_model_flux = seds[:] + noisemodel["bias"]
+            logtempseds = np.array(full_model_flux)
+            full_model_flux = (
+                np.sign(logtempseds)
+                * np.log1p(np.abs(logtempseds * math.log(10)))
+                / math.log(10)
+            )
+
+            for i, q in enumerate(flux_qnames):
+                if info_dict[q] is not None:
+                    continue
+                f_fluxes = full_model_flux[:, i]
+                # Be sure to cut out the -100's in the calculation of the minimum
+                qmin = np.amin(f_fluxes[f_fluxes > -99.99])
+                qmax = np.amax(f_fluxes)
+                qunique = np.unique(f_fluxes)
+
+                info_dict[q] = {}
+                info_dict[q]["min"] = qmin
+                info_dict[q]["max"] = qmax
+                info_dict[q]["unique"] = qunique
+
+    sedgrid.store.close_source(force=True)
     print("Gathered grid info for {}".format(grid_fname))
     return info_dict
 
@@ -197,7 +236,8 @@ def unpack_and_subgrid_info(x):
 def reduce_grid_info(grid_fnames, noise_fnames=None, nprocs=1, cap_unique=1000):
     """
     Computes the total minimum and maximum of the necessary quantities
-    across all the subgrids. Can run in parallel.
+    across all the subgrids. Can run in parallel. Uses the statistics
+    stored with the subgrid files when available (see subgrid_info).
 
     Parameters
     ----------
@@ -227,9 +267,9 @@ def reduce_grid_info(grid_fnames, noise_fnames=None, nprocs=1, cap_unique=1000):
     """
     # Gather the mins and maxes for the subgrid
     if noise_fnames is None:
-        arguments = [(g, None) for g in grid_fnames]
+        arguments = [(g, None, cap_unique) for g in grid_fnames]
     else:
-        arguments = list(zip(grid_fnames, noise_fnames))
+        arguments = [(g, n, cap_unique) for g, n in zip(grid_fnames, noise_fnames)]
 
     # Use generators here for memory efficiency
     parallel = nprocs > 1
@@ -529,6 +569,8 @@ def merge_lnp(
     that they are for each part of a subgrid, such that a given star_# in each
     file corresponds to the same star_# in the other file(s).  Note that this
     should NOT be used to combine files across source density or background bin.
+    The merged file has the columnar layout (see beast.fitting.lnp_file) with
+    an extra subgrid column giving the subgrid of each lnp value.
 
     Parameters
     ----------
@@ -563,75 +605,70 @@ def merge_lnp(
         print(str(len(subgrid_lnp_fnames)) + " files already merged, skipping")
         return merged_lnp_fname
 
-
-    # dictionaries to compile all the info
-    merged_lnp = defaultdict(list)
-    merged_subgrid = defaultdict(list)
-    merged_idx = defaultdict(list)
-
+    # read all the stars of each subgrid file (in the order of the catalog)
+    subgrid_lnp_data = []
     for fname in subgrid_lnp_fnames:
 
         # extract subgrid number from filename
         subgrid_num = [i for i in fname.split('_') if 'gridsub' in i][0][7:]
 
         # read in the SED indices and lnP values
-        lnp_data = read_beast_data.read_lnp_data(fname, shift_lnp=False)
-        n_lnp, n_star = lnp_data['vals'].shape
-
-        # save each star's values into the master dictionary
-        for i in range(n_star):
-            merged_lnp['star_'+str(i)] += lnp_data['vals'][:,i].tolist()
-            merged_idx['star_'+str(i)] += lnp_data['indxs'][:,i].tolist()
-            merged_subgrid['star_'+str(i)] += np.full(n_lnp, int(subgrid_num)).tolist()
-
+        lnp_data = read_lnp_file(fname)
+        lnp_data = select_lnp_stars(
+            lnp_data, np.argsort(lnp_data["star_indx"], kind="stable")
+        )
+        lnp_data["subgrid"] = np.full(len(lnp_data["lnp"]), int(subgrid_num))
+        subgrid_lnp_data.append(lnp_data)
+
+    star_indx = subgrid_lnp_data[0]["star_indx"]
+    n_star = len(star_indx)
+    for lnp_data in subgrid_lnp_data[1:]:
+        if not np.array_equal(lnp_data["star_indx"], star_indx):
+            raise ValueError("subgrid lnp files do not have the same stars")
+
+    # per model columns to merge (chi2 only if in all the files)
+    cnames = [
+        cname
+        for cname in subgrid_lnp_data[0].keys()
+        if cname not in ["star_indx", "offsets", "input"]
+        and all(cname in lnp_data for lnp_data in subgrid_lnp_data)
+    ]
+
+    # group the values of each star over all the subgrids
+    #   (stable sort, so in the order of the subgrid files)
+    star_pos = np.concatenate(
+        [
+            np.repeat(np.arange(n_star), np.diff(lnp_data["offsets"]))
+            for lnp_data in subgrid_lnp_data
+        ]
+    )
+    sindxs = np.argsort(star_pos, kind="stable")
+    star_pos = star_pos[sindxs]
+    merged_lnp = {
+        cname: np.concatenate([lnp_data[cname] for lnp_data in subgrid_lnp_data])[
+            sindxs
+        ]
+        for cname in cnames
+    }
 
     # go through each star and remove values that are too small
     if threshold is not None:
-
-        # keep track of how long the list of good values is
-        good_list_len = np.zeros(n_star)
-
-        # go through each star
-        for i in range(n_star):
-
-            star_label = "star_"+str(i)
-            # good indices
-            keep_ind = np.where(
-                np.array(merged_lnp[star_label]) >
-                (max(merged_lnp[star_label]) - threshold)
-            )[0]
-            good_list_len[i] = len(keep_ind)
-            # save just those
-            merged_lnp[star_label] = np.array(merged_lnp[star_label])[keep_ind].tolist()
-            merged_idx[star_label] = np.array(merged_idx[star_label])[keep_ind].tolist()
-            merged_subgrid[star_label] = np.array(merged_subgrid[star_label])[keep_ind].tolist()
-
-        # figure out how many padded -inf/nan values need to be appended to make
-        # each list the same length
-        n_list_pad = np.max(good_list_len) - good_list_len
-
-    else:
-        # no list padding if there's no trimming for threshold
-        n_list_pad = np.zeros(n_star)
-
+        sizes = np.bincount(star_pos, minlength=n_star)
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        max_lnp = np.full(n_star, -np.inf)
+        (gstars,) = np.where(sizes > 0)
+        max_lnp[gstars] = np.maximum.reduceat(merged_lnp["lnp"], starts[gstars])
+        (keep_ind,) = np.where(merged_lnp["lnp"] > (max_lnp[star_pos] - threshold))
+        star_pos = star_pos[keep_ind]
+        for cname in cnames:
+            merged_lnp[cname] = merged_lnp[cname][keep_ind]
+
+    merged_lnp["star_indx"] = star_indx
+    merged_lnp["offsets"] = np.concatenate(
+        [[0], np.cumsum(np.bincount(star_pos, minlength=n_star))]
+    )
 
     # write out the things in a new file
-    with tables.open_file(merged_lnp_fname, "w") as out_table:
-        for i in range(n_star):
-            star_label = "star_"+str(i)
-            star_group = out_table.create_group(star_label)
-            star_group.create_dataset(
-                'idx',
-                data=np.array(merged_idx[star_label] + n_list_pad*[np.nan])
-            )
-            star_group.create_dataset(
-                'lnp',
-                data=np.array(merged_lnp[star_label] + n_list_pad*[-np.inf])
-            )
-            star_group.create_dataset(
-                'subgrid',
-                data=np.array(merged_subgrid[star_label] + n_list_pad*[np.nan])
-            )
-
+    write_lnp_file(merged_lnp_fname, merged_lnp)
 
     return merged_lnp_fname
@@ -3,6 +3,11 @@
 Code to create many trimmed model grids for batch runs
   Saves time by only reading the potentially huge modelsed grid once
   and only reads in the noisemodel if it has changed
+
+  With --indexes, the models kept for all the catalogs are found in one
+  pass over the grid and only their indexes are written (read as a trimmed
+  grid with the 'indexed' grid backend), instead of copies of the grid
+  and noise model
 """
 
 # system imports
@@ -10,8 +15,14 @@ import os
 import argparse
 import time
 
+import h5py
+
 # BEAST imports
 import beast.observationmodel.noisemodel.generic_noisemodel as noisemodel
+from beast.observationmodel.noisemodel.compact import (
+    CompactNoiseModel,
+    is_compact_noisemodel,
+)
 from beast.fitting import trim_grid
 from beast.physicsmodel.grid import FileSEDGrid
 
@@ -26,6 +37,11 @@ if __name__ == "__main__":
     parser.add_argument(
         "trimfile", help="file with modelgrid, obsfiles, filebase to use"
     )
+    parser.add_argument(
+        "--indexes",
+        help="write the indexes of the trimmed models instead of grid copies",
+        action="store_true",
+    )
     args = parser.parse_args()
 
     start_time = time.clock()
@@ -37,58 +53,107 @@ if __name__ == "__main__":
     # physics model grid name
     modelfile = file_lines[0].rstrip()
 
-    # get the modesedgrid on which to generate the noisemodel
-    print("Reading the model grid files = ", modelfile)
-    modelsedgrid = FileSEDGrid(modelfile)
-
-    new_time = time.clock()
-    print("time to read: ", (new_time - start_time) / 60.0, " min")
-
-    old_noisefile = ""
-    for k in range(1, len(file_lines)):
-
-        print("\n\n")
-
-        # file names
-        noisefile, obsfile, filebase = file_lines[k].split()
-
-        # make sure the proper directories exist
-        if not os.path.isdir(os.path.dirname(filebase)):
-            os.makedirs(os.path.dirname(filebase))
-
-        # construct trimmed file names
-        sed_trimname = filebase + "_seds_trim.grid.hd5"
-        noisemodel_trimname = filebase + "_noisemodel_trim.grid.hd5"
-
-        print("working on " + sed_trimname)
-
-        start_time = time.clock()
-
-        if noisefile == old_noisefile:
-            print("not reading noisefile - same as last")
-            # print(noisefile)
-        else:
-            print("reading noisefile")
-            # read in the noise model
-            noisemodel_vals = noisemodel.get_noisemodelcat(noisefile)
-            old_noisefile = noisefile
-
-        # read in the observed data
-        print("getting the observed data")
-        obsdata = datamodel.get_obscat(obsfile, modelsedgrid.filters)
-
-        # trim the model sedgrid
-        #   set n_detected = 0 to disable the trimming of models based on
-        #      the ASTs (e.g. extrapolations are ok)
-        #   this is needed as the ASTs in the NIR bands do not go faint enough
-        trim_grid.trim_models(
-            modelsedgrid,
-            noisemodel_vals,
-            obsdata,
-            sed_trimname,
-            noisemodel_trimname,
-            sigma_fac=3.0,
-        )
+    if args.indexes:
+        # the model grid is read one chunk at a time
+        modelsedgrid = FileSEDGrid(modelfile, backend="hdf")
+
+        noisemodels = {}
+        sedgrid_noisemodels = []
+        noisefiles = []
+        obsdatas = []
+        sed_trimnames = []
+        for k in range(1, len(file_lines)):
+            # file names
+            noisefile, obsfile, filebase = file_lines[k].split()
+
+            # make sure the proper directories exist
+            if not os.path.isdir(os.path.dirname(filebase)):
+                os.makedirs(os.path.dirname(filebase))
+
+            # open each noise model once, the arrays of a noise model are
+            #   read one chunk of models at a time while trimming
+            if noisefile not in noisemodels:
+                print("opening noisefile " + noisefile)
+                if is_compact_noisemodel(noisefile):
+                    noisemodels[noisefile] = CompactNoiseModel(noisefile)
+                else:
+                    noisemodels[noisefile] = h5py.File(noisefile, "r")
+            sedgrid_noisemodels.append(noisemodels[noisefile])
+            noisefiles.append(noisefile)
+
+            # read in the observed data
+            obsdatas.append(datamodel.get_obscat(obsfile, modelsedgrid.filters))
+            sed_trimnames.append(filebase + "_seds_trim.grid.hd5")
+
+        try:
+            trim_grid.trim_models_many(
+                modelsedgrid,
+                sedgrid_noisemodels,
+                obsdatas,
+                sed_trimnames,
+                noise_fnames=noisefiles,
+                sigma_fac=3.0,
+            )
+        finally:
+            for cnoise in noisemodels.values():
+                if isinstance(cnoise, h5py.File):
+                    cnoise.close()
 
         new_time = time.clock()
         print("time to trim: ", (new_time - start_time) / 60.0, " min")
+    else:
+        # get the modesedgrid on which to generate the noisemodel
+        print("Reading the model grid files = ", modelfile)
+        modelsedgrid = FileSEDGrid(modelfile)
+
+        new_time = time.clock()
+        print("time to read: ", (new_time - start_time) / 60.0, " min")
+
+        old_noisefile = ""
+        for k in range(1, len(file_lines)):
+
+            print("\n\n")
+
+            # file names
+            noisefile, obsfile, filebase = file_lines[k].split()
+
+            # make sure the proper directories exist
+            if not os.path.isdir(os.path.dirname(filebase)):
+                os.makedirs(os.path.dirname(filebase))
+
+            # construct trimmed file names
+            sed_trimname = filebase + "_seds_trim.grid.hd5"
+            noisemodel_trimname = filebase + "_noisemodel_trim.grid.hd5"
+
+            print("working on " + sed_trimname)
+
+            start_time = time.clock()
+
+            if noisefile == old_noisefile:
+                print("not reading noisefile - same as last")
+                # print(noisefile)
+            else:
+                print("reading noisefile")
+                # read in the noise model
+                noisemodel_vals = noisemodel.get_noisemodelcat(noisefile)
+                old_noisefile = noisefile
+
+            # read in the observed data
+            print("getting the observed data")
+            obsdata = datamodel.get_obscat(obsfile, modelsedgrid.filters)
+
+            # trim the model sedgrid
+            #   set n_detected = 0 to disable the trimming of models based on
+            #      the ASTs (e.g. extrapolations are ok)
+            #   this is needed as the ASTs in the NIR bands do not go faint enough
+            trim_grid.trim_models(
+                modelsedgrid,
+                noisemodel_vals,
+                obsdata,
+                sed_trimname,
+                noisemodel_trimname,
+                sigma_fac=3.0,
+            )
+
+            new_time = time.clock()
+            print("time to trim: ", (new_time - start_time) / 60.0, " min")